@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+
+Benchmarks of recording and collecting exceptions:
+
+    python benchmarks/run.py --output results.json
+
+Test database is created from benchmarks.settings, application servers
+are replaced with local WSGI servers of benchmark project sharing it. Results are printed
+or written to --output as JSON.
+"""
+
+# Standard imports
+from datetime import datetime
+from json import dumps
+from optparse import OptionParser
+from os import environ, devnull
+from os.path import abspath, dirname
+from platform import python_version
+from subprocess import check_output, CalledProcessError
+from threading import Thread, Lock
+from time import time
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+# Third-party app imports
+from pytz import utc
+
+# Django imports
+from django import get_version
+from django.conf import settings
+from django.db import connection
+from django.db.backends import BaseDatabaseWrapper
+from django.test.client import RequestFactory
+
+# Project imports
+from error_monitor import functions
+from error_monitor.models import ProjectException, CollectedProjectException, \
+    CollectedExceptionSource, CollectedServer, ExceptionBody, \
+    OccurrenceBucket, get_signature
+from error_monitor.views import CustomExceptionReporter
+from benchmarks.stubs import StubNode, seed_exceptions
+
+
+class QueryCounter(object):
+    """
+    Count queries executed through every database connection.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = Lock()
+
+    def add(self):
+        """
+        Count one query.
+        """
+        with self._lock:
+            self.count += 1
+
+    def install(self):
+        """
+        Wrap cursors of all connections.
+        """
+        counter = self
+        get_cursor = BaseDatabaseWrapper.cursor
+
+        def cursor(database_wrapper):
+            """
+            Return counting cursor.
+            """
+            return CountingCursor(get_cursor(database_wrapper), counter)
+
+        BaseDatabaseWrapper.cursor = cursor
+
+
+class CountingCursor(object):
+    """
+    Cursor wrapper counting executed queries.
+    """
+
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def execute(self, *args, **kwargs):
+        """
+        Count and execute query.
+        """
+        self.counter.add()
+        return self.cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        """
+        Count and execute query.
+        """
+        self.counter.add()
+        return self.cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+QUERY_COUNTER = QueryCounter()
+
+
+def summarize(durations):
+    """
+    Return statistics of durations in milliseconds.
+    """
+    durations = sorted(durations)
+    if not durations:
+        return {}
+
+    def percentile(share):
+        return durations[min(len(durations) - 1, int(len(durations) * share))]
+
+    return {
+        'count': len(durations),
+        'mean_ms': sum(durations) / len(durations) * 1000,
+        'p50_ms': percentile(0.5) * 1000,
+        'p95_ms': percentile(0.95) * 1000,
+        'p99_ms': percentile(0.99) * 1000,
+        'max_ms': durations[-1] * 1000,
+    }
+
+
+def raise_error(title):
+    """
+    Raise error a few frames deep with some locals in them.
+    """
+    def load_items(page):
+        items = [{'id': number, 'name': 'item %d' % number}
+                 for number in range(100)]
+        return process_items(items, page)
+
+    def process_items(items, page):
+        selected = items[page * 10:page * 10 + 10]
+        raise ValueError(title + ' (%d items)' % len(selected))
+
+    load_items(1)
+
+
+def capture(title):
+    """
+    Return exc_info() of raised error.
+    """
+    try:
+        raise_error(title)
+    except ValueError:
+        return sys.exc_info()
+
+
+def clear_tables():
+    """
+    Delete everything benchmarks stored.
+    """
+    for model in (
+        CollectedExceptionSource, CollectedProjectException, CollectedServer,
+        ProjectException, OccurrenceBucket, ExceptionBody
+    ):
+        model.objects.all().delete()
+    functions.BODIES_CACHE = functions.LRUCache(functions.BODIES_CACHE_SIZE)
+
+
+def benchmark_occurrences(iterations, new):
+    """
+    Measure phases of recording occurrences and whole recording
+    of new or duplicate exceptions.
+    """
+    clear_tables()
+    request = RequestFactory().get('/benchmark/?page=1')
+    phases = dict(
+        (phase, []) for phase in ('hash', 'render', 'notify', 'db', 'total')
+    )
+
+    def get_title(iteration):
+        return 'Critical benchmark error %d' % (iteration if new else 0)
+
+    for iteration in range(iterations):
+        current_exception = capture(get_title(iteration))
+        title = functions.get_exception_title(current_exception[1])
+
+        started = time()
+        location_hash = functions.get_exception_fingerprint(current_exception)
+        phases['hash'].append(time() - started)
+
+        started = time()
+        reporter = CustomExceptionReporter(  # IGNORE:star-args
+            request, *current_exception
+        )
+        if functions.LAZY_RENDERING:
+            contents = reporter.get_traceback_snapshot()
+        else:
+            contents = reporter.get_traceback_html()
+        phases['render'].append(time() - started)
+
+        key = (location_hash, title, request.path)
+        started = time()
+        functions.notify_about_exception(title, get_signature(*key))
+        phases['notify'].append(time() - started)
+
+        started = time()
+        functions.write_exceptions(
+            {key: (1, contents, datetime.utcnow().replace(tzinfo=utc))}
+        )
+        phases['db'].append(time() - started)
+
+    clear_tables()
+    stderr, sys.stderr = sys.stderr, open(devnull, 'w')
+    try:
+        for iteration in range(iterations):
+            current_exception = capture(get_title(iteration))
+            started = time()
+            functions.save_exception(
+                current_exception,
+                functions.get_exception_title(current_exception[1]),
+                request
+            )
+            phases['total'].append(time() - started)
+    finally:
+        sys.stderr = stderr
+
+    return dict((phase, summarize(phases[phase])) for phase in phases)
+
+
+def benchmark_storm(threads_count, occurrences, fingerprints=10):
+    """
+    Measure throughput of threads_count threads recording
+    occurrences of fingerprints exceptions each.
+    """
+    clear_tables()
+    errors = []
+    request = RequestFactory().get('/benchmark/storm/')
+
+    def record(thread_number):
+        try:
+            for iteration in range(occurrences):
+                try:
+                    raise_error(
+                        'Storm error %d' % (
+                            (thread_number + iteration) % fingerprints
+                        )
+                    )
+                except ValueError, error:
+                    functions.record_exception(error, request=request)
+        except Exception, error:  # IGNORE:broad-except
+            errors.append(repr(error))
+        finally:
+            connection.close()
+
+    stderr, sys.stderr = sys.stderr, open(devnull, 'w')
+    try:
+        QUERY_COUNTER.count = 0
+        started = time()
+        threads = [
+            Thread(target=record, args=(number,))
+            for number in range(threads_count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        functions.WRITE_BUFFER.flush()
+        functions.OVERFLOW_BUFFER.flush()
+        seconds = time() - started
+    finally:
+        sys.stderr = stderr
+
+    recorded = sum(
+        ProjectException.objects.values_list('count', flat=True)
+    )
+    return {
+        'threads': threads_count,
+        'occurrences': threads_count * occurrences,
+        'recorded': recorded,
+        'seconds': seconds,
+        'occurrences_per_second': threads_count * occurrences / seconds,
+        'queries': QUERY_COUNTER.count,
+        'errors': errors[:10],
+    }
+
+
+def benchmark_collection(servers_count, rows):
+    """
+    Measure full and incremental collection from servers_count stub
+    servers with rows exceptions each.
+    """
+    clear_tables()
+    seed_exceptions(rows)
+    nodes = [StubNode() for _ in range(servers_count)]
+    for node in nodes:
+        node.start()
+    settings.ERROR_MONITOR_EXCEPTION_SERVERS_LIST = [
+        node.url for node in nodes
+    ]
+
+    results = {'servers': servers_count, 'rows_per_server': rows}
+    stdout, sys.stdout = sys.stdout, open(devnull, 'w')
+    try:
+        for run, full in (('full', True), ('incremental', False)):
+            QUERY_COUNTER.count = 0
+            started = time()
+            failed_servers = functions.collect_exceptions_from_servers(
+                full=full
+            )
+            results[run] = {
+                'seconds': time() - started,
+                'queries': QUERY_COUNTER.count,
+                'failed_servers': len(failed_servers),
+                'errors': sorted(
+                    set(repr(error) for error in failed_servers.values())
+                ),
+            }
+        results['collected'] = CollectedProjectException.objects.count()
+        results['transport'] = functions.TRANSPORT.get_stats()
+    finally:
+        sys.stdout = stdout
+        functions.TRANSPORT.close()
+        functions.TRANSPORT.counters = {}
+        for node in nodes:
+            node.stop()
+
+    return results
+
+
+def get_revision():
+    """
+    Return git revision of benchmarked code if it is known.
+    """
+    try:
+        return check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=dirname(dirname(abspath(__file__)))
+        ).strip()
+    except (OSError, CalledProcessError):
+        return None
+
+
+def main():
+    """
+    Run benchmarks and output results.
+    """
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option(
+        '--iterations', type='int', default=200,
+        help='Occurrences measured per latency benchmark'
+    )
+    parser.add_option(
+        '--threads', default='1,8,32',
+        help='Comma separated numbers of threads of storm benchmarks'
+    )
+    parser.add_option(
+        '--storm-occurrences', type='int', default=100,
+        help='Occurrences recorded by each storm thread'
+    )
+    parser.add_option(
+        '--servers', default='1,10,100',
+        help='Comma separated numbers of servers of collection benchmarks'
+    )
+    parser.add_option(
+        '--rows', type='int', default=100,
+        help='Exceptions on each server of collection benchmarks'
+    )
+    parser.add_option('--output', help='File results are written to')
+    options, _ = parser.parse_args()
+
+    QUERY_COUNTER.install()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        results = {
+            'revision': get_revision(),
+            'python': python_version(),
+            'django': get_version(),
+            'database': connection.vendor,
+            'settings': dict(
+                (name, getattr(functions, name)) for name in (
+                    'ASYNC_RECORDING', 'WRITE_BUFFERING', 'LAZY_RENDERING',
+                    'SAMPLING', 'CACHE_COUNTERS', 'HISTOGRAM', 'FINGERPRINT',
+                    'TRANSPORT_FORMAT', 'TRANSPORT_COMPRESS'
+                )
+            ),
+            'record': {
+                'new': benchmark_occurrences(options.iterations, new=True),
+                'duplicate': benchmark_occurrences(
+                    options.iterations, new=False
+                ),
+            },
+            'storm': [
+                benchmark_storm(int(threads), options.storm_occurrences)
+                for threads in options.threads.split(',')
+            ],
+            'collect': [
+                benchmark_collection(int(servers), options.rows)
+                for servers in options.servers.split(',')
+            ],
+        }
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    output = dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print output
+
+
+if __name__ == '__main__':
+    main()
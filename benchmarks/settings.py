@@ -0,0 +1,60 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+
+Settings of benchmark project. Database is configured with
+BENCHMARK_DATABASE_* environment variables, SQLite by default.
+To benchmark other error_monitor settings point DJANGO_SETTINGS_MODULE
+to module that imports these ones and overrides them.
+"""
+
+# Standard imports
+from os import environ
+from os.path import join
+from tempfile import gettempdir
+
+
+DEBUG = False
+
+DATABASE_ENGINE = environ.get('BENCHMARK_DATABASE_ENGINE', 'sqlite3')
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.' + DATABASE_ENGINE,
+        'NAME': environ.get(
+            'BENCHMARK_DATABASE_NAME',
+            join(gettempdir(), 'error_monitor_benchmark.sqlite3')
+        ),
+        'USER': environ.get('BENCHMARK_DATABASE_USER', ''),
+        'PASSWORD': environ.get('BENCHMARK_DATABASE_PASSWORD', ''),
+        'HOST': environ.get('BENCHMARK_DATABASE_HOST', ''),
+        'PORT': environ.get('BENCHMARK_DATABASE_PORT', ''),
+        'OPTIONS': {'timeout': 60} if DATABASE_ENGINE == 'sqlite3' else {},
+    }
+}
+DATABASES['default']['TEST_NAME'] = DATABASES['default']['NAME'] \
+    if DATABASE_ENGINE == 'sqlite3' else None
+
+INSTALLED_APPS = (
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.admin',
+    'error_monitor',
+)
+
+ROOT_URLCONF = 'benchmarks.urls'
+SECRET_KEY = 'error-monitor-benchmark'
+USE_TZ = True
+TIME_ZONE = 'UTC'
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+EMAIL_HOST_USER = 'error-monitor@example.com'
+SERVER_PROTOCOL = 'http'
+CURRENT_SERVER_DOMAIN = 'localhost'
+
+ERROR_MONITOR_SECRET_KEY = 'benchmark'
+ERROR_MONITOR_EXCEPTION_TITLE_WORDS_TO_NOTIFY = ('Critical',)
+ERROR_MONITOR_EXCEPTION_RECIPIENTS = ('developers@example.com',)
+ERROR_MONITOR_EXCEPTION_SERVERS_LIST = []
+ERROR_MONITOR_COLLECT_RETRIES = 0
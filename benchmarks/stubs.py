@@ -0,0 +1,102 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from SocketServer import ThreadingMixIn
+from datetime import datetime, timedelta
+from hashlib import md5
+from threading import Thread
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+# Django imports
+from django.core.handlers.wsgi import WSGIHandler
+
+# Third-party app imports
+from pytz import utc
+
+# Project imports
+from error_monitor import functions
+from error_monitor.models import ProjectException, get_signature
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """
+    WSGI server handling every connection in its own thread.
+    """
+    daemon_threads = True
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    """
+    WSGI request handler that does not log requests.
+    """
+
+    def log_message(self, *args):  # IGNORE:arguments-differ
+        pass
+
+
+def seed_exceptions(rows, contents_size=2048):
+    """
+    Save rows exceptions with contents of about contents_size bytes
+    that occurred an hour ago for stub nodes to serve.
+    """
+    date = datetime.utcnow().replace(tzinfo=utc) - timedelta(hours=1)
+    exceptions = []
+    for number in range(rows):
+        location_hash = md5('benchmark %d' % number).hexdigest()
+        title = 'Benchmark error %d' % number
+        path = '/benchmark/%d/' % (number % 50)
+        signature = get_signature(location_hash, title, path)
+        exceptions.append(
+            ProjectException(
+                path=path,
+                title=title,
+                count=number % 7 + 1,
+                hash=location_hash,
+                signature=signature,
+                date=date,
+                body_id=functions.store_contents(
+                    '<p>%s</p>' % title * (contents_size // (len(title) + 7) + 1),
+                    signature
+                )
+            )
+        )
+    ProjectException.objects.using(functions.DATABASE).bulk_create(exceptions)
+
+
+class StubNode(object):
+    """
+    Application server stand-in serving error_monitor views
+    of benchmark project with Django WSGI handler. Every node serves
+    exceptions of the same database, see seed_exceptions.
+    """
+
+    def __init__(self):
+        self.server = ThreadingWSGIServer(
+            ('127.0.0.1', 0), QuietWSGIRequestHandler
+        )
+        self.server.set_app(WSGIHandler())
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        """
+        Base URL of node as listed in ERROR_MONITOR_EXCEPTION_SERVERS_LIST.
+        """
+        return 'http://127.0.0.1:%d' % self.server.server_port
+
+    def start(self):
+        """
+        Start serving requests in background thread.
+        """
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop serving requests.
+        """
+        self.server.shutdown()
+        self.server.server_close()
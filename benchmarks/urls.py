@@ -0,0 +1,13 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Django imports
+from django.conf.urls import patterns, include, url
+
+
+urlpatterns = patterns(  # IGNORE:invalid-name
+    '',
+    url(r'^error_monitor/', include('error_monitor.urls')),
+)
@@ -4,15 +4,26 @@ License: BSD
 """
 
 # Project imports
-from .models import ProjectException, CollectedProjectException
+from .models import ProjectException, CollectedProjectException, \
+    ExceptionVariant
+from .views import render_exception_contents
+from .changelist import ScalableModelAdmin, DateBucketFilter, \
+    PathPrefixFilter, ServerFilter, KeysetFilter
+from .histogram import get_hourly_counts, get_hourly_counts_by_signature, \
+    render_sparkline
 
 # Django imports
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.conf import settings
 from django.conf.urls import patterns, url
 from django.core.urlresolvers import reverse
+from django.utils.html import escape
 from django.shortcuts import get_object_or_404, render_to_response, HttpResponseRedirect
 
 
+HISTOGRAM = getattr(settings, 'ERROR_MONITOR_HISTOGRAM', False)
+
+
 def exception_view_link(exception_object):
     """
     Generate HTML with exception on click.
@@ -30,19 +41,98 @@ exception_view_link.short_description = 'View exception'
 exception_view_link.allow_tags = True
 
 
-class ProjectExceptionAdmin(admin.ModelAdmin):
+def occurrence_sparkline(exception_object):
+    """
+    Generate sparkline of exception occurrences within last day.
+    Counts are prefetched for changelist pages.
+    """
+    counts = getattr(exception_object, 'hourly_counts', None)
+    if counts is None:
+        counts = get_hourly_counts(exception_object.signature)
+    return u'<span title="%s">%s</span>' % (
+        ', '.join(str(count) for count in counts), render_sparkline(counts)
+    )
+
+occurrence_sparkline.short_description = 'Last 24 hours'
+occurrence_sparkline.allow_tags = True
+
+
+def exception_variants(exception_object):
+    """
+    Generate number of sampled variants of grouped exception
+    with their titles and paths in tooltip.
+    Variants are prefetched for changelist pages.
+    """
+    variants = getattr(exception_object, 'variants', None)
+    if variants is None:
+        variants = list(
+            ExceptionVariant.objects.filter(
+                signature=exception_object.signature
+            ).values_list('title', 'path')
+        )
+    if not variants:
+        return ''
+    return u'<span title="%s">%d</span>' % (
+        escape(u'\n'.join(u'%s %s' % (path, title) for title, path in variants)),
+        len(variants)
+    )
+
+exception_variants.short_description = 'Variants'
+exception_variants.allow_tags = True
+
+
+class ProjectExceptionAdmin(ScalableModelAdmin):
     """
     Link to exception in admin panel.
     """
-    list_display = ('count', 'title', 'path', 'date', exception_view_link)
+    list_display = (
+        'count',
+        'title',
+        'path',
+        'date',
+        occurrence_sparkline,
+        'trend',
+        exception_variants,
+        exception_view_link
+    )
+    list_filter = (DateBucketFilter, PathPrefixFilter, KeysetFilter)
     search_fields = ('title', 'path')
     ordering = ('-date',)
 
     def queryset(self, request):
         query_set = super(ProjectExceptionAdmin, self).queryset(request)
         return query_set.only(
-            "id", "title", "path", "date", "count"
+            "id", "title", "path", "date", "count", "signature", "trend"
+        )
+
+    def get_list_display(self, request):
+        list_display = super(ProjectExceptionAdmin, self).get_list_display(
+            request
         )
+        if HISTOGRAM:
+            return list_display
+        return [
+            field for field in list_display if field is not occurrence_sparkline
+        ]
+
+    def prefetch_results(self, results):
+        signatures = [
+            exception_object.signature for exception_object in results
+        ]
+        variants = dict((signature, []) for signature in signatures)
+        if signatures:
+            for signature, title, path in ExceptionVariant.objects.filter(
+                signature__in=signatures
+            ).values_list('signature', 'title', 'path'):
+                variants[signature].append((title, path))
+        for exception_object in results:
+            exception_object.variants = variants[exception_object.signature]
+
+        if HISTOGRAM:
+            counts = get_hourly_counts_by_signature(signatures)
+            for exception_object in results:
+                exception_object.hourly_counts = \
+                    counts[exception_object.signature]
 
     @staticmethod
     def exception_content_views(
@@ -51,10 +141,12 @@ class ProjectExceptionAdmin(admin.ModelAdmin):
         """
         Render HTML with exception.
         """
-        exception_object = get_object_or_404(ProjectException, id=object_id)
+        exception_object = get_object_or_404(
+            ProjectException.objects.select_related('body'), id=object_id
+        )
         return render_to_response(
             'view_handled_exception.html',
-            {'contents': exception_object.contents}
+            {'contents': render_exception_contents(exception_object.get_contents())}
         )
 
     def get_urls(self):
@@ -104,7 +196,29 @@ exception_resolve_link.short_description = 'Resolve exception'
 exception_resolve_link.allow_tags = True
 
 
-class CollectedProjectExceptionAdmin(admin.ModelAdmin):
+def report_resolved_servers(request, resolved_servers, failed_servers):
+    """
+    Show number of exceptions deleted on servers
+    and servers exceptions could not be resolved on.
+    """
+    if resolved_servers:
+        messages.info(
+            request,
+            'Deleted %d exceptions on %d servers' % (
+                sum(
+                    sum(deleted_counts.values())
+                    for deleted_counts in resolved_servers.values()
+                ),
+                len(resolved_servers)
+            )
+        )
+    for server, error in sorted(failed_servers.items()):
+        messages.warning(
+            request, 'Failed to resolve exceptions on %s: %s' % (server, error)
+        )
+
+
+class CollectedProjectExceptionAdmin(ScalableModelAdmin):
     """
     Link to exception in admin panel.
     """
@@ -116,13 +230,17 @@ class CollectedProjectExceptionAdmin(admin.ModelAdmin):
         collected_exception_view_link,
         exception_resolve_link
     )
+    list_filter = (
+        DateBucketFilter, PathPrefixFilter, ServerFilter, KeysetFilter
+    )
     search_fields = ('title', 'path')
     ordering = ('-date',)
+    actions = ('resolve_selected',)
 
     def queryset(self, request):
         query_set = super(CollectedProjectExceptionAdmin, self).queryset(request)
         return query_set.only(
-            "id", "title", "path", "server_count", "count"
+            "id", "title", "path", "server_count", "count", "date"
         )
 
     @staticmethod
@@ -132,10 +250,13 @@ class CollectedProjectExceptionAdmin(admin.ModelAdmin):
         """
         Render HTML with exception.
         """
-        exception_object = get_object_or_404(CollectedProjectException, id=object_id)
+        exception_object = get_object_or_404(
+            CollectedProjectException.objects.select_related('body'),
+            id=object_id
+        )
         return render_to_response(
             'view_handled_exception.html',
-            {'contents': exception_object.contents}
+            {'contents': render_exception_contents(exception_object.get_contents())}
         )
 
     @staticmethod
@@ -147,11 +268,26 @@ class CollectedProjectExceptionAdmin(admin.ModelAdmin):
         """
         from .functions import resolve_exceptions_from_servers
         exception_object = get_object_or_404(CollectedProjectException, id=object_id)
-        resolve_exceptions_from_servers(exception_object)
-        exception_object.delete()
+        report_resolved_servers(  # IGNORE:star-args
+            request, *resolve_exceptions_from_servers([exception_object])
+        )
 
         return HttpResponseRedirect(request.META['HTTP_REFERER'])
 
+    def resolve_selected(self, request, query_set):
+        """
+        Delete selected exceptions on all servers with one request per server.
+        """
+        from .functions import resolve_exceptions_from_servers
+        report_resolved_servers(  # IGNORE:star-args
+            request,
+            *resolve_exceptions_from_servers(
+                query_set.only('id', 'hash', 'servers')
+            )
+        )
+
+    resolve_selected.short_description = 'Resolve selected exceptions'
+
     def get_urls(self):
         urls = super(CollectedProjectExceptionAdmin, self).get_urls()
 
@@ -0,0 +1,141 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from Queue import Queue, Full
+from threading import Thread, Lock
+from os import getpid
+from time import time
+from traceback import print_exc
+
+
+_STOP = object()
+
+
+class BackgroundRecorder(object):
+    """
+    Bounded in-process queue drained by background worker threads.
+    Items that do not fit into the queue are dropped and counted.
+    """
+
+    def __init__(self, handler, queue_size=1000, workers=1, enqueue_timeout=0):
+        self.handler = handler
+        self.queue = Queue(maxsize=queue_size)
+        self.workers = workers
+        self.enqueue_timeout = enqueue_timeout
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self._lock = Lock()
+        self._threads = []
+        self._pid = None
+
+    def _ensure_started(self):
+        """
+        Start worker threads on first use and again after fork,
+        because threads do not survive it.
+        """
+        if self._pid == getpid():
+            return
+
+        with self._lock:
+            if self._pid == getpid():
+                return
+
+            self._threads = []
+            for number in range(self.workers):
+                thread = Thread(
+                    target=self._work,
+                    name='error-monitor-recorder-%d' % number
+                )
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            self._pid = getpid()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def submit(self, *item):
+        """
+        Put item into queue. Return False if it was dropped because
+        queue stayed full for enqueue_timeout seconds.
+        """
+        self._ensure_started()
+        try:
+            if self.enqueue_timeout:
+                self.queue.put(item, True, self.enqueue_timeout)
+            else:
+                self.queue.put_nowait(item)
+        except Full:
+            self._count('dropped')
+            return False
+
+        self._count('submitted')
+        return True
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self.handler(*item)  # IGNORE:star-args
+            except Exception:  # IGNORE:broad-except
+                self._count('failed')
+                print_exc()
+            else:
+                self._count('processed')
+            finally:
+                self.queue.task_done()
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued item is handled.
+        Return False if timeout elapsed first.
+        """
+        if self._pid != getpid():
+            return True
+
+        deadline = None if timeout is None else time() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                if deadline is None:
+                    self.queue.all_tasks_done.wait()
+                    continue
+                remaining = deadline - time()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout=None):
+        """
+        Flush queue and stop worker threads.
+        """
+        flushed = self.flush(timeout)
+        if self._pid == getpid():
+            for _ in self._threads:
+                try:
+                    self.queue.put_nowait(_STOP)
+                except Full:
+                    break
+            self._pid = None
+        return flushed
+
+    def stats(self):
+        """
+        Return recorder counters.
+        """
+        with self._lock:
+            return {
+                'queued': self.queue.qsize(),
+                'submitted': self.submitted,
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'failed': self.failed,
+            }
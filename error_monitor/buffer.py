@@ -0,0 +1,153 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from threading import Thread, Lock, Event
+from os import getpid
+from time import time
+from traceback import print_exc
+
+
+class WriteBuffer(object):
+    """
+    Write-behind aggregator of exception occurrences.
+    Occurrences are summed per key in memory and handed to writer
+    by background thread every flush_interval seconds or once flush_size
+    events are added unless flush_size is None, so callers never wait
+    for writes. With limiter flushes take its tokens and are put off
+    for another flush_interval while it has none.
+    """
+
+    def __init__(self, writer, flush_interval=1.0, flush_size=100,
+                 limiter=None):
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.limiter = limiter
+        self.pending = {}
+        self._events = 0
+        self._last_flush = time()
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._wakeup = Event()
+        self._stopped = Event()
+        self._pid = None
+
+    def _ensure_started(self):
+        """
+        Start periodic flushing thread on first use and again after fork.
+        """
+        if self._pid == getpid():
+            return
+
+        with self._lock:
+            if self._pid == getpid():
+                return
+
+            thread = Thread(target=self._work, name='error-monitor-buffer')
+            thread.daemon = True
+            thread.start()
+            self._pid = getpid()
+
+    def add(self, key, contents, date, count=1):
+        """
+        Register occurrence of key. Only the latest contents are kept,
+        contents of None leave previously added ones in place.
+        """
+        self._ensure_started()
+        with self._lock:
+            entry = self.pending.get(key)
+            if entry is None:
+                self.pending[key] = [count, contents, date]
+            else:
+                entry[0] += count
+                if contents is not None:
+                    entry[1] = contents
+                entry[2] = date
+            self._events += count
+            due = (
+                self.flush_size is not None and self._events >= self.flush_size
+                or time() - self._last_flush >= self.flush_interval
+            )
+
+        if due:
+            self._wakeup.set()
+
+    def _merge(self, occurrences):
+        """
+        Put occurrences that failed to be written back into buffer.
+        """
+        with self._lock:
+            for key, (count, contents, date) in occurrences.items():
+                entry = self.pending.get(key)
+                if entry is None:
+                    self.pending[key] = [count, contents, date]
+                else:
+                    entry[0] += count
+                    if entry[1] is None:
+                        entry[1] = contents
+
+    def has_contents(self, key):
+        """
+        Check whether pending occurrence of key already carries contents.
+        """
+        with self._lock:
+            entry = self.pending.get(key)
+            return entry is not None and entry[1] is not None
+
+    def flush(self):
+        """
+        Write all pending occurrences. Return number of written keys.
+        """
+        with self._flush_lock:
+            with self._lock:
+                occurrences, self.pending = self.pending, {}
+                self._events = 0
+                self._last_flush = time()
+
+            if not occurrences:
+                return 0
+
+            try:
+                self.writer(occurrences)
+            except Exception:
+                self._merge(occurrences)
+                raise
+            return len(occurrences)
+
+    def _flush_allowed(self):
+        """
+        Write pending occurrences unless limiter has no tokens for it.
+        """
+        with self._lock:
+            if not self.pending:
+                return 0
+            if self.limiter is not None and not self.limiter.consume():
+                self._last_flush = time()
+                return 0
+        return self.flush()
+
+    def _work(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                return
+            try:
+                self._flush_allowed()
+            except Exception:  # IGNORE:broad-except
+                print_exc()
+
+    def stop(self):
+        """
+        Stop periodic flushing and write what is left.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        try:
+            return self.flush()
+        except Exception:  # IGNORE:broad-except
+            print_exc()
+            return 0
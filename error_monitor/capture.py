@@ -0,0 +1,169 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from collections import deque
+from itertools import islice
+
+# Django imports
+from django.db.models.query import QuerySet
+
+# Project imports
+from .fingerprint import is_in_app
+from .snapshots import Repr
+
+
+EXHAUSTED_TEXT = u'<not captured: size budget is exhausted>'
+CONTAINERS = (
+    (list, '[', ']'),
+    (tuple, '(', ')'),
+    (frozenset, 'frozenset([', '])'),
+    (set, 'set([', '])'),
+    (deque, 'deque([', '])'),
+)
+
+
+class BoundedRepr(object):
+    """
+    repr that builds at most limit characters: strings are cut before
+    they are represented, containers show max_items items max_depth levels
+    deep, query sets are never evaluated.
+    """
+
+    def __init__(self, max_items=10, max_depth=3):
+        self.max_items = max_items
+        self.max_depth = max_depth
+
+    def repr(self, value, limit):
+        """
+        Return representation of value of at most limit characters.
+        """
+        text = self._repr(value, limit, self.max_depth)
+        if isinstance(text, str):
+            text = text.decode('utf-8', 'replace')
+        return text[:limit]
+
+    def _repr(self, value, limit, depth):
+        if isinstance(value, QuerySet):
+            return self._repr_query_set(value, limit, depth)
+
+        if isinstance(value, (basestring, bytearray)):
+            if len(value) > limit:
+                marker = '...<%d characters>' % len(value)
+                return repr(value[:max(limit - len(marker) - 3, 0)]) + marker
+            return repr(value)
+
+        if isinstance(value, dict):
+            return self._repr_items(
+                value, value.iteritems(), '{', '}', limit, depth
+            )
+
+        for container_type, left, right in CONTAINERS:
+            if isinstance(value, container_type):
+                return self._repr_items(
+                    value, iter(value), left, right, limit, depth
+                )
+
+        try:
+            text = repr(value)
+        except Exception, error:  # IGNORE:broad-except
+            return '<%s: repr failed: %s>' % (type(value).__name__, error)
+        return text[:limit]
+
+    def _repr_items(self, value, items, left, right, limit, depth):
+        if type(value).__name__ not in ('dict', 'list', 'tuple', 'set',
+                                        'frozenset', 'deque'):
+            left = type(value).__name__ + '(' + left
+            right += ')'
+        if not value:
+            return left + right
+        if depth <= 0:
+            return left + '...' + right
+
+        pieces = []
+        left_characters = limit - len(left) - len(right)
+        for item in islice(items, self.max_items):
+            if left_characters <= 0:
+                break
+            if isinstance(value, dict):
+                key_text = self._repr(item[0], left_characters, depth - 1)
+                piece = '%s: %s' % (
+                    key_text,
+                    self._repr(
+                        item[1], left_characters - len(key_text), depth - 1
+                    )
+                )
+            else:
+                piece = self._repr(item, left_characters, depth - 1)
+            pieces.append(piece)
+            left_characters -= len(piece) + 2
+
+        if len(pieces) < len(value):
+            pieces.append('...<%d items>' % len(value))
+        return left + ', '.join(pieces) + right
+
+    def _repr_query_set(self, query_set, limit, depth):
+        # Cache of query set is only read, so it is never evaluated here.
+        cached = query_set._result_cache  # IGNORE:protected-access
+        name = '%s of %s' % (
+            type(query_set).__name__, query_set.model.__name__
+        )
+        if cached is None:
+            return '<%s: not evaluated>' % name
+        return '<%s: %s>' % (
+            name, self._repr_items(cached, iter(cached), '[', ']', limit, depth)
+        )
+
+
+class LocalsCapture(object):
+    """
+    Replace local variables of Django traceback frames with bounded
+    representations. Innermost frames are captured first and share
+    event_budget characters, every frame gets at most frame_budget of them
+    and every variable at most variable_length. With in_app_only
+    variables of frames outside of app_modules are not captured.
+    """
+
+    def __init__(self, variable_length=2000, frame_budget=20000,
+                 event_budget=100000, in_app_only=False, app_modules=(),
+                 max_items=10, max_depth=3):
+        self.variable_length = variable_length
+        self.frame_budget = frame_budget
+        self.event_budget = event_budget
+        self.in_app_only = in_app_only
+        self.app_modules = tuple(app_modules)
+        self.bounded_repr = BoundedRepr(max_items, max_depth)
+
+    def capture(self, frames):
+        """
+        Capture variables of frames returned by
+        ExceptionReporter.get_traceback_frames() in place.
+        """
+        event_left = self.event_budget
+        for frame in reversed(frames):
+            if 'vars' not in frame:
+                continue
+
+            if self.in_app_only:
+                traceback = frame.get('tb')
+                module = traceback.tb_frame.f_globals.get('__name__', '') \
+                    if traceback is not None else ''
+                if not is_in_app(module, self.app_modules):
+                    frame['vars'] = []
+                    continue
+
+            frame_left = self.frame_budget
+            variables = []
+            for name, value in frame['vars']:
+                limit = min(self.variable_length, frame_left, event_left)
+                if limit <= 0:
+                    text = EXHAUSTED_TEXT
+                else:
+                    text = self.bounded_repr.repr(value, limit)
+                    frame_left -= len(text)
+                    event_left -= len(text)
+                variables.append((name, Repr(text)))
+            frame['vars'] = variables
+        return frames
@@ -0,0 +1,244 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Project imports
+from .models import CollectedServer
+from .views import format_sync_date, parse_sync_date
+
+# Django imports
+from django.contrib import admin
+from django.contrib.admin import SimpleListFilter
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList, PAGE_VAR
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.db.models.query import QuerySet
+
+# Standard imports
+from datetime import datetime, timedelta
+
+# Third-party app imports
+from pytz import utc
+
+
+COUNT_LIMIT = getattr(settings, 'ERROR_MONITOR_ADMIN_COUNT_LIMIT', 10000)
+ESTIMATE_THRESHOLD = getattr(
+    settings, 'ERROR_MONITOR_ADMIN_ESTIMATE_THRESHOLD', 100000
+)
+PATH_PREFIXES = getattr(settings, 'ERROR_MONITOR_ADMIN_PATH_PREFIXES', ())
+PATH_PREFIXES_SAMPLE = 1000
+KEYSET_ORDERINGS = (['-date', '-pk'], ['-date', '-id'])
+
+
+def get_estimated_count(alias, table):
+    """
+    Return number of table rows estimated by PostgreSQL statistics,
+    summed over partitions if table is partitioned,
+    or None if database can not estimate it.
+    """
+    if connections[alias].vendor != 'postgresql':
+        return None
+
+    cursor = connections[alias].cursor()
+    cursor.execute(
+        'SELECT SUM(GREATEST(reltuples, 0)) FROM pg_class '
+        'WHERE relname = %s OR oid IN ('
+        'SELECT inhrelid FROM pg_inherits '
+        'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+        'WHERE parent.relname = %s)', [table, table]
+    )
+    row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+class EstimatedCountQuerySet(QuerySet):
+    """
+    Query set for admin changelists. Count of the whole big table
+    is estimated, count of filtered rows is limited to COUNT_LIMIT:
+    at most COUNT_LIMIT ids are selected in subquery and counted.
+    """
+
+    def count(self):
+        if self._result_cache is not None or self.query.low_mark or \
+                self.query.high_mark is not None:
+            return super(EstimatedCountQuerySet, self).count()
+
+        if not self.query.where:
+            estimated_count = get_estimated_count(
+                self.db, self.model._meta.db_table
+            )
+            if estimated_count is not None and \
+                    estimated_count >= ESTIMATE_THRESHOLD:
+                return estimated_count
+            return super(EstimatedCountQuerySet, self).count()
+
+        query = self.values_list('pk').order_by()[:COUNT_LIMIT].query
+        sql, params = query.get_compiler(using=self.db).as_sql()
+        cursor = connections[self.db].cursor()
+        cursor.execute(
+            'SELECT COUNT(*) FROM (%s) bounded_count' % sql, params
+        )
+        return cursor.fetchone()[0]
+
+
+class DateBucketFilter(SimpleListFilter):
+    """
+    Filter exceptions that occurred recently, served by date index.
+    """
+    title = 'last occurrence'
+    parameter_name = 'seen'
+    buckets = (
+        ('hour', 'Last hour', timedelta(hours=1)),
+        ('day', 'Last 24 hours', timedelta(days=1)),
+        ('week', 'Last 7 days', timedelta(days=7)),
+        ('month', 'Last 30 days', timedelta(days=30)),
+    )
+
+    def lookups(self, request, model_admin):
+        return [(bucket, label) for bucket, label, _ in self.buckets]
+
+    def queryset(self, request, query_set):
+        for bucket, _, delta in self.buckets:
+            if self.value() == bucket:
+                return query_set.filter(
+                    date__gte=datetime.utcnow().replace(tzinfo=utc) - delta
+                )
+        return query_set
+
+
+class PathPrefixFilter(SimpleListFilter):
+    """
+    Filter exceptions by path prefix, served by pattern index on path.
+    Prefixes are taken from ERROR_MONITOR_ADMIN_PATH_PREFIXES
+    or from the first path segments of latest exceptions.
+    """
+    title = 'path'
+    parameter_name = 'path_prefix'
+
+    def lookups(self, request, model_admin):
+        prefixes = PATH_PREFIXES
+        if not prefixes:
+            prefixes = sorted(set(
+                '/%s/' % path.split('/')[1]
+                for path in model_admin.model.objects.order_by(
+                    '-date'
+                ).values_list('path', flat=True)[:PATH_PREFIXES_SAMPLE]
+                if path.startswith('/') and path.count('/') > 1
+            ))
+        return [(prefix, prefix) for prefix in prefixes]
+
+    def queryset(self, request, query_set):
+        if self.value():
+            return query_set.filter(path__startswith=self.value())
+        return query_set
+
+
+class ServerFilter(SimpleListFilter):
+    """
+    Filter collected exceptions by server they occurred on,
+    served by index on server of exception sources.
+    """
+    title = 'server'
+    parameter_name = 'server'
+
+    def lookups(self, request, model_admin):
+        return [
+            (server, server) for server in
+            CollectedServer.objects.order_by(
+                'server'
+            ).values_list('server', flat=True)
+        ]
+
+    def queryset(self, request, query_set):
+        if self.value():
+            return query_set.filter(sources__server=self.value())
+        return query_set
+
+
+class KeysetFilter(SimpleListFilter):
+    """
+    Filter exceptions older than (date, id) of the last one on a page,
+    so that pages are served by date index and exceptions with the same
+    date are neither skipped nor repeated. "Older" link sets it,
+    it is displayed only then to link back to the latest exceptions.
+    """
+    title = 'older than'
+    parameter_name = 'before'
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return self.value() is not None
+
+    def queryset(self, request, query_set):
+        if not self.value():
+            return query_set
+        try:
+            date, last_id = self.value().split(',')
+            date, last_id = parse_sync_date(date), int(last_id)
+        except ValueError:
+            raise IncorrectLookupParameters(self.value())
+        return query_set.filter(
+            Q(date__lt=date) | Q(date=date, id__lt=last_id)
+        )
+
+
+class ScalableChangeList(ChangeList):
+    """
+    Change list handing all rows of its page to prefetch_results
+    of model admin, so that their columns are loaded with one query
+    per column instead of one query per row.
+    """
+
+    def get_results(self, request):
+        super(ScalableChangeList, self).get_results(request)
+        self.result_list = list(self.result_list)
+        self.model_admin.prefetch_results(self.result_list)
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    """
+    Admin of big exception tables: counts are estimated and
+    "Older" link pages by (date, id) with KeysetFilter instead of offset
+    while exceptions are ordered by date.
+    """
+    change_list_template = 'admin/error_monitor/change_list.html'
+
+    def queryset(self, request):
+        return super(ScalableModelAdmin, self).queryset(request)._clone(
+            klass=EstimatedCountQuerySet
+        )
+
+    def get_changelist(self, request, **kwargs):
+        return ScalableChangeList
+
+    def prefetch_results(self, results):
+        """
+        Load data displayed for results of changelist page.
+        """
+
+    def changelist_view(self, request, extra_context=None):
+        response = super(ScalableModelAdmin, self).changelist_view(
+            request, extra_context
+        )
+        change_list = getattr(response, 'context_data', {}).get('cl')
+        if change_list is not None and change_list.get_ordering(
+            request, change_list.root_query_set.order_by()
+        ) in KEYSET_ORDERINGS:
+            results = list(change_list.result_list)
+            if results:
+                response.context_data['older_url'] = \
+                    change_list.get_query_string(
+                        {
+                            KeysetFilter.parameter_name: '%s,%d' % (
+                                format_sync_date(results[-1].date),
+                                results[-1].id
+                            )
+                        },
+                        [PAGE_VAR]
+                    )
+        return response
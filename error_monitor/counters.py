@@ -0,0 +1,183 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from threading import Thread, Lock, Event
+from datetime import datetime
+from os import getpid
+from time import time
+from traceback import print_exc
+
+# Third-party app imports
+from pytz import utc
+
+
+class CacheCounters(object):
+    """
+    Occurrence counters shared by all processes through Django cache.
+    Occurrences are counted per epoch of interval seconds. The first
+    occurrence of key in epoch is left to caller to be written to database,
+    the rest are only counted and handed to writer once the epoch is over
+    by the process which holds flush lock.
+    """
+
+    def __init__(self, cache, writer, interval=10, timeout=3600,
+                 prefix='error_monitor'):
+        self.cache = cache
+        self.writer = writer
+        self.interval = interval
+        self.timeout = timeout
+        self.prefix = prefix
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._wakeup = Event()
+        self._pid = None
+
+    def _ensure_started(self):
+        """
+        Start periodic flushing thread on first use and again after fork.
+        """
+        if self._pid == getpid():
+            return
+
+        with self._lock:
+            if self._pid == getpid():
+                return
+
+            thread = Thread(target=self._work, name='error-monitor-counters')
+            thread.daemon = True
+            thread.start()
+            self._pid = getpid()
+
+    def _key(self, epoch, *parts):
+        return ':'.join((self.prefix, str(epoch)) + parts)
+
+    def add(self, key, signature, date, count=1):
+        """
+        Count occurrence of key identified by signature.
+        Return True if occurrence was not counted and has to be written
+        by caller: it is the first one in epoch or cache is unavailable.
+        """
+        self._ensure_started()
+        epoch = int(time() // self.interval)
+        count_key = self._key(epoch, 'count', signature)
+
+        if self.cache.add(count_key, 0, self.timeout):
+            index_key = self._key(epoch, 'index')
+            self.cache.add(index_key, 0, self.timeout)
+            try:
+                slot = self.cache.incr(index_key)
+            except ValueError:
+                return True
+            self.cache.set(
+                self._key(epoch, 'slot', str(slot)),
+                (signature, key),
+                self.timeout
+            )
+            return True
+
+        try:
+            self.cache.incr(count_key, count)
+        except ValueError:
+            return True
+        self.cache.set(self._key(epoch, 'date', signature), date, self.timeout)
+        return False
+
+    def flush_epoch(self, epoch):
+        """
+        Write counts of epoch and subtract them from counters.
+        Return number of written keys.
+        """
+        index = self.cache.get(self._key(epoch, 'index'))
+        if not index:
+            return 0
+
+        slots = self.cache.get_many(
+            [self._key(epoch, 'slot', str(slot)) for slot in xrange(1, index + 1)]
+        ).values()
+        count_keys = dict(
+            (self._key(epoch, 'count', signature), key)
+            for signature, key in slots
+        )
+        counts = self.cache.get_many(count_keys.keys())
+        dates = self.cache.get_many(
+            [self._key(epoch, 'date', signature) for signature, _ in slots]
+        )
+        default_date = datetime.fromtimestamp(
+            (epoch + 1) * self.interval, utc
+        )
+
+        occurrences = {}
+        for signature, key in slots:
+            count = counts.get(self._key(epoch, 'count', signature))
+            if count:
+                occurrences[tuple(key)] = (
+                    count,
+                    None,
+                    dates.get(self._key(epoch, 'date', signature), default_date)
+                )
+
+        if not occurrences:
+            return 0
+
+        self.writer(occurrences)
+
+        for count_key, count in counts.items():
+            if count:
+                try:
+                    self.cache.decr(count_key, count)
+                except ValueError:
+                    pass
+        return len(occurrences)
+
+    def flush(self, final=False):
+        """
+        Write counts of finished epochs, or of all epochs if final is set.
+        Only one process flushes at a time.
+        Return number of written keys.
+        """
+        with self._flush_lock:
+            lock_key = self.prefix + ':flush-lock'
+            if not self.cache.add(lock_key, getpid(), max(self.interval * 6, 60)):
+                return 0
+
+            try:
+                flushed_key = self.prefix + ':flushed'
+                current = int(time() // self.interval)
+                last_flushed = self.cache.get(flushed_key)
+                if last_flushed is None:
+                    last_flushed = current - self.timeout // self.interval - 1
+
+                written = 0
+                # Counters may still be incremented shortly after epoch ends.
+                for epoch in xrange(last_flushed + 1, current - 1):
+                    written += self.flush_epoch(epoch)
+                    self.cache.set(flushed_key, epoch, self.timeout)
+
+                if final:
+                    for epoch in xrange(max(last_flushed + 1, current - 1),
+                                        current + 1):
+                        written += self.flush_epoch(epoch)
+                return written
+            finally:
+                self.cache.delete(lock_key)
+
+    def _work(self):
+        while not self._wakeup.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:  # IGNORE:broad-except
+                print_exc()
+
+    def stop(self):
+        """
+        Stop periodic flushing and write what is counted.
+        """
+        self._wakeup.set()
+        try:
+            return self.flush(final=True)
+        except Exception:  # IGNORE:broad-except
+            print_exc()
+            return 0
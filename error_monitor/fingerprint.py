@@ -0,0 +1,175 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from collections import OrderedDict
+from hashlib import md5
+from threading import Lock
+
+# Django imports
+from django.utils.html import escape
+
+
+class LRUCache(object):
+    """
+    Thread-safe dictionary that keeps only size recently used keys.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        """
+        Return cached value or None.
+        """
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._items[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Cache value, evicting least recently used key if cache is full.
+        """
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            if len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """
+        Forget every cached value.
+        """
+        with self._lock:
+            self._items.clear()
+
+
+def get_traceback_frames(traceback):
+    """
+    Return (frame, line number) pairs of traceback, outermost first,
+    skipping frames marked with __traceback_hide__.
+    """
+    frames = []
+    while traceback is not None:
+        if not traceback.tb_frame.f_locals.get('__traceback_hide__'):
+            frames.append((traceback.tb_frame, traceback.tb_lineno))
+        traceback = traceback.tb_next
+    return frames
+
+
+def is_in_app(module, app_modules):
+    """
+    Check whether module belongs to one of app_modules.
+    """
+    return any(
+        module == app_module or module.startswith(app_module + '.')
+        for app_module in app_modules
+    )
+
+
+def get_location_fingerprint(traceback):
+    """
+    Hash "Exception Location" of traceback the same way
+    it is shown in simplified exception template.
+    """
+    frames = get_traceback_frames(traceback)
+    if not frames:
+        return ''
+
+    frame, line_number = frames[-1]
+    return md5(
+        '%s in %s, line %d' % (
+            escape(frame.f_code.co_filename),
+            escape(frame.f_code.co_name),
+            line_number
+        )
+    ).hexdigest()
+
+
+class Fingerprinter(object):
+    """
+    Hash exception type together with (module, function, line)
+    of traceback frames. Results are cached by code objects of the stack,
+    so repeated occurrences are hashed without building frame tuples.
+    """
+
+    def __init__(self, depth=None, in_app_only=False, app_modules=(),
+                 cache_size=1024):
+        self.depth = depth
+        self.in_app_only = in_app_only
+        self.app_modules = tuple(app_modules)
+        self.cache = LRUCache(cache_size)
+
+    def is_in_app(self, module):
+        """
+        Check whether module belongs to one of project applications.
+        """
+        return is_in_app(module, self.app_modules)
+
+    def get_frames(self, frames):
+        """
+        Normalize frames to (module, function, line) tuples
+        applying in-app and depth limits.
+        """
+        normalized_frames = [
+            (
+                frame.f_globals.get('__name__') or frame.f_code.co_filename,
+                frame.f_code.co_name,
+                line_number
+            )
+            for frame, line_number in frames
+        ]
+
+        if self.in_app_only:
+            in_app_frames = [
+                normalized_frame for normalized_frame in normalized_frames
+                if self.is_in_app(normalized_frame[0])
+            ]
+            if in_app_frames:
+                normalized_frames = in_app_frames
+
+        if self.depth:
+            normalized_frames = normalized_frames[-self.depth:]
+
+        return normalized_frames
+
+    def fingerprint(self, exception_type, traceback):
+        """
+        Return fingerprint of exception.
+        """
+        frames = get_traceback_frames(traceback)
+        codes = tuple(frame.f_code for frame, _ in frames)
+        cache_key = (
+            id(exception_type),
+            tuple(id(code) for code in codes),
+            tuple(line_number for _, line_number in frames)
+        )
+
+        cached = self.cache.get(cache_key)
+        # Cached value keeps code objects alive so their ids are not reused.
+        if cached is not None:
+            return cached[0]
+
+        fingerprint = md5(
+            '\n'.join(
+                ['%s.%s' % (
+                    exception_type.__module__, exception_type.__name__
+                )] + [
+                    '%s:%s:%d' % frame for frame in self.get_frames(frames)
+                ]
+            )
+        ).hexdigest()
+        self.cache.set(cache_key, (fingerprint, exception_type, codes))
+        return fingerprint
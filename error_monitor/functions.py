@@ -4,29 +4,53 @@ License: BSD
 """
 
 # Standard imports
-from re import search, I, findall
 from warnings import warn
-from hashlib import md5
 from datetime import datetime, timedelta
 from sys import exc_info
-from traceback import print_exc
-from urllib2 import urlopen, Request
-from urllib import urlencode
+from traceback import print_exception
+from atexit import register
+from httplib import HTTPException
+from socket import error as socket_error
+from smtplib import SMTPException
 from json import loads
+from hashlib import sha1
+from zlib import decompressobj, MAX_WBITS
+from time import sleep
+from multiprocessing.pool import ThreadPool
+from threading import Lock
 
 # Core Django imports
 from django.conf import settings
-from django.core.mail import EmailMessage
-from django.db.models import F
-from django.db import connections
+from django.core.mail import EmailMessage, get_connection
+from django.core.cache import get_cache
+from django.db.models import F, Q, Sum
+from django.db import connection, connections, transaction, \
+    IntegrityError, DatabaseError
+from django.db.transaction import TransactionManagementError
 
 # Third-party app imports
 from pytz import utc
-from psycopg2 import InterfaceError
+from psycopg2 import InterfaceError, Error as PsycopgError
 
 # Project related imports
-from .models import ProjectException, CollectedProjectException
-from .views import CustomExceptionReporter
+from .models import ProjectException, CollectedProjectException, \
+    CollectedExceptionSource, CollectedServer, ExceptionBody, \
+    OccurrenceBucket, ExceptionVariant, get_signature, pack_contents
+from .views import CustomExceptionReporter, format_sync_date, \
+    parse_sync_date, render_exception_contents
+from .background import BackgroundRecorder
+from .buffer import WriteBuffer
+from .fingerprint import Fingerprinter, LRUCache, get_location_fingerprint
+from .notifications import NotificationDispatcher, compile_matcher
+from .sampling import OccurrenceSampler, TokenBucket
+from .counters import CacheCounters
+from .spool import ExceptionSpool
+from .histogram import get_bucket_start, MINUTE, HOUR, DAY
+from .transport import HTTPTransport, make_unpacker, msgpack
+from .instrumentation import METRICS
+from .grouping import PathNormalizer, normalize_title, get_variant_digest
+from .partitions import insert_lock, is_partitioned, \
+    drop_expired_partitions, delete_expired_default_rows
 
 
 EXCEPTION_TITLE_WORDS_TO_NOTIFY = getattr(
@@ -38,6 +62,99 @@ EXCEPTION_RECIPIENTS = getattr(
 ERROR_MONITOR_EXCEPTION_LIFETIME = getattr(
     settings, 'ERROR_MONITOR_EXCEPTION_LIFETIME', 90
 )
+PURGE_CHUNK_SIZE = getattr(settings, 'ERROR_MONITOR_PURGE_CHUNK_SIZE', 1000)
+COLLECT_CONCURRENCY = getattr(
+    settings, 'ERROR_MONITOR_COLLECT_CONCURRENCY', 10
+)
+COLLECT_TIMEOUT = getattr(settings, 'ERROR_MONITOR_COLLECT_TIMEOUT', 20)
+COLLECT_RETRIES = getattr(settings, 'ERROR_MONITOR_COLLECT_RETRIES', 2)
+COLLECT_RETRY_BACKOFF = getattr(
+    settings, 'ERROR_MONITOR_COLLECT_RETRY_BACKOFF', 1
+)
+BULK_CREATE_BATCH = getattr(settings, 'ERROR_MONITOR_BULK_CREATE_BATCH', 500)
+SYNC_OVERLAP = getattr(settings, 'ERROR_MONITOR_SYNC_OVERLAP', 300)
+COLLECT_PAGE_SIZE = getattr(settings, 'ERROR_MONITOR_COLLECT_PAGE_SIZE', 1000)
+COLLECT_MAX_PENDING = getattr(
+    settings, 'ERROR_MONITOR_COLLECT_MAX_PENDING', 10000
+)
+COLLECT_DETAILS_BATCH = getattr(
+    settings, 'ERROR_MONITOR_COLLECT_DETAILS_BATCH', 500
+)
+ASYNC_RECORDING = getattr(settings, 'ERROR_MONITOR_ASYNC_RECORDING', False)
+ASYNC_QUEUE_SIZE = getattr(settings, 'ERROR_MONITOR_ASYNC_QUEUE_SIZE', 1000)
+ASYNC_WORKERS = getattr(settings, 'ERROR_MONITOR_ASYNC_WORKERS', 1)
+ASYNC_ENQUEUE_TIMEOUT = getattr(
+    settings, 'ERROR_MONITOR_ASYNC_ENQUEUE_TIMEOUT', 0
+)
+ASYNC_SHUTDOWN_TIMEOUT = getattr(
+    settings, 'ERROR_MONITOR_ASYNC_SHUTDOWN_TIMEOUT', 5
+)
+WRITE_BUFFERING = getattr(settings, 'ERROR_MONITOR_WRITE_BUFFER', False)
+WRITE_BUFFER_INTERVAL = getattr(
+    settings, 'ERROR_MONITOR_WRITE_BUFFER_INTERVAL', 1000
+)
+WRITE_BUFFER_SIZE = getattr(settings, 'ERROR_MONITOR_WRITE_BUFFER_SIZE', 100)
+LAZY_RENDERING = getattr(settings, 'ERROR_MONITOR_LAZY_RENDERING', False)
+SNAPSHOT_REFRESH = getattr(settings, 'ERROR_MONITOR_SNAPSHOT_REFRESH', 3600)
+FINGERPRINT = getattr(settings, 'ERROR_MONITOR_FINGERPRINT', 'location')
+FINGERPRINT_DEPTH = getattr(settings, 'ERROR_MONITOR_FINGERPRINT_DEPTH', None)
+FINGERPRINT_IN_APP_ONLY = getattr(
+    settings, 'ERROR_MONITOR_FINGERPRINT_IN_APP_ONLY', False
+)
+FINGERPRINT_APPS = getattr(
+    settings,
+    'ERROR_MONITOR_FINGERPRINT_APPS',
+    [app for app in settings.INSTALLED_APPS if not app.startswith('django.')]
+)
+FINGERPRINT_CACHE_SIZE = getattr(
+    settings, 'ERROR_MONITOR_FINGERPRINT_CACHE_SIZE', 1024
+)
+NOTIFICATION_WINDOW = getattr(
+    settings, 'ERROR_MONITOR_NOTIFICATION_WINDOW', 300
+)
+NOTIFICATION_INTERVAL = getattr(
+    settings, 'ERROR_MONITOR_NOTIFICATION_INTERVAL', 60
+)
+NOTIFICATION_AUTOMATON_THRESHOLD = getattr(
+    settings, 'ERROR_MONITOR_NOTIFICATION_AUTOMATON_THRESHOLD', 32
+)
+BODIES_CACHE_SIZE = getattr(settings, 'ERROR_MONITOR_BODIES_CACHE_SIZE', 1024)
+BODY_ORPHAN_AGE = getattr(settings, 'ERROR_MONITOR_BODY_ORPHAN_AGE', 86400)
+SAMPLING = getattr(settings, 'ERROR_MONITOR_SAMPLING', False)
+SAMPLING_FIRST = getattr(settings, 'ERROR_MONITOR_SAMPLING_FIRST', 10)
+SAMPLING_WINDOW = getattr(settings, 'ERROR_MONITOR_SAMPLING_WINDOW', 60)
+SAMPLING_MAX_KEYS = getattr(settings, 'ERROR_MONITOR_SAMPLING_MAX_KEYS', 10000)
+WRITE_RATE = getattr(settings, 'ERROR_MONITOR_WRITE_RATE', None)
+WRITE_BURST = getattr(settings, 'ERROR_MONITOR_WRITE_BURST', 10)
+CACHE_COUNTERS = getattr(settings, 'ERROR_MONITOR_CACHE_COUNTERS', False)
+COUNTERS_CACHE = getattr(settings, 'ERROR_MONITOR_COUNTERS_CACHE', 'default')
+COUNTERS_INTERVAL = getattr(settings, 'ERROR_MONITOR_COUNTERS_INTERVAL', 10)
+COUNTERS_TIMEOUT = getattr(settings, 'ERROR_MONITOR_COUNTERS_TIMEOUT', 3600)
+DATABASE = getattr(settings, 'ERROR_MONITOR_DATABASE', 'default')
+SPOOL_PATH = getattr(settings, 'ERROR_MONITOR_SPOOL_PATH', None)
+TRANSPORT_FORMAT = getattr(settings, 'ERROR_MONITOR_TRANSPORT_FORMAT', 'form')
+TRANSPORT_COMPRESS = getattr(settings, 'ERROR_MONITOR_TRANSPORT_COMPRESS', False)
+TRANSPORT_POOL_SIZE = getattr(settings, 'ERROR_MONITOR_TRANSPORT_POOL_SIZE', 2)
+HISTOGRAM = getattr(settings, 'ERROR_MONITOR_HISTOGRAM', False)
+HISTOGRAM_MINUTES_AGE = getattr(
+    settings, 'ERROR_MONITOR_HISTOGRAM_MINUTES_AGE', 86400
+)
+HISTOGRAM_HOURS_AGE = getattr(
+    settings, 'ERROR_MONITOR_HISTOGRAM_HOURS_AGE', 30 * 86400
+)
+PARTITIONING = getattr(settings, 'ERROR_MONITOR_PARTITIONING', False)
+PARTITION_PERIOD = getattr(settings, 'ERROR_MONITOR_PARTITION_PERIOD', 'month')
+PARTITIONS_AHEAD = getattr(settings, 'ERROR_MONITOR_PARTITIONS_AHEAD', 2)
+GROUPING = getattr(settings, 'ERROR_MONITOR_GROUPING', False)
+LEGACY_RESOLVE_RESPONSE = 'Done'
+# Errors of connecting to PostgreSQL are raised by psycopg2 unwrapped.
+DATABASE_ERRORS = (PsycopgError, DatabaseError)
+GROUPING_MAX_VARIANTS = getattr(
+    settings, 'ERROR_MONITOR_GROUPING_MAX_VARIANTS', 10
+)
+GROUPING_CACHE_SIZE = getattr(
+    settings, 'ERROR_MONITOR_GROUPING_CACHE_SIZE', 1024
+)
 
 if not EXCEPTION_TITLE_WORDS_TO_NOTIFY:
     warn(
@@ -50,231 +167,1447 @@ if not EXCEPTION_RECIPIENTS:
     warn('Please specify ERROR_MONITOR_EXCEPTION_RECIPIENTS in settings.')
 
 
+def get_exception_title(exception, title=None, title_prefix=None):
+    """
+    Build exception title used for grouping and notifications.
+    """
+    if not title:
+        title = str(exception)
+
+    if title_prefix:
+        title = title_prefix + title
+
+    return title
+
+
 def record_exception(exception, title=None, title_prefix=None, request=None):
     """
     Record caught exception in database.
-    If connection is broken - mark it as unavailable - so it will be reset.
-    Send emails if it is identified as critical.
-    Print exception in the end.
     """
-    current_exception = exc_info()
-    exception_data = CustomExceptionReporter(  # IGNORE:star-args
-        request, *current_exception
+    save_exception(
+        exc_info(),
+        get_exception_title(exception, title, title_prefix),
+        request
     )
-    html_content = exception_data.get_traceback_html()
-    occurrences = findall(
-        '<th>Exception Location:</th>\n'
-        '[ ]+<td>(.*, line [0-9]+)</td>',
-        html_content
+
+
+def record_exception_async(exception, title=None, title_prefix=None,
+                           request=None):
+    """
+    Capture caught exception and leave the rest of the work
+    to background recorder. Only plain data is queued: key, title, path,
+    date and compressed snapshot of contents with bounded variables,
+    which is None for occurrences sampled out, so that neither traceback
+    nor request are kept alive by the queue.
+    Return False if exception was dropped because recorder queue is full.
+    """
+    current_exception = exc_info()
+    title = get_exception_title(exception, title, title_prefix)
+    path = request.path if request else 'N/A'
+    date = datetime.utcnow().replace(tzinfo=utc)
+    key = get_exception_key(current_exception, title, path)
+
+    snapshot = None
+    if not SAMPLING or SAMPLER.sample(key):
+        with METRICS.timer('record.snapshot'):
+            snapshot = CustomExceptionReporter(  # IGNORE:star-args
+                request, *current_exception
+            ).get_traceback_snapshot()
+
+    print_exception(*current_exception)  # IGNORE:star-args
+    del current_exception
+
+    if BACKGROUND_RECORDER.submit(key, title, path, date, snapshot):
+        return True
+
+    METRICS.increment('record.dropped')
+    return False
+
+
+BODIES_CACHE = LRUCache(BODIES_CACHE_SIZE)
+
+FINGERPRINTER = Fingerprinter(
+    depth=FINGERPRINT_DEPTH,
+    in_app_only=FINGERPRINT_IN_APP_ONLY,
+    app_modules=FINGERPRINT_APPS,
+    cache_size=FINGERPRINT_CACHE_SIZE
+)
+
+
+def get_exception_fingerprint(current_exception):
+    """
+    Return hash identifying exception described by exc_info() triple.
+    By default only the last frame location is hashed as older versions
+    did. ERROR_MONITOR_FINGERPRINT = 'frames' hashes exception type and
+    normalized frames instead, which changes hashes of known exceptions,
+    so they are recorded again as new ones.
+    """
+    if FINGERPRINT == 'frames':
+        return FINGERPRINTER.fingerprint(
+            current_exception[0], current_exception[2]
+        )
+
+    return get_location_fingerprint(current_exception[2])
+
+
+SAMPLER = OccurrenceSampler(
+    first=SAMPLING_FIRST, window=SAMPLING_WINDOW, max_keys=SAMPLING_MAX_KEYS
+)
+
+WRITE_LIMITER = TokenBucket(WRITE_RATE, WRITE_BURST) if WRITE_RATE else None
+
+PATH_NORMALIZER = PathNormalizer(GROUPING_CACHE_SIZE)
+
+VARIANTS_CACHE = LRUCache(GROUPING_CACHE_SIZE)
+
+
+def get_exception_key(current_exception, title, path):
+    """
+    Return (hash, title, path) key of exception described by exc_info()
+    triple. With ERROR_MONITOR_GROUPING exceptions are grouped
+    by normalized title and path.
+    """
+    with METRICS.timer('record.fingerprint'):
+        location_hash = get_exception_fingerprint(current_exception)
+        if GROUPING:
+            return (
+                location_hash, normalize_title(title),
+                PATH_NORMALIZER.normalize(path)
+            )
+        return location_hash, title, path
+
+
+def save_exception(current_exception, title, request=None):
+    """
+    Save exception described by exc_info() triple in database.
+    With ERROR_MONITOR_SAMPLING contents are captured only for sampled
+    occurrences, the rest of them are only counted.
+    Contents are captured only if exception is new or its stored contents
+    are stale. With ERROR_MONITOR_LAZY_RENDERING compressed snapshot
+    is stored instead of HTML.
+    Print exception in the end.
+    """
+    METRICS.increment('record.events')
+    path = request.path if request else 'N/A'
+    date = datetime.utcnow().replace(tzinfo=utc)
+    key = get_exception_key(current_exception, title, path)
+
+    def get_contents():
+        """
+        Return contents of occurrence or None if they are not needed.
+        """
+        if is_snapshot_fresh(key, date):
+            return None
+        reporter = CustomExceptionReporter(  # IGNORE:star-args
+            request, *current_exception
+        )
+        if not LAZY_RENDERING:
+            return reporter.get_traceback_html()
+        return reporter.get_traceback_snapshot()
+
+    save_occurrence(
+        key, title, path, date, get_contents,
+        sampled=not SAMPLING or SAMPLER.sample(key)
     )
-    location_hash = (
-        md5(occurrences[0]).hexdigest() if len(occurrences) == 1 else ''
+
+    print_exception(*current_exception)  # IGNORE:star-args
+
+
+def save_captured_exception(key, title, path, date, snapshot):
+    """
+    Save occurrence captured by record_exception_async.
+    Snapshot is rendered to HTML unless ERROR_MONITOR_LAZY_RENDERING is set.
+    """
+    METRICS.increment('record.events')
+
+    def get_contents():
+        """
+        Return contents of occurrence or None if they are not needed.
+        """
+        if is_snapshot_fresh(key, date):
+            return None
+        if not LAZY_RENDERING:
+            return render_exception_contents(snapshot)
+        return snapshot
+
+    save_occurrence(
+        key, title, path, date, get_contents, sampled=snapshot is not None
     )
 
-    if not title:
-        title = str(exception)
 
-    if title_prefix:
-        title = title_prefix + title
+def save_occurrence(key, title, path, date, get_contents, sampled=True):
+    """
+    Save occurrence of exception with (hash, title, path) key,
+    raw title and path. get_contents is called for contents of occurrence
+    only if they are going to be written.
+    With ERROR_MONITOR_GROUPING raw titles and paths are sampled as variants.
+    With ERROR_MONITOR_WRITE_BUFFER occurrences are written in batches,
+    as many per second as ERROR_MONITOR_WRITE_RATE allows if it is set.
+    Otherwise occurrences sampled out and, with ERROR_MONITOR_WRITE_RATE,
+    occurrences exceeding write rate are only counted in overflow buffer,
+    which is written as write rate allows.
+    With ERROR_MONITOR_CACHE_COUNTERS only the first occurrence per
+    counters interval is written, the rest are counted in shared cache.
+    Occurrences that can not be written are spooled to
+    ERROR_MONITOR_SPOOL_PATH.
+    Send emails if it is identified as critical.
+    """
+    signature = get_signature(*key)  # IGNORE:star-args
 
-    path = request.path if request else 'N/A'
+    notify_about_exception(title, signature)
+
+    if GROUPING and (title, path) != key[1:]:
+        save_variant(signature, title, path)
 
-    notify_about_exception(title)
+    if CACHE_COUNTERS and not COUNTERS.add(key, signature, date):
+        METRICS.increment('record.deduplicated')
+        return
 
-    print_exc()
+    if not sampled:
+        METRICS.increment('record.sampled_out')
+        contents = None
+    else:
+        with METRICS.timer('record.render'):
+            contents = get_contents()
+
+    if WRITE_BUFFERING:
+        METRICS.increment('record.buffered')
+        WRITE_BUFFER.add(key, contents, date)
+    elif not sampled or (
+        WRITE_LIMITER is not None and not WRITE_LIMITER.consume()
+    ):
+        METRICS.increment('record.overflowed')
+        OVERFLOW_BUFFER.add(key, contents, date)
+    else:
+        persist_exceptions({key: (1, contents, date)})
+
+
+def save_variant(signature, title, path):
+    """
+    Store raw title and path of grouped exception unless
+    ERROR_MONITOR_GROUPING_MAX_VARIANTS variants of it are stored already.
+    Stored variants and exceptions with all variants stored are cached,
+    so that they cost no queries.
+    """
+    digest = get_variant_digest(title, path)
+    if VARIANTS_CACHE.get(signature) or VARIANTS_CACHE.get((signature, digest)):
+        return
 
     try:
-        if ProjectException.objects.filter(
-            hash=location_hash, title=title, path=path
-        ).update(
-            count=F('count') + 1,
-            contents=html_content,
-            date=datetime.utcnow().replace(tzinfo=utc)
-        ) == 0:
-            ProjectException.objects.create(
-                path=path,
-                contents=html_content,
-                title=title,
-                hash=location_hash,
-                count=1
-            )
-        ProjectException.objects.filter(
-            date__lte=datetime.utcnow() - timedelta(
-                days=ERROR_MONITOR_EXCEPTION_LIFETIME
+        variants = ExceptionVariant.objects.using(DATABASE).filter(
+            signature=signature
+        )
+        if not variants.filter(digest=digest).exists():
+            if variants.count() >= GROUPING_MAX_VARIANTS:
+                VARIANTS_CACHE.set(signature, True)
+                return
+            try:
+                ExceptionVariant.objects.using(DATABASE).create(
+                    signature=signature, digest=digest, title=title, path=path
+                )
+                METRICS.increment('record.variants')
+            except IntegrityError:
+                # Variant was stored concurrently.
+                transaction.rollback_unless_managed(using=DATABASE)
+        VARIANTS_CACHE.set((signature, digest), True)
+    except DATABASE_ERRORS:
+        reset_connection(DATABASE)
+
+
+def is_snapshot_fresh(key, date):
+    """
+    Check whether contents of exception were written less than
+    ERROR_MONITOR_SNAPSHOT_REFRESH seconds ago. Date of exception is
+    its last occurrence, so date of its body is checked instead.
+    Contents written by this process are checked without queries.
+    """
+    if WRITE_BUFFER.has_contents(key) or OVERFLOW_BUFFER.has_contents(key):
+        return True
+
+    cached_body = BODIES_CACHE.get(get_signature(*key))  # IGNORE:star-args
+    if cached_body is not None and cached_body[1] >= date - timedelta(
+        seconds=SNAPSHOT_REFRESH
+    ):
+        return True
+
+    try:
+        return ProjectException.objects.using(DATABASE).filter(
+            signature=get_signature(*key),  # IGNORE:star-args
+            body__date__gte=date - timedelta(seconds=SNAPSHOT_REFRESH)
+        ).exists()
+    except DATABASE_ERRORS:
+        reset_connection(DATABASE)
+        return False
+
+
+def store_contents(contents, digest=None):
+    """
+    Return id of exception body with digest, storing contents as its body.
+    Digest is SHA-1 digest of contents by default, so unchanged contents
+    are never written again. Body with other digest, e.g. signature
+    of exception, is rewritten with contents and its date is updated.
+    Ids of bodies are cached with dates contents were written at.
+    """
+    rewrite = digest is not None
+    if not rewrite:
+        digest = sha1(
+            contents.encode('utf-8') if isinstance(contents, unicode)
+            else contents
+        ).hexdigest()
+
+    bodies = ExceptionBody.objects.using(DATABASE)
+    now = datetime.utcnow().replace(tzinfo=utc)
+    cached_body = BODIES_CACHE.get(digest)
+    if cached_body is not None:
+        if not rewrite:
+            return cached_body[0]
+        if bodies.filter(id=cached_body[0]).update(
+            data=pack_contents(contents), date=now
+        ):
+            BODIES_CACHE.set(digest, (cached_body[0], now))
+            return cached_body[0]
+
+    body_ids = list(bodies.filter(digest=digest).values_list('id', flat=True))
+    if body_ids:
+        body_id = body_ids[0]
+        if rewrite:
+            bodies.filter(id=body_id).update(
+                data=pack_contents(contents), date=now
             )
-        ).delete()
+    else:
+        try:
+            body_id = bodies.create(
+                digest=digest, data=pack_contents(contents)
+            ).id
+        except IntegrityError:
+            # Body was stored concurrently, contents of either are fine.
+            transaction.rollback_unless_managed(using=DATABASE)
+            body_id = bodies.get(digest=digest).id
+    BODIES_CACHE.set(digest, (body_id, now))
+
+    return body_id
+
+
+PARTITIONED_TABLES = set()
+
+
+def is_table_partitioned(table, using):
+    """
+    Check whether table of database alias is partitioned.
+    Tables are not converted back, so only partitioned ones are cached.
+    """
+    if (table, using) in PARTITIONED_TABLES:
+        return True
+    if is_partitioned(table, using):
+        PARTITIONED_TABLES.add((table, using))
+        return True
+    return False
+
+
+def write_exceptions(occurrences):
+    """
+    Save aggregated occurrences in database.
+    occurrences maps (hash, title, path) to (count, contents, date),
+    contents of None leave stored contents unchanged.
+    Existing exceptions get one summed update, new ones are bulk inserted.
+    Contents of occurrences differ in request data and server time even
+    for the same exception, so body of exception is addressed by its
+    signature and rewritten with contents of later occurrences.
+    With ERROR_MONITOR_HISTOGRAM occurrences are added to minute
+    and hour buckets too.
+    If connection is broken - mark it as unavailable - so it will be reset.
+    """
+    try:
+        new_exceptions = []
+        for (location_hash, title, path), (count, contents, date) in \
+                occurrences.items():
+            signature = get_signature(location_hash, title, path)
+            body_id = None
+            if contents is not None:
+                body_id = store_contents(contents, signature)
+            if not update_exception(signature, count, date, body_id):
+                if body_id is None and BODIES_CACHE.get(signature):
+                    # Resolved exception occurred again while its contents
+                    # are fresh, so they were not captured.
+                    body_id = BODIES_CACHE.get(signature)[0]
+                new_exceptions.append(
+                    ProjectException(
+                        path=path,
+                        body_id=body_id,
+                        title=title,
+                        hash=location_hash,
+                        signature=signature,
+                        count=count,
+                        date=date
+                    )
+                )
+        if new_exceptions and is_table_partitioned(
+            ProjectException._meta.db_table,  # IGNORE:protected-access
+            DATABASE
+        ):
+            # Partitioned table has no unique signature constraint,
+            # so new exceptions are inserted one process at a time
+            # whether ERROR_MONITOR_PARTITIONING is set or not.
+            with insert_lock(DATABASE):
+                upsert_exceptions(new_exceptions)
+        elif new_exceptions:
+            try:
+                ProjectException.objects.using(DATABASE).bulk_create(
+                    new_exceptions
+                )
+            except (IntegrityError, TransactionManagementError):
+                # Some of exceptions were created concurrently.
+                transaction.rollback_unless_managed(using=DATABASE)
+                upsert_exceptions(new_exceptions)
+        if HISTOGRAM:
+            write_histogram(occurrences)
+    except IntegrityError:
+        # Cached body may have been purged as orphan by another process.
+        BODIES_CACHE.clear()
+        raise
     except InterfaceError, database_exception:
         if str(database_exception).lower() == 'connection already closed':
-            print 'Closing broken connections...'
-            for connection in connections:
-                connections[connection].connection = None
+            print 'Closing broken connection...'
+            reset_connection(DATABASE)
         raise database_exception
 
 
-def notify_about_exception(exception_title):
+def update_exception(signature, count, date, body_id=None):
     """
-    If exception is identified as critical - send email to recipients.
+    Add count to saved exception with signature and set its date to date
+    unless the saved one is newer, as buffered and spooled occurrences
+    may be written out of order. Modification date is set either way.
+    Return False if there is no such exception.
     """
-    if EXCEPTION_TITLE_WORDS_TO_NOTIFY and EXCEPTION_RECIPIENTS:
-        pattern = r'|'.join(EXCEPTION_TITLE_WORDS_TO_NOTIFY)
-        search_result = search(pattern, exception_title, I)
+    values = {
+        'count': F('count') + count,
+        'modified': datetime.utcnow().replace(tzinfo=utc)
+    }
+    if body_id is not None:
+        values['body'] = body_id
+    exceptions = ProjectException.objects.using(DATABASE).filter(
+        signature=signature
+    )
+    if exceptions.filter(date__lt=date).update(  # IGNORE:star-args
+        date=date, **values
+    ):
+        return True
+    return exceptions.update(**values) > 0  # IGNORE:star-args
 
-        if search_result is not None:
-            message_content = (
-                "<p>%(body)s</p><p>Server: "
-                "<a href='%(protocol)s://%(domain)s'>%(domain)s</a></p>" % (
-                    {
-                        'body': exception_title,
-                        'protocol': settings.SERVER_PROTOCOL,
-                        'domain': settings.CURRENT_SERVER_DOMAIN
-                    }
+
+def upsert_exceptions(new_exceptions):
+    """
+    Add counts of unsaved exceptions to saved ones with the same
+    signatures, save the rest.
+    """
+    for exception in new_exceptions:
+        if not update_exception(
+            exception.signature, exception.count, exception.date,
+            exception.body_id
+        ):
+            exception.save(using=DATABASE)
+
+
+def write_histogram(occurrences):
+    """
+    Add occurrences to minute and hour buckets of their exceptions.
+    """
+    buckets = {}
+    for key, (count, _, date) in occurrences.items():
+        signature = get_signature(*key)  # IGNORE:star-args
+        for resolution in (MINUTE, HOUR):
+            bucket = (signature, resolution, get_bucket_start(date, resolution))
+            buckets[bucket] = buckets.get(bucket, 0) + count
+    add_to_buckets(buckets)
+
+
+def add_to_buckets(buckets):
+    """
+    Add counts to occurrence buckets.
+    buckets maps (signature, resolution, start) to count.
+    """
+    new_buckets = []
+    for (signature, resolution, start), count in buckets.items():
+        if OccurrenceBucket.objects.using(DATABASE).filter(
+            signature=signature, resolution=resolution, start=start
+        ).update(count=F('count') + count) == 0:
+            new_buckets.append(
+                OccurrenceBucket(
+                    signature=signature,
+                    resolution=resolution,
+                    start=start,
+                    count=count
                 )
             )
-            message = EmailMessage(
-                "Error Monitor notification",
-                message_content,
-                settings.EMAIL_HOST_USER,
-                EXCEPTION_RECIPIENTS
+    if new_buckets:
+        try:
+            OccurrenceBucket.objects.using(DATABASE).bulk_create(new_buckets)
+        except (IntegrityError, TransactionManagementError):
+            # Some of buckets were created concurrently.
+            transaction.rollback_unless_managed(using=DATABASE)
+            for bucket in new_buckets:
+                if OccurrenceBucket.objects.using(DATABASE).filter(
+                    signature=bucket.signature,
+                    resolution=bucket.resolution,
+                    start=bucket.start
+                ).update(count=F('count') + bucket.count) == 0:
+                    bucket.save(using=DATABASE)
+
+
+@METRICS.timed('retention.rollup')
+def rollup_histogram(chunk_size=PURGE_CHUNK_SIZE):
+    """
+    Downsample occurrence buckets: minute buckets older than
+    ERROR_MONITOR_HISTOGRAM_MINUTES_AGE seconds are deleted, as their
+    occurrences are in hour buckets already, hour buckets older than
+    ERROR_MONITOR_HISTOGRAM_HOURS_AGE seconds are merged into day buckets.
+    Then update trend of exceptions: occurrences within the last hour
+    minus occurrences within the hour before.
+    """
+    now = datetime.utcnow().replace(tzinfo=utc)
+
+    while True:
+        chunk = list(
+            OccurrenceBucket.objects.using(DATABASE).filter(
+                resolution=MINUTE,
+                start__lt=now - timedelta(seconds=HISTOGRAM_MINUTES_AGE)
+            ).values_list('id', flat=True)[:chunk_size]
+        )
+        if not chunk:
+            break
+        OccurrenceBucket.objects.using(DATABASE).filter(id__in=chunk).delete()
+
+    while True:
+        chunk = list(
+            OccurrenceBucket.objects.using(DATABASE).filter(
+                resolution=HOUR,
+                start__lt=now - timedelta(seconds=HISTOGRAM_HOURS_AGE)
+            ).values_list('id', 'signature', 'start', 'count')[:chunk_size]
+        )
+        if not chunk:
+            break
+        day_buckets = {}
+        for _, signature, start, count in chunk:
+            bucket = (signature, DAY, get_bucket_start(start, DAY))
+            day_buckets[bucket] = day_buckets.get(bucket, 0) + count
+        with transaction.commit_on_success(using=DATABASE):
+            add_to_buckets(day_buckets)
+            OccurrenceBucket.objects.using(DATABASE).filter(
+                id__in=[bucket[0] for bucket in chunk]
+            ).delete()
+
+    trends = {}
+    for sign, since, until in (
+        (1, now - timedelta(hours=1), now),
+        (-1, now - timedelta(hours=2), now - timedelta(hours=1))
+    ):
+        for signature, total in OccurrenceBucket.objects.using(DATABASE).filter(
+            resolution=MINUTE, start__gte=since, start__lt=until
+        ).values('signature').annotate(
+            total=Sum('count')
+        ).values_list('signature', 'total'):
+            trends[signature] = trends.get(signature, 0) + sign * total
+
+    ProjectException.objects.using(DATABASE).exclude(trend=0).exclude(
+        signature__in=trends.keys()
+    ).update(trend=0)
+    for signature, trend in trends.items():
+        ProjectException.objects.using(DATABASE).filter(
+            signature=signature
+        ).exclude(trend=trend).update(trend=trend)
+
+
+def reset_connection(alias):
+    """
+    Drop connection of database alias so that it is reopened on next query.
+    """
+    try:
+        connections[alias].close()
+    except DATABASE_ERRORS:
+        pass
+    connections[alias].connection = None
+
+
+SPOOL = ExceptionSpool(SPOOL_PATH) if SPOOL_PATH else None
+
+
+def persist_exceptions(occurrences):
+    """
+    Write occurrences with write_exceptions retrying once on fresh
+    connection. If database is still unavailable occurrences are spooled
+    to ERROR_MONITOR_SPOOL_PATH to be replayed later.
+    """
+    try:
+        with METRICS.timer('write.database'):
+            write_exceptions(occurrences)
+        return
+    except DATABASE_ERRORS:
+        METRICS.increment('write.retries')
+        reset_connection(DATABASE)
+
+    try:
+        with METRICS.timer('write.database'):
+            write_exceptions(occurrences)
+    except DATABASE_ERRORS:
+        METRICS.increment('write.failures')
+        reset_connection(DATABASE)
+        if SPOOL is None:
+            raise
+        METRICS.increment('write.spooled', len(occurrences))
+        SPOOL.append(occurrences)
+
+
+def replay_exception_spool(batch_size=BULK_CREATE_BATCH):
+    """
+    Write occurrences spooled while database was unavailable.
+    Return number of replayed occurrences.
+    """
+    if SPOOL is None:
+        return 0
+    replayed = SPOOL.replay(write_exceptions, batch_size)
+    METRICS.increment('write.replayed', replayed)
+    return replayed
+
+
+WRITE_BUFFER = WriteBuffer(
+    persist_exceptions,
+    flush_interval=WRITE_BUFFER_INTERVAL / 1000.0,
+    flush_size=WRITE_BUFFER_SIZE,
+    limiter=WRITE_LIMITER
+)
+register(WRITE_BUFFER.stop)
+OVERFLOW_BUFFER = WriteBuffer(
+    persist_exceptions,
+    flush_interval=WRITE_BUFFER_INTERVAL / 1000.0,
+    flush_size=None,
+    limiter=WRITE_LIMITER
+)
+register(OVERFLOW_BUFFER.stop)
+
+
+COUNTERS = None
+if CACHE_COUNTERS:
+    COUNTERS = CacheCounters(
+        get_cache(COUNTERS_CACHE),
+        persist_exceptions,
+        interval=COUNTERS_INTERVAL,
+        timeout=COUNTERS_TIMEOUT
+    )
+    register(COUNTERS.stop)
+
+
+BACKGROUND_RECORDER = BackgroundRecorder(
+    save_captured_exception,
+    queue_size=ASYNC_QUEUE_SIZE,
+    workers=ASYNC_WORKERS,
+    enqueue_timeout=ASYNC_ENQUEUE_TIMEOUT
+)
+
+
+@METRICS.timed('retention.purge')
+def purge_exceptions(chunk_size=PURGE_CHUNK_SIZE):
+    """
+    Delete exceptions and occurrence buckets older than
+    ERROR_MONITOR_EXCEPTION_LIFETIME days, bodies no exception
+    refers to and variants of deleted exceptions in chunks
+    of chunk_size rows.
+    With ERROR_MONITOR_PARTITIONING and partitioned exceptions table
+    partitions of exceptions are dropped once they are expired as a whole
+    instead, only rows of default partition are deleted in chunks.
+    Return number of deleted exceptions, estimated for dropped partitions.
+    """
+    expiry_date = datetime.utcnow().replace(tzinfo=utc) - timedelta(
+        days=ERROR_MONITOR_EXCEPTION_LIFETIME
+    )
+    deleted = 0
+
+    query_sets = [CollectedProjectException.objects.all()]
+    table = ProjectException._meta.db_table  # IGNORE:protected-access
+    if PARTITIONING and is_table_partitioned(table, DATABASE):
+        deleted += drop_expired_partitions(
+            table, PARTITION_PERIOD, expiry_date, DATABASE
+        )[1]
+        deleted += delete_expired_default_rows(
+            table, expiry_date, DATABASE, chunk_size
+        )
+    else:
+        query_sets.insert(0, ProjectException.objects.using(DATABASE))
+
+    for query_set in query_sets:
+        while True:
+            chunk = list(
+                query_set.filter(
+                    date__lte=expiry_date
+                ).values_list('id', flat=True)[:chunk_size]
             )
-            message.content_subtype = 'html'
-            message.send(fail_silently=True)
+            if not chunk:
+                break
+            query_set.filter(id__in=chunk).only('id').delete()
+            deleted += len(chunk)
 
+    orphan_date = datetime.utcnow().replace(tzinfo=utc) - timedelta(
+        seconds=BODY_ORPHAN_AGE
+    )
+    while True:
+        chunk = list(
+            ExceptionBody.objects.using(DATABASE).filter(
+                projectexception__isnull=True,
+                collectedprojectexception__isnull=True,
+                date__lte=orphan_date
+            ).values_list('id', flat=True)[:chunk_size]
+        )
+        if not chunk:
+            break
+        ExceptionBody.objects.using(DATABASE).filter(id__in=chunk).delete()
+        BODIES_CACHE.clear()
 
-def collect_exceptions_from_servers():
-    """ Collect exceptions from remote servers. """
+    while True:
+        chunk = list(
+            OccurrenceBucket.objects.using(DATABASE).filter(
+                start__lte=expiry_date
+            ).values_list('id', flat=True)[:chunk_size]
+        )
+        if not chunk:
+            break
+        OccurrenceBucket.objects.using(DATABASE).filter(id__in=chunk).delete()
 
-    target_servers_list = getattr(settings, 'ERROR_MONITOR_EXCEPTION_SERVERS_LIST', [])
+    while True:
+        chunk = list(
+            ExceptionVariant.objects.using(DATABASE).filter(
+                date__lte=orphan_date
+            ).exclude(
+                signature__in=ProjectException.objects.using(DATABASE).values(
+                    'signature'
+                )
+            ).values_list('id', flat=True)[:chunk_size]
+        )
+        if not chunk:
+            break
+        ExceptionVariant.objects.using(DATABASE).filter(id__in=chunk).delete()
 
-    CollectedProjectException.objects.all().delete()
+    METRICS.increment('retention.deleted', deleted)
+    return deleted
 
-    hash_list = []
-    target_server = {}
 
-    for server in target_servers_list:
-        print "=> Collecting exceptions from %s" % server
-        response_dict = urlopen(
-            Request(
-                url=(
-                    '%s/error_monitor/collect_exceptions/'
-                    %
-                    server
+@METRICS.timed('notify.email')
+def send_notifications(notifications):
+    """
+    Send (title, count) notifications as one email.
+    SMTP connection is kept open between calls and reopened if it broke.
+    """
+    message_content = (
+        "%(body)s<p>Server: "
+        "<a href='%(protocol)s://%(domain)s'>%(domain)s</a></p>" % (
+            {
+                'body': ''.join(
+                    "<p>%s</p>" % (
+                        title if count == 1
+                        else '%s (%d occurrences)' % (title, count)
+                    )
+                    for title, count in notifications
                 ),
-                data=urlencode(
-                    {'secret_key': settings.ERROR_MONITOR_SECRET_KEY},
-                    doseq=True
+                'protocol': settings.SERVER_PROTOCOL,
+                'domain': settings.CURRENT_SERVER_DOMAIN
+            }
+        )
+    )
+    message = EmailMessage(
+        "Error Monitor notification" if len(notifications) == 1 else
+        "Error Monitor notification: %d exceptions" % len(notifications),
+        message_content,
+        settings.EMAIL_HOST_USER,
+        EXCEPTION_RECIPIENTS,
+        connection=MAIL_CONNECTION
+    )
+    message.content_subtype = 'html'
+
+    try:
+        MAIL_CONNECTION.open()
+        message.send()
+    except (SMTPException, socket_error):
+        METRICS.increment('notify.email_retries')
+        MAIL_CONNECTION.close()
+        MAIL_CONNECTION.open()
+        message.send()
+    METRICS.increment('notify.sent', len(notifications))
+
+
+MAIL_CONNECTION = get_connection()
+
+NOTIFICATION_MATCHER = (
+    compile_matcher(
+        EXCEPTION_TITLE_WORDS_TO_NOTIFY, NOTIFICATION_AUTOMATON_THRESHOLD
+    ) if EXCEPTION_TITLE_WORDS_TO_NOTIFY else None
+)
+
+NOTIFICATION_DISPATCHER = NotificationDispatcher(
+    send_notifications,
+    window=NOTIFICATION_WINDOW,
+    interval=NOTIFICATION_INTERVAL
+)
+register(NOTIFICATION_DISPATCHER.stop)
+# atexit calls handlers in reverse order, so recorder is drained before
+# buffers, counters and notification dispatcher it hands occurrences to.
+register(BACKGROUND_RECORDER.stop, ASYNC_SHUTDOWN_TIMEOUT)
+
+
+def notify_about_exception(exception_title, key=None):
+    """
+    If exception is identified as critical - notify recipients.
+    Notifications are sent in background, once per
+    ERROR_MONITOR_NOTIFICATION_WINDOW seconds for each key,
+    in digests sent every ERROR_MONITOR_NOTIFICATION_INTERVAL seconds.
+    """
+    if NOTIFICATION_MATCHER is not None and EXCEPTION_RECIPIENTS:
+        if NOTIFICATION_MATCHER.search(exception_title):
+            METRICS.increment('notify.matched')
+            NOTIFICATION_DISPATCHER.notify(
+                key or exception_title, exception_title
+            )
+
+
+TRANSPORT = HTTPTransport(
+    timeout=COLLECT_TIMEOUT,
+    pool_size=TRANSPORT_POOL_SIZE,
+    payload_format=TRANSPORT_FORMAT,
+    compress=TRANSPORT_COMPRESS
+)
+register(TRANSPORT.close)
+
+
+def open_server(server, view, data):
+    """
+    Send data to error_monitor view of server and return response.
+    Connections to servers are kept alive and reused.
+    Failed connections are retried ERROR_MONITOR_COLLECT_RETRIES times
+    with exponential backoff.
+    """
+    data = dict(data, secret_key=settings.ERROR_MONITOR_SECRET_KEY)
+
+    for attempt in range(COLLECT_RETRIES + 1):
+        try:
+            with METRICS.timer('collect.request'):
+                return TRANSPORT.post(
+                    '%s/error_monitor/%s/' % (server, view),
+                    data,
+                    headers={'Accept-Encoding': 'gzip'}
                 )
-            ),
-            timeout=20
-        ).read()
+        except (HTTPException, socket_error):
+            if attempt == COLLECT_RETRIES:
+                METRICS.increment('collect.request_failures')
+                raise
+            METRICS.increment('collect.request_retries')
+            sleep(COLLECT_RETRY_BACKOFF * 2 ** attempt)
 
-        errors_list = loads(response_dict)
 
-        expected_parameters = ["path", "title", "count", "hash"]
-        path_index = []
+def iter_response_chunks(response, chunk_size=65536):
+    """
+    Read response by chunks and yield them decompressed if needed.
+    """
+    decompressor = None
+    if response.info().get('Content-Encoding') == 'gzip':
+        decompressor = decompressobj(16 + MAX_WBITS)
 
-        for value in expected_parameters:
-            path_index.append(errors_list[0].index(value))
+    while True:
+        chunk = response.read(chunk_size)
+        if not chunk:
+            break
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        yield chunk
 
-        for error in errors_list[1:]:
-            try:
-                if CollectedProjectException.objects.filter(
-                    hash=error[path_index[3]], title=error[path_index[1]], path=error[path_index[0]]
-                ).update(
-                    count=F('count') + error[path_index[2]],
-                    date=datetime.utcnow().replace(tzinfo=utc),
-                    server_count=F('server_count') + 1,
-                ) == 0:
-                    CollectedProjectException.objects.create(
-                        path=error[path_index[0]],
-                        title=error[path_index[1]],
-                        hash=error[path_index[3]],
-                        count=error[path_index[2]],
-                        server_count=1,
-                        servers=server
-                    )
-                else:
-                    CollectedProjectException.objects.filter(
-                        hash=error[path_index[3]],
-                        title=error[path_index[1]],
-                        path=error[path_index[0]]
-                    ).update(
-                        servers='%s, %s' % (
-                            CollectedProjectException.objects.filter(
-                                hash=error[path_index[3]],
-                                title=error[path_index[1]],
-                                path=error[path_index[0]]
-                            )[0].servers,
-                        server
+    if decompressor is not None:
+        yield decompressor.flush()
+
+
+def iter_response_lines(response, chunk_size=65536):
+    """
+    Read response by chunks, decompressing it if needed,
+    and yield its lines.
+    """
+    tail = ''
+    for chunk in iter_response_chunks(response, chunk_size):
+        lines = (tail + chunk).split('\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line
+
+    if tail:
+        yield tail
+
+
+def iter_response_records(response, response_format):
+    """
+    Yield records of ndjson or msgpack response.
+    """
+    if response_format != 'msgpack':
+        for line in iter_response_lines(response):
+            yield loads(line)
+        return
+
+    unpacker = make_unpacker()
+    for chunk in iter_response_chunks(response):
+        unpacker.feed(chunk)
+        for record in unpacker:
+            yield record
+
+
+def iter_server_rows(server, view, data):
+    """
+    Request rows from error_monitor view of server page by page
+    and yield them as dictionaries, parsing every record as it is received.
+    Servers of older versions ignore paging and send all rows as one
+    JSON list of keys and rows, which is parsed as a whole.
+    """
+    response_format = 'msgpack' if (
+        TRANSPORT_FORMAT == 'msgpack' and msgpack is not None
+    ) else 'ndjson'
+
+    after = None
+    while True:
+        page_data = dict(
+            data, format=response_format, limit=COLLECT_PAGE_SIZE
+        )
+        if after is not None:
+            page_data['after'] = after
+
+        response = open_server(server, view, page_data)
+        if response.info().get('Content-Type', '').startswith(
+            'application/json'
+        ):
+            rows = loads(''.join(iter_response_chunks(response)))
+            if not isinstance(rows, list) or not rows or not isinstance(
+                rows[0], list
+            ):
+                raise ValueError('Unexpected response of %s' % server)
+            METRICS.increment('collect.rows', len(rows) - 1)
+            for record in rows[1:]:
+                yield dict(zip(rows[0], record))
+            return
+
+        records = iter_response_records(response, response_format)
+        keys = next(records)
+        if not isinstance(keys, list) or 'id' not in keys:
+            raise ValueError('Unexpected response of %s' % server)
+        rows_count = 0
+        for record in records:
+            row = dict(zip(keys, record))
+            after = row['id']
+            rows_count += 1
+            yield row
+
+        METRICS.increment('collect.rows', rows_count)
+        if rows_count < COLLECT_PAGE_SIZE:
+            return
+
+
+def fan_out(function, arguments_list):
+    """
+    Call function with every arguments tuple in a pool of
+    ERROR_MONITOR_COLLECT_CONCURRENCY threads.
+    Return list of (arguments, result, error) in order of arguments_list.
+    """
+    def call(arguments):
+        try:
+            return arguments, function(*arguments), None
+        except Exception, error:  # IGNORE:broad-except
+            return arguments, None, error
+
+    if not arguments_list:
+        return []
+
+    pool = ThreadPool(min(COLLECT_CONCURRENCY, len(arguments_list)))
+    try:
+        return pool.map(call, arguments_list)
+    finally:
+        pool.close()
+        pool.join()
+
+
+@METRICS.timed('collect.total')
+def collect_exceptions_from_servers(full=False):
+    """
+    Collect exceptions from remote servers.
+    Servers are requested concurrently, servers that failed are skipped.
+    Only exceptions changed since previous synchronization of server
+    are requested unless full is set. Responses are parsed as they are
+    received and merged by signature, merged exceptions are saved in
+    batches of ERROR_MONITOR_COLLECT_MAX_PENDING, so memory used does not
+    grow with number of exceptions. Then details of changed exceptions
+    are requested in batches of ERROR_MONITOR_COLLECT_DETAILS_BATCH hashes.
+    Return dictionary of failed servers and their errors.
+    """
+
+    target_servers_list = getattr(settings, 'ERROR_MONITOR_EXCEPTION_SERVERS_LIST', [])
+    started = datetime.utcnow().replace(tzinfo=utc)
+    failed_servers = {}
+    cursors = {}
+    full_servers = set()
+    pending = {}
+    merge_lock = Lock()
+    save_lock = Lock()
+
+    servers_state = dict(
+        CollectedServer.objects.filter(
+            server__in=target_servers_list
+        ).values_list('server', 'cursor')
+    )
+    requests = []
+    for server in target_servers_list:
+        cursor = None if full else servers_state.get(server)
+        if cursor is None:
+            full_servers.add(server)
+            requests.append((server, {}))
+        else:
+            requests.append(
+                (
+                    server,
+                    {
+                        'since': format_sync_date(
+                            cursor - timedelta(seconds=SYNC_OVERLAP)
                         )
+                    }
+                )
+            )
+
+    def save_pending(force=False):
+        """
+        Save merged exceptions if there are enough of them or force is set.
+        """
+        with save_lock:
+            with merge_lock:
+                if not pending or (
+                    not force and len(pending) < COLLECT_MAX_PENDING
+                ):
+                    return
+                batch = pending.copy()
+                pending.clear()
+            with METRICS.timer('collect.save'):
+                save_collected_exceptions(batch, started, target_servers_list)
+
+    def collect_server(server, data):
+        """
+        Merge exceptions of server into pending ones.
+        """
+        cursor = servers_state.get(server)
+        legacy = False
+        try:
+            for error in iter_server_rows(server, 'collect_exceptions', data):
+                signature = get_signature(
+                    error['hash'], error['title'], error['path']
+                )
+                if 'date' not in error:
+                    # Servers of older versions ignore "since" and send
+                    # no dates, so their cursors are reset.
+                    legacy = True
+                else:
+                    # Some versions send dates without modification dates.
+                    modified = parse_sync_date(
+                        error.get('modified') or error['date']
                     )
+                    if cursor is None or modified > cursor:
+                        cursor = modified
 
-                if not error[path_index[3]] in hash_list:
-                    if not server in target_server:
-                        target_server[server] = []
-
-                    target_server[server].append(error[path_index[3]])
-                    hash_list.append(error[path_index[3]])
-
-            except InterfaceError, database_exception:
-                if str(database_exception).lower() == 'connection already closed':
-                    print 'Closing broken connections...'
-                    for connection in connections:
-                        connections[connection].connection = None
-                raise database_exception
-
-    for server, hashes_list in target_server.items():
-        print "=> Getting exception details from %s" % server
-        response_dict = urlopen(
-            Request(
-                url=(
-                    '%s/error_monitor/get_exception_details/'
-                    %
-                    server
-                ),
-                data=urlencode(
-                    {
-                        'secret_key': settings.ERROR_MONITOR_SECRET_KEY,
-                        'hashes': ' '.join(hashes_list)
-                    },
-                    doseq=True
+                with merge_lock:
+                    if signature not in pending:
+                        pending[signature] = (
+                            CollectedProjectException(
+                                path=error['path'],
+                                title=error['title'],
+                                hash=error['hash'],
+                                signature=signature,
+                                count=0
+                            ),
+                            {}
+                        )
+                    pending[signature][1][server] = error['count']
+                    pending_count = len(pending)
+
+                if pending_count >= COLLECT_MAX_PENDING:
+                    save_pending()
+        finally:
+            connection.close()
+
+        return None if legacy else cursor
+
+    print "=> Collecting exceptions from %d servers" % len(target_servers_list)
+    for (server, _), cursor, request_error in fan_out(
+        collect_server, requests
+    ):
+        if request_error is not None:
+            print "=> Failed to collect exceptions from %s: %s" % (
+                server, request_error
+            )
+            METRICS.increment('collect.failed_servers')
+            failed_servers[server] = request_error
+            full_servers.discard(server)
+            continue
+
+        cursors[server] = cursor
+
+    save_pending(force=True)
+    with METRICS.timer('collect.save'):
+        finish_collection(cursors, full_servers, started, target_servers_list)
+
+    with METRICS.timer('collect.details'):
+        failed_servers.update(
+            collect_details(started, failed_servers, target_servers_list)
+        )
+
+    return failed_servers
+
+
+def collect_details(since, failed_servers, servers_list):
+    """
+    Save contents of collected exceptions changed since date or having
+    none. Contents are requested from the first server of exception that
+    has not failed, servers are requested concurrently,
+    ERROR_MONITOR_COLLECT_DETAILS_BATCH hashes per request.
+    Return dictionary of servers failed meanwhile and their errors.
+    """
+    failed_servers = dict(failed_servers)
+    details_failed_servers = {}
+    query_set = CollectedProjectException.objects.filter(
+        Q(date__gte=since) | Q(body__isnull=True)
+    ).order_by('id').values_list('id', 'hash', 'servers')
+
+    def collect_server_details(server, hashes):
+        """
+        Save contents of exceptions with hashes received from server.
+        """
+        try:
+            for error in iter_server_rows(
+                server, 'get_exception_details', {'hashes': ' '.join(hashes)}
+            ):
+                CollectedProjectException.objects.filter(
+                    hash=error['hash']
+                ).update(
+                    body=store_contents(error['contents'])
                 )
-            ),
-            timeout=20
-        ).read()
+        finally:
+            connection.close()
+
+    print "=> Getting exception details"
+    last_id = 0
+    while True:
+        rows = list(
+            query_set.filter(id__gt=last_id)[
+                :COLLECT_DETAILS_BATCH * COLLECT_CONCURRENCY
+            ]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
 
-        errors_list = loads(response_dict)
+        server_hashes = {}
+        requested_hashes = set()
+        for _, location_hash, servers in rows:
+            if location_hash in requested_hashes:
+                continue
+            for server in servers.split(','):
+                server = server.strip()
+                if server in servers_list and server not in failed_servers:
+                    server_hashes.setdefault(server, []).append(location_hash)
+                    requested_hashes.add(location_hash)
+                    break
 
-        expected_parameters = ["contents", "hash"]
-        path_index = []
+        for (server, _), _, request_error in fan_out(
+            collect_server_details,
+            [
+                (server, hashes_chunk)
+                for server, hashes in server_hashes.items()
+                for hashes_chunk in chunks(hashes, COLLECT_DETAILS_BATCH)
+            ]
+        ):
+            if request_error is not None and server not in failed_servers:
+                print "=> Failed to get exception details from %s: %s" % (
+                    server, request_error
+                )
+                METRICS.increment('collect.failed_servers')
+                failed_servers[server] = request_error
+                details_failed_servers[server] = request_error
+
+    return details_failed_servers
 
-        for value in expected_parameters:
-            path_index.append(errors_list[0].index(value))
 
-        for error in errors_list[1:]:
-            CollectedProjectException.objects.filter(
-                hash=error[path_index[1]]
-            ).update(
-                contents=error[path_index[0]]
+def chunks(values, size):
+    """
+    Split list of values into lists of at most size values.
+    """
+    values = list(values)
+    return [values[start:start + size] for start in range(0, len(values), size)]
+
+
+@transaction.commit_on_success
+def save_collected_exceptions(collected_exceptions, synced, servers_list):
+    """
+    Upsert batch of collected exceptions and their per-server counts
+    in one transaction, so collected exceptions stay readable meanwhile.
+    collected_exceptions maps signatures to unsaved exceptions and their
+    counts on each server. Saved counts are marked synchronized at synced.
+    """
+    try:
+        changed_exceptions = set()
+
+        for signatures in chunks(collected_exceptions, BULK_CREATE_BATCH):
+            exception_ids = dict(
+                CollectedProjectException.objects.filter(
+                    signature__in=signatures
+                ).values_list('signature', 'id')
             )
 
+            new_signatures = [
+                signature for signature in signatures
+                if signature not in exception_ids
+            ]
+            if new_signatures:
+                CollectedProjectException.objects.bulk_create(
+                    [
+                        collected_exceptions[signature][0]
+                        for signature in new_signatures
+                    ]
+                )
+                exception_ids.update(
+                    CollectedProjectException.objects.filter(
+                        signature__in=new_signatures
+                    ).values_list('signature', 'id')
+                )
 
-def resolve_exceptions_from_servers(exception_object):
-    """ Request details on specific exception from one of the aware servers. """
-    for server in exception_object.servers.split(','):
-        urlopen(
-            Request(
-                url=(
-                    '%s/error_monitor/resolve_exception/'
-                    %
-                    server
-                ),
-                data=urlencode(
-                    {
-                        'secret_key': settings.ERROR_MONITOR_SECRET_KEY,
-                        'hash': exception_object.hash
-                    },
-                    doseq=True
+            sources = dict(
+                ((exception_id, server), (source_id, count))
+                for source_id, exception_id, server, count in
+                CollectedExceptionSource.objects.filter(
+                    exception__in=exception_ids.values()
+                ).values_list('id', 'exception_id', 'server', 'count')
+            )
+            new_sources = []
+            unchanged_sources = []
+            for signature in signatures:
+                exception_id = exception_ids[signature]
+                for server, count in collected_exceptions[signature][1].items():
+                    source = sources.get((exception_id, server))
+                    if source is None:
+                        new_sources.append(
+                            CollectedExceptionSource(
+                                exception_id=exception_id,
+                                server=server,
+                                count=count,
+                                synced=synced
+                            )
+                        )
+                    elif source[1] != count:
+                        CollectedExceptionSource.objects.filter(
+                            id=source[0]
+                        ).update(count=count, synced=synced)
+                    else:
+                        unchanged_sources.append(source[0])
+                        continue
+                    changed_exceptions.add(exception_id)
+            CollectedExceptionSource.objects.bulk_create(new_sources)
+            CollectedExceptionSource.objects.filter(
+                id__in=unchanged_sources
+            ).update(synced=synced)
+
+        update_collected_counts(changed_exceptions, servers_list)
+    except InterfaceError, database_exception:
+        if str(database_exception).lower() == 'connection already closed':
+            print 'Closing broken connections...'
+            for connection in connections:
+                connections[connection].connection = None
+        raise database_exception
+
+
+@transaction.commit_on_success
+def finish_collection(cursors, full_servers, synced, servers_list):
+    """
+    Delete counts of servers that are no longer listed and counts
+    that fully synchronized servers did not report at synced,
+    recalculate their exceptions and save synchronization cursors.
+    cursors map servers to their latest modification dates
+    of exceptions.
+    """
+    try:
+        stale = ~Q(server__in=servers_list)
+        if full_servers:
+            stale |= Q(server__in=full_servers) & (
+                Q(synced__lt=synced) | Q(synced__isnull=True)
+            )
+        stale_sources = CollectedExceptionSource.objects.filter(stale)
+
+        while True:
+            stale_chunk = list(
+                stale_sources.values_list('id', 'exception_id')[
+                    :BULK_CREATE_BATCH
+                ]
+            )
+            if not stale_chunk:
+                break
+            CollectedExceptionSource.objects.filter(
+                id__in=[source_id for source_id, _ in stale_chunk]
+            ).delete()
+            update_collected_counts(
+                set(exception_id for _, exception_id in stale_chunk),
+                servers_list
+            )
+
+        for server, cursor in cursors.items():
+            if CollectedServer.objects.filter(server=server).update(
+                cursor=cursor, synced=datetime.utcnow().replace(tzinfo=utc)
+            ) == 0:
+                CollectedServer.objects.create(
+                    server=server,
+                    cursor=cursor,
+                    synced=datetime.utcnow().replace(tzinfo=utc)
+                )
+    except InterfaceError, database_exception:
+        if str(database_exception).lower() == 'connection already closed':
+            print 'Closing broken connections...'
+            for connection in connections:
+                connections[connection].connection = None
+        raise database_exception
+
+
+def update_collected_counts(exception_ids, servers_list):
+    """
+    Recalculate count, server_count and servers of collected exceptions
+    from their per-server counts. Exceptions left without servers are
+    deleted.
+    """
+    server_order = dict(
+        (server, index) for index, server in enumerate(servers_list)
+    )
+
+    for ids_chunk in chunks(exception_ids, BULK_CREATE_BATCH):
+        totals = dict((exception_id, [0, []]) for exception_id in ids_chunk)
+        for exception_id, server, count in \
+                CollectedExceptionSource.objects.filter(
+                    exception__in=ids_chunk
+                ).values_list('exception_id', 'server', 'count'):
+            totals[exception_id][0] += count
+            totals[exception_id][1].append(server)
+
+        CollectedProjectException.objects.filter(
+            id__in=[
+                exception_id for exception_id, (_, servers) in totals.items()
+                if not servers
+            ]
+        ).delete()
+
+        for exception_id, (count, servers) in totals.items():
+            if servers:
+                servers.sort(key=server_order.get)
+                CollectedProjectException.objects.filter(
+                    id=exception_id
+                ).update(
+                    count=count,
+                    server_count=len(servers),
+                    servers=', '.join(servers),
+                    date=datetime.utcnow().replace(tzinfo=utc)
+                )
+
+
+class ResolveError(Exception):
+    """
+    Server replied to resolve request with neither deleted counts
+    nor confirmation of older versions, e.g. denied access.
+    """
+
+    def __init__(self, server, response):
+        super(ResolveError, self).__init__(server, response)
+        self.server = server
+        self.response = response
+
+    def __str__(self):
+        return 'Unexpected response of %s: %r' % (
+            self.server, self.response[:100]
+        )
+
+
+def resolve_exceptions_from_servers(exception_objects):
+    """
+    Delete collected exceptions on servers they were collected from.
+    Servers are requested concurrently, each of them once
+    with all hashes it has to delete. Collected exceptions lose counts
+    of servers they were deleted on and are deleted if none is left.
+    Return dictionary of servers and numbers of deleted exceptions
+    of each hash and dictionary of failed servers and their errors.
+    """
+    server_hashes = {}
+    for exception_object in exception_objects:
+        for server in exception_object.servers.split(','):
+            server = server.strip()
+            if server:
+                server_hashes.setdefault(server, set()).add(
+                    exception_object.hash
                 )
-            ),
-            timeout=20
+
+    def resolve_server(server, hashes):
+        """
+        Delete exceptions with hashes on server.
+        Servers of older versions delete only the last posted hash
+        and reply LEGACY_RESOLVE_RESPONSE, so the rest of hashes
+        are sent to them one by one.
+        """
+        hashes = sorted(hashes)
+        response = open_server(
+            server, 'resolve_exception', {'hash': hashes}
         ).read()
+        if response == LEGACY_RESOLVE_RESPONSE:
+            for location_hash in hashes[:-1]:
+                response = open_server(
+                    server, 'resolve_exception', {'hash': location_hash}
+                ).read()
+                if response != LEGACY_RESOLVE_RESPONSE:
+                    raise ResolveError(server, response)
+            return {}
+
+        try:
+            deleted_counts = loads(response)
+        except ValueError:
+            raise ResolveError(server, response)
+        if not isinstance(deleted_counts, dict):
+            raise ResolveError(server, response)
+        return deleted_counts
+
+    resolved_servers = {}
+    failed_servers = {}
+    for (server, _), deleted_counts, request_error in fan_out(
+        resolve_server, server_hashes.items()
+    ):
+        if request_error is not None:
+            failed_servers[server] = request_error
+        else:
+            resolved_servers[server] = deleted_counts
+
+    remove_resolved_sources(
+        dict(
+            (server, server_hashes[server]) for server in resolved_servers
+        ),
+        getattr(settings, 'ERROR_MONITOR_EXCEPTION_SERVERS_LIST', [])
+    )
+    return resolved_servers, failed_servers
+
+
+@transaction.commit_on_success
+def remove_resolved_sources(server_hashes, servers_list):
+    """
+    Delete counts of exceptions with hashes resolved on servers
+    and recalculate collected exceptions.
+    server_hashes maps servers to resolved hashes.
+    """
+    changed_exceptions = set()
+    for server, hashes in server_hashes.items():
+        for hashes_chunk in chunks(hashes, BULK_CREATE_BATCH):
+            sources = list(
+                CollectedExceptionSource.objects.filter(
+                    server=server, exception__hash__in=hashes_chunk
+                ).values_list('id', 'exception_id')
+            )
+            CollectedExceptionSource.objects.filter(
+                id__in=[source_id for source_id, _ in sources]
+            ).delete()
+            changed_exceptions.update(
+                exception_id for _, exception_id in sources
+            )
+
+    update_collected_counts(changed_exceptions, servers_list)
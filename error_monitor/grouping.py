@@ -0,0 +1,167 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from hashlib import md5
+from re import compile as compile_regex, I
+
+# Django imports
+from django.core.urlresolvers import get_resolver, RegexURLResolver
+
+# Project imports
+from .fingerprint import LRUCache
+
+
+TITLE_PATTERNS = (
+    (compile_regex(r'[a-z]+://[^\s\'"<>]+', I), '<url>'),
+    (
+        compile_regex(
+            r'(?<!\w)(?:"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')(?!\w)'
+        ),
+        '<str>'
+    ),
+    (
+        compile_regex(
+            r'\b[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?'
+            r'[0-9a-f]{12}\b', I
+        ),
+        '<uuid>'
+    ),
+    (
+        compile_regex(
+            r'\b0x[0-9a-f]+\b|\b(?=[0-9a-f]*\d)(?=[0-9a-f]*[a-f])'
+            r'[0-9a-f]{8,}\b', I
+        ),
+        '<hex>'
+    ),
+    (
+        compile_regex(
+            r'\b\d{4}-\d\d-\d\d(?:[T ]\d\d:\d\d(?::\d\d(?:\.\d+)?)?'
+            r'(?:Z|[+-]\d\d:?\d\d)?)?'
+        ),
+        '<date>'
+    ),
+    (compile_regex(r'\b\d+(?:\.\d+)?\b'), '<n>'),
+)
+QUOTED_TITLE = compile_regex(r'^(?:\'([^\']*)\'|"([^"]*)")$')
+SEGMENT_PATTERNS = (
+    (TITLE_PATTERNS[2][0], '<uuid>'),
+    (compile_regex(r'^\d+$'), '<n>'),
+    (compile_regex(r'^[0-9a-f]{8,}$', I), '<hex>'),
+)
+
+
+def normalize_title(title):
+    """
+    Replace values that differ between occurrences of the same error
+    in title: URLs, quoted strings, UUIDs, hexadecimal numbers, dates
+    and decimal numbers. Title that is quoted as a whole, e.g. one
+    of KeyError, is normalized within quotes.
+    """
+    if not title:
+        return title
+    match = QUOTED_TITLE.match(title)
+    if match is not None:
+        quote = title[0]
+        return quote + normalize_title(
+            match.group(1) if quote == "'" else match.group(2)
+        ) + quote
+    for pattern, replacement in TITLE_PATTERNS:
+        title = pattern.sub(replacement, title)
+    return title
+
+
+def get_match_spans(pattern, path, offset=0):
+    """
+    Return (start, end, name) of arguments URL pattern captures in path
+    or None if path does not match pattern.
+    """
+    match = pattern.regex.search(path)
+    if match is None:
+        return None
+
+    names = dict((index, name) for name, index in match.re.groupindex.items())
+    spans = []
+    for index in range(1, match.re.groups + 1):
+        start, end = match.span(index)
+        if start < end and not any(
+            start >= outer_start and end <= outer_end
+            for outer_start, outer_end, _ in spans
+        ):
+            spans.append((offset + start, offset + end, names.get(index, 'arg')))
+
+    if not isinstance(pattern, RegexURLResolver):
+        return spans
+
+    for sub_pattern in pattern.url_patterns:
+        sub_spans = get_match_spans(
+            sub_pattern, path[match.end():], offset + match.end()
+        )
+        if sub_spans is not None:
+            return spans + sub_spans
+    return None
+
+
+def collapse_segments(path):
+    """
+    Replace numeric, UUID and hexadecimal segments of path.
+    """
+    segments = path.split('/')
+    for position, segment in enumerate(segments):
+        for pattern, replacement in SEGMENT_PATTERNS:
+            if pattern.match(segment):
+                segments[position] = replacement
+                break
+    return '/'.join(segments)
+
+
+class PathNormalizer(object):
+    """
+    Replace arguments of URL patterns in paths with their names,
+    e.g. /view/42/ becomes /view/<exception_id>/. Paths URLconf does not
+    match have numeric, UUID and hexadecimal segments replaced instead.
+    Normalized paths are cached.
+    """
+
+    def __init__(self, cache_size=1024):
+        self.cache = LRUCache(cache_size)
+
+    def normalize(self, path):
+        """
+        Return path with its variable parts replaced.
+        """
+        normalized = self.cache.get(path)
+        if normalized is not None:
+            return normalized
+
+        try:
+            spans = get_match_spans(get_resolver(None), path)
+        except Exception:  # IGNORE:broad-except
+            # Broken URLconf must not break recording.
+            spans = None
+
+        if spans is None:
+            normalized = collapse_segments(path)
+        else:
+            normalized = path
+            for start, end, name in sorted(spans, reverse=True):
+                normalized = '%s<%s>%s' % (
+                    normalized[:start], name, normalized[end:]
+                )
+
+        self.cache.set(path, normalized)
+        return normalized
+
+
+def get_variant_digest(title, path):
+    """
+    Return digest identifying raw title and path of exception variant.
+    """
+    return md5(
+        '\0'.join(
+            value.encode('utf-8') if isinstance(value, unicode) else value
+            for value in (title or '', path)
+        )
+    ).hexdigest()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from datetime import datetime, timedelta
+
+# Third-party app imports
+from pytz import utc
+
+# Project imports
+from .models import OccurrenceBucket
+
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+SPARKLINE_CHARACTERS = u'▁▂▃▄▅▆▇█'
+
+
+def get_bucket_start(date, resolution):
+    """
+    Return start of bucket of resolution seconds date belongs to.
+    Resolution has to divide a day.
+    """
+    offset = (date.hour * HOUR + date.minute * MINUTE + date.second) % resolution
+    return date - timedelta(seconds=offset, microseconds=date.microsecond)
+
+
+def get_hourly_counts(signature, hours=24, using=None):
+    """
+    Return occurrence counts of exception for each of last hours,
+    oldest first.
+    """
+    return get_hourly_counts_by_signature([signature], hours, using)[signature]
+
+
+def get_hourly_counts_by_signature(signatures, hours=24, using=None):
+    """
+    Return occurrence counts of exceptions for each of last hours,
+    oldest first, by their signatures. Buckets of all exceptions
+    are loaded with one query.
+    """
+    current_hour = get_bucket_start(datetime.utcnow().replace(tzinfo=utc), HOUR)
+    first_hour = current_hour - timedelta(hours=hours - 1)
+
+    counts = dict((signature, {}) for signature in signatures)
+    if signatures:
+        for signature, start, count in OccurrenceBucket.objects.using(
+            using
+        ).filter(
+            signature__in=signatures,
+            resolution=HOUR,
+            start__gte=first_hour
+        ).values_list('signature', 'start', 'count'):
+            counts[signature][start] = count
+    return dict(
+        (
+            signature,
+            [
+                signature_counts.get(first_hour + timedelta(hours=hour), 0)
+                for hour in range(hours)
+            ]
+        )
+        for signature, signature_counts in counts.items()
+    )
+
+
+def render_sparkline(counts):
+    """
+    Render counts as a line of block characters.
+    """
+    highest = max(counts) if counts else 0
+    if not highest:
+        return SPARKLINE_CHARACTERS[0] * len(counts)
+
+    return u''.join(
+        SPARKLINE_CHARACTERS[
+            (count * (len(SPARKLINE_CHARACTERS) - 1) + highest - 1) // highest
+        ]
+        for count in counts
+    )
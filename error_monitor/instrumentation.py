@@ -0,0 +1,231 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from functools import wraps
+from logging import getLogger
+from socket import socket, AF_INET, SOCK_DGRAM, error as socket_error
+from threading import Lock
+from time import time
+
+# Django imports
+from django.conf import settings
+
+
+class NullTimer(object):
+    """
+    Timer that measures nothing, used while instrumentation is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer(object):
+    """
+    Context manager reporting time spent within it to metrics.
+    """
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        self.started = time()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.timing(self.name, time() - self.started)
+        return False
+
+
+class Metrics(object):
+    """
+    Timings and counters of error_monitor reported to sink.
+    Without sink timers and counters cost one attribute check.
+    """
+
+    def __init__(self, sink=None):
+        self.sink = sink
+
+    def timer(self, name):
+        """
+        Return context manager timing its block as name.
+        """
+        if self.sink is None:
+            return NULL_TIMER
+        return Timer(self, name)
+
+    def timed(self, name):
+        """
+        Return decorator timing calls of function as name.
+        Functions are left undecorated while there is no sink.
+        """
+        def decorator(function):
+            if self.sink is None:
+                return function
+
+            @wraps(function)
+            def timed_function(*args, **kwargs):
+                with self.timer(name):
+                    return function(*args, **kwargs)
+            return timed_function
+        return decorator
+
+    def timing(self, name, seconds):
+        """
+        Report that name took seconds.
+        """
+        if self.sink is not None:
+            self.sink.timing(name, seconds)
+
+    def increment(self, name, value=1):
+        """
+        Add value to counter name.
+        """
+        if self.sink is not None:
+            self.sink.increment(name, value)
+
+
+class RegistrySink(object):
+    """
+    Sink keeping counters and timing statistics in process memory.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.timings = {}
+        self._lock = Lock()
+
+    def timing(self, name, seconds):
+        """
+        Add seconds to statistics of name.
+        """
+        with self._lock:
+            statistics = self.timings.get(name)
+            if statistics is None:
+                self.timings[name] = [1, seconds, seconds]
+            else:
+                statistics[0] += 1
+                statistics[1] += seconds
+                if seconds > statistics[2]:
+                    statistics[2] = seconds
+
+    def increment(self, name, value):
+        """
+        Add value to counter name.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        """
+        Return counters and timings in milliseconds.
+        """
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'timings': dict(
+                    (
+                        name,
+                        {
+                            'count': count,
+                            'total_ms': total * 1000,
+                            'mean_ms': total / count * 1000,
+                            'max_ms': highest * 1000,
+                        }
+                    )
+                    for name, (count, total, highest) in self.timings.items()
+                ),
+            }
+
+    def reset(self):
+        """
+        Forget everything registered.
+        """
+        with self._lock:
+            self.counters = {}
+            self.timings = {}
+
+
+class LoggingSink(object):
+    """
+    Sink writing every timing and counter to logger at debug level.
+    """
+
+    def __init__(self, logger_name='error_monitor.metrics'):
+        self.logger = getLogger(logger_name)
+
+    def timing(self, name, seconds):
+        """
+        Log timing of name.
+        """
+        self.logger.debug('%s: %.3f ms', name, seconds * 1000)
+
+    def increment(self, name, value):
+        """
+        Log increment of counter name.
+        """
+        self.logger.debug('%s: +%d', name, value)
+
+
+class StatsdSink(object):
+    """
+    Sink sending timings and counters to statsd over UDP.
+    Packets that can not be sent are lost.
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='error_monitor'):
+        self.address = (host, port)
+        self.prefix = prefix + '.' if prefix else ''
+        self.socket = socket(AF_INET, SOCK_DGRAM)
+
+    def _send(self, data):
+        try:
+            self.socket.sendto(data, self.address)
+        except socket_error:
+            pass
+
+    def timing(self, name, seconds):
+        """
+        Send timing of name in milliseconds.
+        """
+        self._send('%s%s:%.3f|ms' % (self.prefix, name, seconds * 1000))
+
+    def increment(self, name, value):
+        """
+        Send increment of counter name.
+        """
+        self._send('%s%s:%d|c' % (self.prefix, name, value))
+
+
+def get_sink(name):
+    """
+    Return sink configured by ERROR_MONITOR_METRICS: None,
+    'registry', 'logging' or 'statsd'.
+    """
+    if not name:
+        return None
+    if name == 'registry':
+        return RegistrySink()
+    if name == 'logging':
+        return LoggingSink()
+    if name == 'statsd':
+        return StatsdSink(
+            host=getattr(settings, 'ERROR_MONITOR_STATSD_HOST', 'localhost'),
+            port=getattr(settings, 'ERROR_MONITOR_STATSD_PORT', 8125),
+            prefix=getattr(settings, 'ERROR_MONITOR_STATSD_PREFIX', 'error_monitor')
+        )
+    raise ValueError('Unknown ERROR_MONITOR_METRICS sink: %r' % name)
+
+
+METRICS = Metrics(get_sink(getattr(settings, 'ERROR_MONITOR_METRICS', None)))
@@ -3,6 +3,9 @@ Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
 License: BSD
 """
 
+# Standard imports
+from optparse import make_option
+
 # Django imports
 from django.core.management.base import BaseCommand
 
@@ -12,6 +15,31 @@ class Command(BaseCommand):
 
     help = 'Collect exceptions from servers'
 
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--full',
+            action='store_true',
+            dest='full',
+            default=False,
+            help='Collect all exceptions instead of changed ones'
+        ),
+    )
+
     def handle(self, *args, **options):
-        from error_monitor.functions import collect_exceptions_from_servers
-        collect_exceptions_from_servers()
+        from error_monitor.functions import collect_exceptions_from_servers, \
+            TRANSPORT
+        failed_servers = collect_exceptions_from_servers(full=options['full'])
+
+        if int(options.get('verbosity', 1)) > 1:
+            print "=> Transport statistics:"
+            for host, counters in sorted(TRANSPORT.get_stats().items()):
+                print (
+                    "   %(host)s: %(requests)d requests, %(errors)d errors, "
+                    "%(bytes_sent)d bytes sent, %(bytes_received)d bytes "
+                    "received, %(seconds).3f seconds"
+                ) % dict(counters, host=host)
+
+        if failed_servers:
+            print "=> Failed servers:"
+            for server, error in sorted(failed_servers.items()):
+                print "   %s: %s" % (server, error)
@@ -0,0 +1,34 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from optparse import make_option
+
+# Django imports
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """ Write occurrence counters from shared cache to database """
+
+    help = 'Write occurrences counted with ERROR_MONITOR_CACHE_COUNTERS'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--all',
+            action='store_true',
+            dest='all',
+            default=False,
+            help='Write counters of current epochs too'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        from error_monitor.functions import COUNTERS
+        if COUNTERS is None:
+            print "=> ERROR_MONITOR_CACHE_COUNTERS is disabled"
+            return
+        written = COUNTERS.flush(final=options['all'])
+        print "=> Written counters of %d exceptions" % written
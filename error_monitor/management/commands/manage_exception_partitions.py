@@ -0,0 +1,103 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from optparse import make_option
+
+# Django imports
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+INDEXES = (
+    ('signature', '(signature)'),
+    ('hash', '(hash)'),
+    ('date', '(date)'),
+    ('modified', '(modified)'),
+    ('trend', '(trend)'),
+    ('body_id', '(body_id)'),
+    ('path_prefix', '(path text_pattern_ops)'),
+)
+TRIGRAM_INDEXES = (
+    ('title_trgm', 'USING gin (UPPER(title::text) gin_trgm_ops)'),
+    ('path_trgm', 'USING gin (UPPER(path::text) gin_trgm_ops)'),
+)
+
+
+class Command(BaseCommand):
+    """ Create partitions of exceptions table ahead of time """
+
+    help = (
+        'Create monthly or weekly partitions of exceptions table '
+        'for ERROR_MONITOR_PARTITIONS_AHEAD periods ahead, '
+        'converting table to partitioned one with --convert'
+    )
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--convert',
+            action='store_true',
+            dest='convert',
+            default=False,
+            help='Convert exceptions table to partitioned one first'
+        ),
+        make_option(
+            '--ahead',
+            type='int',
+            dest='ahead',
+            default=None,
+            help='Number of periods after current one to create partitions for'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        from error_monitor.functions import PARTITION_PERIOD, \
+            PARTITIONS_AHEAD, DATABASE
+        from error_monitor.models import ProjectException, ExceptionBody
+        from error_monitor.partitions import convert_to_partitioned, \
+            ensure_partitions, check_database, PartitioningError, PERIODS
+
+        if PARTITION_PERIOD not in PERIODS:
+            raise CommandError(
+                'ERROR_MONITOR_PARTITION_PERIOD has to be one of: %s' % (
+                    ', '.join(PERIODS)
+                )
+            )
+
+        table = ProjectException._meta.db_table  # IGNORE:protected-access
+        ahead = PARTITIONS_AHEAD if options['ahead'] is None else \
+            options['ahead']
+
+        try:
+            check_database(DATABASE)
+            if options['convert']:
+                cursor = connections[DATABASE].cursor()
+                cursor.execute(
+                    "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+                )
+                indexes = INDEXES + (TRIGRAM_INDEXES if cursor.fetchone() else ())
+                convert_to_partitioned(
+                    table,
+                    PARTITION_PERIOD,
+                    ahead,
+                    DATABASE,
+                    indexes=[
+                        ('%s_%s' % (table, name), definition)
+                        for name, definition in indexes
+                    ],
+                    foreign_keys=[
+                        (
+                            'body_id',
+                            ExceptionBody._meta.db_table  # IGNORE:protected-access
+                        )
+                    ]
+                )
+                print "=> %s is converted to partitioned table" % table
+
+            created = ensure_partitions(table, PARTITION_PERIOD, ahead, DATABASE)
+        except PartitioningError, error:
+            raise CommandError(str(error))
+
+        print "=> Created %d partitions" % len(created)
@@ -0,0 +1,31 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from optparse import make_option
+
+# Django imports
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """ Delete expired exceptions """
+
+    help = 'Delete exceptions older than ERROR_MONITOR_EXCEPTION_LIFETIME days'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--chunk-size',
+            type='int',
+            dest='chunk_size',
+            default=None,
+            help='Number of exceptions deleted per query'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        from error_monitor.functions import purge_exceptions, PURGE_CHUNK_SIZE
+        deleted = purge_exceptions(options['chunk_size'] or PURGE_CHUNK_SIZE)
+        print "=> Deleted %d expired exceptions" % deleted
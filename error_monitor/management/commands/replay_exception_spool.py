@@ -0,0 +1,35 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from optparse import make_option
+
+# Django imports
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """ Write spooled exceptions to database """
+
+    help = 'Write exceptions spooled to ERROR_MONITOR_SPOOL_PATH ' \
+        'while database was unavailable'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--batch-size',
+            type='int',
+            dest='batch_size',
+            default=None,
+            help='Number of spooled occurrences written at once'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        from error_monitor.functions import replay_exception_spool, \
+            BULK_CREATE_BATCH
+        replayed = replay_exception_spool(
+            options['batch_size'] or BULK_CREATE_BATCH
+        )
+        print "=> Replayed %d spooled exceptions" % replayed
@@ -0,0 +1,31 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from optparse import make_option
+
+# Django imports
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """ Downsample occurrence histogram and update exception trends """
+
+    help = 'Downsample old occurrence buckets and update exception trends'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--chunk-size',
+            type='int',
+            dest='chunk_size',
+            default=None,
+            help='Number of buckets downsampled per query'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        from error_monitor.functions import rollup_histogram, PURGE_CHUNK_SIZE
+        rollup_histogram(options['chunk_size'] or PURGE_CHUNK_SIZE)
+        print "=> Occurrence histogram is rolled up"
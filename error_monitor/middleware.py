@@ -4,7 +4,8 @@ License: BSD
 """
 
 # Project related imports
-from .functions import record_exception
+from .functions import record_exception, record_exception_async, \
+    ASYNC_RECORDING
 
 
 class ExceptionMiddleware(object):  # IGNORE:too-few-public-methods
@@ -15,6 +16,10 @@ class ExceptionMiddleware(object):  # IGNORE:too-few-public-methods
     def process_exception(self, request, exception):  # IGNORE:no-self-use
         """
         Get exception and save it in database.
+        With ERROR_MONITOR_ASYNC_RECORDING saving is done in background.
         """
 
-        record_exception(exception=exception, request=request)
+        if ASYNC_RECORDING:
+            record_exception_async(exception=exception, request=request)
+        else:
+            record_exception(exception=exception, request=request)
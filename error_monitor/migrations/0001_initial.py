@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# pylint: skip-file
+from south.db import db
+from south.v2 import SchemaMigration
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'ProjectException'
+        db.create_table('error_monitor_projectexception', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('path', self.gf('django.db.models.fields.CharField')(max_length=255)),
+            ('contents', self.gf('django.db.models.fields.TextField')()),
+            ('title', self.gf('django.db.models.fields.TextField')(null=True, blank=True)),
+            ('date', self.gf('django.db.models.fields.DateTimeField')(auto_now_add=True, blank=True)),
+            ('count', self.gf('django.db.models.fields.PositiveIntegerField')()),
+            ('hash', self.gf('django.db.models.fields.CharField')(max_length=100)),
+        ))
+        db.send_create_signal('error_monitor', ['ProjectException'])
+
+        # Adding model 'CollectedProjectException'
+        db.create_table('error_monitor_collectedprojectexception', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('path', self.gf('django.db.models.fields.CharField')(max_length=255)),
+            ('contents', self.gf('django.db.models.fields.TextField')()),
+            ('title', self.gf('django.db.models.fields.TextField')(null=True, blank=True)),
+            ('date', self.gf('django.db.models.fields.DateTimeField')(auto_now_add=True, blank=True)),
+            ('count', self.gf('django.db.models.fields.PositiveIntegerField')()),
+            ('hash', self.gf('django.db.models.fields.CharField')(max_length=100)),
+            ('servers', self.gf('django.db.models.fields.TextField')()),
+            ('server_count', self.gf('django.db.models.fields.PositiveIntegerField')(default=0)),
+        ))
+        db.send_create_signal('error_monitor', ['CollectedProjectException'])
+
+    def backwards(self, orm):
+        # Deleting model 'ProjectException'
+        db.delete_table('error_monitor_projectexception')
+
+        # Deleting model 'CollectedProjectException'
+        db.delete_table('error_monitor_collectedprojectexception')
+
+    models = {
+        'error_monitor.collectedprojectexception': {
+            'Meta': {'object_name': 'CollectedProjectException'},
+            'contents': ('django.db.models.fields.TextField', [], {}),
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'hash': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'server_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'servers': ('django.db.models.fields.TextField', [], {}),
+            'title': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'error_monitor.projectexception': {
+            'Meta': {'object_name': 'ProjectException'},
+            'contents': ('django.db.models.fields.TextField', [], {}),
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'hash': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'title': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['error_monitor']
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# pylint: skip-file
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db.models import F
+
+from error_monitor.models import get_signature
+
+
+class Migration(SchemaMigration):
+
+    def fill_signatures(self, model):
+        """
+        Fill signatures and merge rows that share one,
+        keeping the most recent row of each group.
+        """
+        kept = {}
+        for exception_id, location_hash, title, path, count in \
+                model.objects.order_by('-date', '-id').values_list(
+                    'id', 'hash', 'title', 'path', 'count'
+                ).iterator():
+            signature = get_signature(location_hash, title, path)
+            if signature in kept:
+                model.objects.filter(id=kept[signature]).update(
+                    count=F('count') + count
+                )
+                model.objects.filter(id=exception_id).delete()
+            else:
+                kept[signature] = exception_id
+                model.objects.filter(id=exception_id).update(
+                    signature=signature
+                )
+
+    def forwards(self, orm):
+        for table, model in (
+            ('error_monitor_projectexception', orm.ProjectException),
+            (
+                'error_monitor_collectedprojectexception',
+                orm.CollectedProjectException
+            ),
+        ):
+            # Adding field 'signature'
+            db.add_column(table, 'signature',
+                          self.gf('django.db.models.fields.CharField')(default='', max_length=32),
+                          keep_default=False)
+
+            if not db.dry_run:
+                self.fill_signatures(model)
+
+            # Adding unique constraint on 'signature'
+            db.create_unique(table, ['signature'])
+
+            # Adding index on 'date'
+            db.create_index(table, ['date'])
+
+            # Adding index on 'hash'
+            db.create_index(table, ['hash'])
+
+    def backwards(self, orm):
+        for table in (
+            'error_monitor_projectexception',
+            'error_monitor_collectedprojectexception'
+        ):
+            # Removing index on 'hash'
+            db.delete_index(table, ['hash'])
+
+            # Removing index on 'date'
+            db.delete_index(table, ['date'])
+
+            # Removing unique constraint on 'signature'
+            db.delete_unique(table, ['signature'])
+
+            # Deleting field 'signature'
+            db.delete_column(table, 'signature')
+
+    models = {
+        'error_monitor.collectedprojectexception': {
+            'Meta': {'object_name': 'CollectedProjectException'},
+            'contents': ('django.db.models.fields.TextField', [], {}),
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'hash': ('django.db.models.fields.CharField', [], {'max_length': '100', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'server_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'servers': ('django.db.models.fields.TextField', [], {}),
+            'signature': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '32'}),
+            'title': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'error_monitor.projectexception': {
+            'Meta': {'object_name': 'ProjectException'},
+            'contents': ('django.db.models.fields.TextField', [], {}),
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'hash': ('django.db.models.fields.CharField', [], {'max_length': '100', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'signature': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '32'}),
+            'title': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['error_monitor']
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# pylint: skip-file
+from south.db import db
+from south.v2 import SchemaMigration
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'CollectedExceptionSource'
+        db.create_table('error_monitor_collectedexceptionsource', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('exception', self.gf('django.db.models.fields.related.ForeignKey')(related_name='sources', to=orm['error_monitor.CollectedProjectException'])),
+            ('server', self.gf('django.db.models.fields.CharField')(max_length=255, db_index=True)),
+            ('count', self.gf('django.db.models.fields.PositiveIntegerField')()),
+        ))
+        db.send_create_signal('error_monitor', ['CollectedExceptionSource'])
+
+        # Adding unique constraint on 'CollectedExceptionSource', fields ['exception', 'server']
+        db.create_unique('error_monitor_collectedexceptionsource', ['exception_id', 'server'])
+
+        # Adding model 'CollectedServer'
+        db.create_table('error_monitor_collectedserver', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('server', self.gf('django.db.models.fields.CharField')(unique=True, max_length=255)),
+            ('cursor', self.gf('django.db.models.fields.DateTimeField')(null=True, blank=True)),
+            ('synced', self.gf('django.db.models.fields.DateTimeField')(null=True, blank=True)),
+        ))
+        db.send_create_signal('error_monitor', ['CollectedServer'])
+
+        # Collected exceptions have no per-server counts yet,
+        # they are collected again by the next full synchronization.
+        if not db.dry_run:
+            orm.CollectedProjectException.objects.all().delete()
+
+    def backwards(self, orm):
+        # Removing unique constraint on 'CollectedExceptionSource', fields ['exception', 'server']
+        db.delete_unique('error_monitor_collectedexceptionsource', ['exception_id', 'server'])
+
+        # Deleting model 'CollectedExceptionSource'
+        db.delete_table('error_monitor_collectedexceptionsource')
+
+        # Deleting model 'CollectedServer'
+        db.delete_table('error_monitor_collectedserver')
+
+    models = {
+        'error_monitor.collectedexceptionsource': {
+            'Meta': {'unique_together': "(('exception', 'server'),)", 'object_name': 'CollectedExceptionSource'},
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'exception': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'sources'", 'to': "orm['error_monitor.CollectedProjectException']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'server': ('django.db.models.fields.CharField', [], {'max_length': '255', 'db_index': 'True'})
+        },
+        'error_monitor.collectedprojectexception': {
+            'Meta': {'object_name': 'CollectedProjectException'},
+            'contents': ('django.db.models.fields.TextField', [], {}),
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'hash': ('django.db.models.fields.CharField', [], {'max_length': '100', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'server_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'servers': ('django.db.models.fields.TextField', [], {}),
+            'signature': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '32'}),
+            'title': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'error_monitor.collectedserver': {
+            'Meta': {'object_name': 'CollectedServer'},
+            'cursor': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'server': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '255'}),
+            'synced': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'error_monitor.projectexception': {
+            'Meta': {'object_name': 'ProjectException'},
+            'contents': ('django.db.models.fields.TextField', [], {}),
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'hash': ('django.db.models.fields.CharField', [], {'max_length': '100', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'signature': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '32'}),
+            'title': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['error_monitor']
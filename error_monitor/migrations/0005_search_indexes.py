@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# pylint: skip-file
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+TABLES = (
+    'error_monitor_projectexception',
+    'error_monitor_collectedprojectexception'
+)
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        if db.backend_name != 'postgres':
+            return
+
+        # Trigram indexes serve icontains lookups of admin search,
+        # pattern index serves path prefix filter.
+        db.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table in TABLES:
+            for column in ('title', 'path'):
+                db.execute(
+                    'CREATE INDEX %(table)s_%(column)s_trgm ON %(table)s '
+                    'USING gin (UPPER(%(column)s::text) gin_trgm_ops)' % {
+                        'table': table, 'column': column
+                    }
+                )
+            db.execute(
+                'CREATE INDEX %(table)s_path_prefix ON %(table)s '
+                '(path text_pattern_ops)' % {'table': table}
+            )
+
+    def backwards(self, orm):
+        if db.backend_name != 'postgres':
+            return
+
+        for table in TABLES:
+            for index in ('title_trgm', 'path_trgm', 'path_prefix'):
+                db.execute('DROP INDEX IF EXISTS %s_%s' % (table, index))
+
+    models = {
+        'error_monitor.collectedexceptionsource': {
+            'Meta': {'unique_together': "(('exception', 'server'),)", 'object_name': 'CollectedExceptionSource'},
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'exception': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'sources'", 'to': "orm['error_monitor.CollectedProjectException']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'server': ('django.db.models.fields.CharField', [], {'max_length': '255', 'db_index': 'True'})
+        },
+        'error_monitor.collectedprojectexception': {
+            'Meta': {'object_name': 'CollectedProjectException'},
+            'body': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['error_monitor.ExceptionBody']", 'null': 'True', 'on_delete': 'models.SET_NULL', 'blank': 'True'}),
+            'contents': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'hash': ('django.db.models.fields.CharField', [], {'max_length': '100', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'server_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'servers': ('django.db.models.fields.TextField', [], {}),
+            'signature': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '32'}),
+            'title': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'error_monitor.collectedserver': {
+            'Meta': {'object_name': 'CollectedServer'},
+            'cursor': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'server': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '255'}),
+            'synced': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'error_monitor.exceptionbody': {
+            'Meta': {'object_name': 'ExceptionBody'},
+            'data': ('django.db.models.fields.TextField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'digest': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'error_monitor.projectexception': {
+            'Meta': {'object_name': 'ProjectException'},
+            'body': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['error_monitor.ExceptionBody']", 'null': 'True', 'on_delete': 'models.SET_NULL', 'blank': 'True'}),
+            'contents': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'hash': ('django.db.models.fields.CharField', [], {'max_length': '100', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'signature': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '32'}),
+            'title': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['error_monitor']
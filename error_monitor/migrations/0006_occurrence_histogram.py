@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# pylint: skip-file
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'OccurrenceBucket'
+        db.create_table('error_monitor_occurrencebucket', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('signature', self.gf('django.db.models.fields.CharField')(max_length=32)),
+            ('resolution', self.gf('django.db.models.fields.PositiveIntegerField')()),
+            ('start', self.gf('django.db.models.fields.DateTimeField')(db_index=True)),
+            ('count', self.gf('django.db.models.fields.PositiveIntegerField')()),
+        ))
+        db.send_create_signal('error_monitor', ['OccurrenceBucket'])
+
+        # Adding unique constraint on 'OccurrenceBucket', fields ['signature', 'resolution', 'start']
+        db.create_unique('error_monitor_occurrencebucket', ['signature', 'resolution', 'start'])
+
+        # Adding field 'ProjectException.trend'
+        db.add_column('error_monitor_projectexception', 'trend',
+                      self.gf('django.db.models.fields.IntegerField')(default=0, db_index=True),
+                      keep_default=False)
+
+    def backwards(self, orm):
+        # Deleting field 'ProjectException.trend'
+        db.delete_column('error_monitor_projectexception', 'trend')
+
+        # Removing unique constraint on 'OccurrenceBucket', fields ['signature', 'resolution', 'start']
+        db.delete_unique('error_monitor_occurrencebucket', ['signature', 'resolution', 'start'])
+
+        # Deleting model 'OccurrenceBucket'
+        db.delete_table('error_monitor_occurrencebucket')
+
+    models = {
+        'error_monitor.collectedexceptionsource': {
+            'Meta': {'unique_together': "(('exception', 'server'),)", 'object_name': 'CollectedExceptionSource'},
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'exception': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'sources'", 'to': "orm['error_monitor.CollectedProjectException']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'server': ('django.db.models.fields.CharField', [], {'max_length': '255', 'db_index': 'True'})
+        },
+        'error_monitor.collectedprojectexception': {
+            'Meta': {'object_name': 'CollectedProjectException'},
+            'body': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['error_monitor.ExceptionBody']", 'null': 'True', 'on_delete': 'models.SET_NULL', 'blank': 'True'}),
+            'contents': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'hash': ('django.db.models.fields.CharField', [], {'max_length': '100', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'server_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'servers': ('django.db.models.fields.TextField', [], {}),
+            'signature': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '32'}),
+            'title': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'error_monitor.collectedserver': {
+            'Meta': {'object_name': 'CollectedServer'},
+            'cursor': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'server': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '255'}),
+            'synced': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'error_monitor.exceptionbody': {
+            'Meta': {'object_name': 'ExceptionBody'},
+            'data': ('django.db.models.fields.TextField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'digest': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'error_monitor.occurrencebucket': {
+            'Meta': {'unique_together': "(('signature', 'resolution', 'start'),)", 'object_name': 'OccurrenceBucket'},
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'resolution': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'signature': ('django.db.models.fields.CharField', [], {'max_length': '32'}),
+            'start': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'})
+        },
+        'error_monitor.projectexception': {
+            'Meta': {'object_name': 'ProjectException'},
+            'body': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['error_monitor.ExceptionBody']", 'null': 'True', 'on_delete': 'models.SET_NULL', 'blank': 'True'}),
+            'contents': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'hash': ('django.db.models.fields.CharField', [], {'max_length': '100', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'signature': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '32'}),
+            'title': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'trend': ('django.db.models.fields.IntegerField', [], {'default': '0', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['error_monitor']
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# pylint: skip-file
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'ExceptionVariant'
+        db.create_table('error_monitor_exceptionvariant', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('signature', self.gf('django.db.models.fields.CharField')(max_length=32, db_index=True)),
+            ('digest', self.gf('django.db.models.fields.CharField')(max_length=32)),
+            ('title', self.gf('django.db.models.fields.TextField')(null=True, blank=True)),
+            ('path', self.gf('django.db.models.fields.CharField')(max_length=255)),
+            ('date', self.gf('django.db.models.fields.DateTimeField')(auto_now_add=True, db_index=True, blank=True)),
+        ))
+        db.send_create_signal('error_monitor', ['ExceptionVariant'])
+
+        # Adding unique constraint on 'ExceptionVariant', fields ['signature', 'digest']
+        db.create_unique('error_monitor_exceptionvariant', ['signature', 'digest'])
+
+    def backwards(self, orm):
+        # Removing unique constraint on 'ExceptionVariant', fields ['signature', 'digest']
+        db.delete_unique('error_monitor_exceptionvariant', ['signature', 'digest'])
+
+        # Deleting model 'ExceptionVariant'
+        db.delete_table('error_monitor_exceptionvariant')
+
+    models = {
+        'error_monitor.collectedexceptionsource': {
+            'Meta': {'unique_together': "(('exception', 'server'),)", 'object_name': 'CollectedExceptionSource'},
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'exception': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'sources'", 'to': "orm['error_monitor.CollectedProjectException']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'server': ('django.db.models.fields.CharField', [], {'max_length': '255', 'db_index': 'True'})
+        },
+        'error_monitor.collectedprojectexception': {
+            'Meta': {'object_name': 'CollectedProjectException'},
+            'body': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['error_monitor.ExceptionBody']", 'null': 'True', 'on_delete': 'models.SET_NULL', 'blank': 'True'}),
+            'contents': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'hash': ('django.db.models.fields.CharField', [], {'max_length': '100', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'server_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'servers': ('django.db.models.fields.TextField', [], {}),
+            'signature': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '32'}),
+            'title': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'error_monitor.collectedserver': {
+            'Meta': {'object_name': 'CollectedServer'},
+            'cursor': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'server': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '255'}),
+            'synced': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'error_monitor.exceptionbody': {
+            'Meta': {'object_name': 'ExceptionBody'},
+            'data': ('django.db.models.fields.TextField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'digest': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'error_monitor.exceptionvariant': {
+            'Meta': {'unique_together': "(('signature', 'digest'),)", 'object_name': 'ExceptionVariant'},
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'digest': ('django.db.models.fields.CharField', [], {'max_length': '32'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'signature': ('django.db.models.fields.CharField', [], {'max_length': '32', 'db_index': 'True'}),
+            'title': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'error_monitor.occurrencebucket': {
+            'Meta': {'unique_together': "(('signature', 'resolution', 'start'),)", 'object_name': 'OccurrenceBucket'},
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'resolution': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'signature': ('django.db.models.fields.CharField', [], {'max_length': '32'}),
+            'start': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'})
+        },
+        'error_monitor.projectexception': {
+            'Meta': {'object_name': 'ProjectException'},
+            'body': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['error_monitor.ExceptionBody']", 'null': 'True', 'on_delete': 'models.SET_NULL', 'blank': 'True'}),
+            'contents': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'hash': ('django.db.models.fields.CharField', [], {'max_length': '100', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'signature': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '32'}),
+            'title': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'trend': ('django.db.models.fields.IntegerField', [], {'default': '0', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['error_monitor']
@@ -3,9 +3,76 @@ Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
 License: BSD
 """
 
+# Standard imports
+from hashlib import md5
+from base64 import b64encode, b64decode
+from zlib import compress, decompress
+
 # Django imports
+from django.utils import timezone
 from django.db.models import Model, TextField, CharField, \
-    PositiveIntegerField, DateTimeField
+    PositiveIntegerField, IntegerField, DateTimeField, ForeignKey, SET_NULL
+
+# Project imports
+from .snapshots import is_snapshot
+
+
+COMPRESSED_PREFIX = 'zlib:'
+
+
+def get_signature(location_hash, title, path):
+    """
+    Return unique key of exception built from its hash, title and path.
+    """
+    return md5(
+        '\0'.join(
+            value.encode('utf-8') if isinstance(value, unicode) else value
+            for value in (location_hash, title or '', path)
+        )
+    ).hexdigest()
+
+
+def pack_contents(contents):
+    """
+    Compress exception contents for storing. Snapshots are stored as is,
+    because they are compressed already.
+    """
+    if is_snapshot(contents):
+        return contents
+    if isinstance(contents, unicode):
+        contents = contents.encode('utf-8')
+    return COMPRESSED_PREFIX + b64encode(compress(contents))
+
+
+def unpack_contents(data):
+    """
+    Restore exception contents packed by pack_contents.
+    """
+    if data.startswith(COMPRESSED_PREFIX):
+        return decompress(b64decode(data[len(COMPRESSED_PREFIX):])).decode(
+            'utf-8'
+        )
+    return data
+
+
+class ExceptionBody(Model):
+    """
+    Table for storing compressed exception contents
+    shared by exceptions and addressed by digest of contents.
+    """
+
+    digest = CharField(max_length=40, unique=True)
+    data = TextField()
+    date = DateTimeField(auto_now_add=True, db_index=True)
+
+    def __unicode__(self):
+        return self.digest
+
+    def get_contents(self):
+        """
+        Return unpacked contents.
+        """
+        return unpack_contents(self.data)
 
 
 class ProjectException(Model):
@@ -14,15 +81,33 @@ class ProjectException(Model):
     """
 
     path = CharField(max_length=255)
-    contents = TextField()
+    contents = TextField(blank=True)
+    body = ForeignKey(ExceptionBody, null=True, blank=True, on_delete=SET_NULL)
     title = TextField(null=True, blank=True)
-    date = DateTimeField(auto_now_add=True)
+    # Not auto_now_add, so that occurrences keep their own dates on insert.
+    date = DateTimeField(default=timezone.now, db_index=True)
+    # Updated on every write, even of older occurrences, so that changes
+    # are synchronized by it rather than by date.
+    modified = DateTimeField(default=timezone.now, db_index=True)
     count = PositiveIntegerField()
-    hash = CharField(max_length=100)
+    hash = CharField(max_length=100, db_index=True)
+    signature = CharField(max_length=32, unique=True)
+    trend = IntegerField(default=0, db_index=True)
 
     def __unicode__(self):
         return self.title or 'No title'
 
+    def save(self, *args, **kwargs):
+        if not self.signature:
+            self.signature = get_signature(self.hash, self.title, self.path)
+        super(ProjectException, self).save(*args, **kwargs)
+
+    def get_contents(self):
+        """
+        Return contents of exception body or contents stored in place.
+        """
+        return self.body.get_contents() if self.body_id else self.contents
+
 
 class CollectedProjectException(Model):
     """
@@ -30,13 +115,93 @@ class CollectedProjectException(Model):
     """
 
     path = CharField(max_length=255)
-    contents = TextField()
+    contents = TextField(blank=True)
+    body = ForeignKey(ExceptionBody, null=True, blank=True, on_delete=SET_NULL)
     title = TextField(null=True, blank=True)
-    date = DateTimeField(auto_now_add=True)
+    date = DateTimeField(auto_now_add=True, db_index=True)
     count = PositiveIntegerField()
-    hash = CharField(max_length=100)
+    hash = CharField(max_length=100, db_index=True)
+    signature = CharField(max_length=32, unique=True)
     servers = TextField()
     server_count = PositiveIntegerField(default=0)
 
     def __unicode__(self):
         return self.title or 'No title'
+
+    def save(self, *args, **kwargs):
+        if not self.signature:
+            self.signature = get_signature(self.hash, self.title, self.path)
+        super(CollectedProjectException, self).save(*args, **kwargs)
+
+    def get_contents(self):
+        """
+        Return contents of exception body or contents stored in place.
+        """
+        return self.body.get_contents() if self.body_id else self.contents
+
+
+class CollectedExceptionSource(Model):
+    """
+    Table for storing count of collected exception on each server.
+    """
+
+    exception = ForeignKey(CollectedProjectException, related_name='sources')
+    server = CharField(max_length=255, db_index=True)
+    count = PositiveIntegerField()
+    synced = DateTimeField(null=True, blank=True)
+
+    class Meta:  # IGNORE:too-few-public-methods
+        unique_together = (('exception', 'server'),)
+
+    def __unicode__(self):
+        return self.server
+
+
+class CollectedServer(Model):
+    """
+    Table for storing synchronization cursor of each server.
+    """
+
+    server = CharField(max_length=255, unique=True)
+    cursor = DateTimeField(null=True, blank=True)
+    synced = DateTimeField(null=True, blank=True)
+
+    def __unicode__(self):
+        return self.server
+
+
+class OccurrenceBucket(Model):
+    """
+    Table for storing number of exception occurrences
+    within time bucket of resolution seconds.
+    """
+
+    signature = CharField(max_length=32)
+    resolution = PositiveIntegerField()
+    start = DateTimeField(db_index=True)
+    count = PositiveIntegerField()
+
+    class Meta:  # IGNORE:too-few-public-methods
+        unique_together = (('signature', 'resolution', 'start'),)
+
+    def __unicode__(self):
+        return self.signature
+
+
+class ExceptionVariant(Model):
+    """
+    Table for storing sample of raw titles and paths
+    of exception grouped by normalized title and path.
+    """
+
+    signature = CharField(max_length=32, db_index=True)
+    digest = CharField(max_length=32)
+    title = TextField(null=True, blank=True)
+    path = CharField(max_length=255)
+    date = DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:  # IGNORE:too-few-public-methods
+        unique_together = (('signature', 'digest'),)
+
+    def __unicode__(self):
+        return self.title or 'No title'
@@ -0,0 +1,183 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from collections import deque
+from re import compile as compile_regex, I
+from threading import Thread, Lock, Event
+from os import getpid
+from time import time
+from traceback import print_exc
+
+
+REGEX_CHARACTERS = frozenset('.^$*+?{}[]\\|()')
+
+
+class KeywordMatcher(object):  # IGNORE:too-few-public-methods
+    """
+    Aho-Corasick automaton searching for any of many keywords
+    in one case-insensitive pass over text.
+    """
+
+    def __init__(self, words):
+        self.transitions = [{}]
+        self.fallbacks = [0]
+        self.terminal = [False]
+
+        for word in words:
+            node = 0
+            for character in word.lower():
+                next_node = self.transitions[node].get(character)
+                if next_node is None:
+                    next_node = len(self.transitions)
+                    self.transitions.append({})
+                    self.fallbacks.append(0)
+                    self.terminal.append(False)
+                    self.transitions[node][character] = next_node
+                node = next_node
+            self.terminal[node] = True
+
+        queue = deque(self.transitions[0].values())
+        while queue:
+            node = queue.popleft()
+            for character, next_node in self.transitions[node].items():
+                queue.append(next_node)
+                fallback = self.fallbacks[node]
+                while fallback and character not in self.transitions[fallback]:
+                    fallback = self.fallbacks[fallback]
+                fallback = self.transitions[fallback].get(character, 0)
+                if fallback == next_node:
+                    fallback = 0
+                self.fallbacks[next_node] = fallback
+                self.terminal[next_node] = (
+                    self.terminal[next_node] or self.terminal[fallback]
+                )
+
+    def search(self, text):
+        """
+        Check whether text contains any of keywords.
+        """
+        if self.terminal[0]:
+            return True
+
+        node = 0
+        for character in text.lower():
+            while node and character not in self.transitions[node]:
+                node = self.fallbacks[node]
+            node = self.transitions[node].get(character, 0)
+            if self.terminal[node]:
+                return True
+        return False
+
+
+def compile_matcher(words, automaton_threshold=32):
+    """
+    Return object which search method tells whether text contains
+    any of words. Short lists and lists with regular expressions
+    are compiled to one regular expression, long lists of plain
+    keywords are matched with Aho-Corasick automaton.
+    """
+    words = list(words)
+    if len(words) >= automaton_threshold and not any(
+        REGEX_CHARACTERS.intersection(word) for word in words
+    ):
+        return KeywordMatcher(words)
+    return compile_regex(r'|'.join(words), I)
+
+
+class NotificationDispatcher(object):
+    """
+    Collect notifications and send them from background thread
+    every interval seconds as one digest. Each key is sent at most once
+    per window seconds, its further occurrences are counted
+    and reported with the next notification.
+    """
+
+    def __init__(self, sender, window=300, interval=60):
+        self.sender = sender
+        self.window = window
+        self.interval = interval
+        self.pending = {}
+        self.notified = {}
+        self.sent = 0
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._wakeup = Event()
+        self._pid = None
+
+    def _ensure_started(self):
+        """
+        Start sending thread on first use and again after fork.
+        """
+        if self._pid == getpid():
+            return
+
+        with self._lock:
+            if self._pid == getpid():
+                return
+
+            thread = Thread(target=self._work, name='error-monitor-mail')
+            thread.daemon = True
+            thread.start()
+            self._pid = getpid()
+
+    def notify(self, key, title):
+        """
+        Register occurrence of key with title.
+        """
+        self._ensure_started()
+        with self._lock:
+            entry = self.pending.get(key)
+            if entry is None:
+                self.pending[key] = [title, 1]
+            else:
+                entry[1] += 1
+
+    def flush(self, force=False):
+        """
+        Send pending notifications of keys that were not sent within
+        window, or all of them if force is set.
+        Return number of sent notifications.
+        """
+        with self._flush_lock:
+            now = time()
+            with self._lock:
+                keys = [
+                    key for key in self.pending
+                    if force or now - self.notified.get(key, 0) >= self.window
+                ]
+                notifications = [
+                    tuple(self.pending.pop(key)) for key in keys
+                ]
+                for key, notified in self.notified.items():
+                    if now - notified >= self.window:
+                        del self.notified[key]
+                for key in keys:
+                    self.notified[key] = now
+
+            if not notifications:
+                return 0
+
+            self.sender(notifications)
+            self.sent += len(notifications)
+            return len(notifications)
+
+    def _work(self):
+        while not self._wakeup.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:  # IGNORE:broad-except
+                print_exc()
+
+    def stop(self):
+        """
+        Stop sending thread and send what is left.
+        """
+        self._wakeup.set()
+        try:
+            return self.flush(force=True)
+        except Exception:  # IGNORE:broad-except
+            print_exc()
+            return 0
@@ -0,0 +1,314 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+
+Range partitioning of PostgreSQL tables by date. Partition of period
+starting at date is named <table>_pYYYYMMDD, rows outside of created
+partitions go to <table>_default. Requires PostgreSQL 11 or newer.
+"""
+
+# Standard imports
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from re import compile as compile_regex
+
+# Django imports
+from django.db import connections, transaction
+
+# Third-party app imports
+from pytz import utc
+
+
+PERIODS = ('month', 'week')
+PARTITION_SUFFIX = compile_regex(r'_p(\d{8})$')
+INSERT_LOCK_KEY = 0x6572726f  # Arbitrary application-wide advisory lock key.
+MINIMAL_SERVER_VERSION = 110000
+BOUND_FORMAT = '%Y-%m-%d %H:%M:%S+00'
+
+
+class PartitioningError(Exception):
+    """
+    Table can not be partitioned or it is not partitioned.
+    """
+
+
+def get_period_start(date, period):
+    """
+    Return UTC midnight that starts month or week of date.
+    """
+    if date.tzinfo is not None:
+        date = date.astimezone(utc)
+    date = datetime(date.year, date.month, date.day, tzinfo=utc)
+    if period == 'week':
+        return date - timedelta(days=date.weekday())
+    return date.replace(day=1)
+
+
+def get_next_period_start(start, period):
+    """
+    Return start of period following the one starting at start.
+    """
+    if period == 'week':
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def get_partition_name(table, start):
+    """
+    Return name of partition of table for period starting at start.
+    """
+    return '%s_p%s' % (table, start.strftime('%Y%m%d'))
+
+
+def check_database(using):
+    """
+    Raise PartitioningError unless database supports partitioning.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        raise PartitioningError('PostgreSQL 11 or newer is required')
+    connection.cursor()
+    if connection.connection.server_version < MINIMAL_SERVER_VERSION:
+        raise PartitioningError('PostgreSQL 11 or newer is required')
+
+
+def is_partitioned(table, using):
+    """
+    Check whether table is partitioned. Tables of databases other
+    than PostgreSQL never are.
+    """
+    if connections[using].vendor != 'postgresql':
+        return False
+
+    cursor = connections[using].cursor()
+    cursor.execute('SELECT relkind FROM pg_class WHERE relname = %s', [table])
+    row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def get_partitions(table, using):
+    """
+    Return sorted list of starts of range partitions of table.
+    """
+    cursor = connections[using].cursor()
+    cursor.execute(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE parent.relname = %s', [table]
+    )
+    starts = []
+    for (name,) in cursor.fetchall():
+        match = PARTITION_SUFFIX.search(name)
+        if match is not None and name == table + match.group(0):
+            starts.append(
+                datetime.strptime(match.group(1), '%Y%m%d').replace(tzinfo=utc)
+            )
+    return sorted(starts)
+
+
+def create_partition(table, start, end, using):
+    """
+    Create partition of table for dates from start to end.
+    Rows of that range that went to default partition are moved into it.
+    """
+    name = get_partition_name(table, start)
+    cursor = connections[using].cursor()
+    cursor.execute(
+        'CREATE TABLE %(name)s (LIKE %(table)s INCLUDING DEFAULTS '
+        'INCLUDING CONSTRAINTS)' % {'name': name, 'table': table}
+    )
+    cursor.execute(
+        'WITH moved AS (DELETE FROM %(table)s_default '
+        'WHERE date >= %%s AND date < %%s RETURNING *) '
+        'INSERT INTO %(name)s SELECT * FROM moved' % {
+            'name': name, 'table': table
+        },
+        [start, end]
+    )
+    # Bounds are passed as plain literals, casts are not accepted before
+    # PostgreSQL 12.
+    cursor.execute(
+        'ALTER TABLE %s ATTACH PARTITION %s FOR VALUES FROM (%%s) TO (%%s)' % (
+            table, name
+        ),
+        [date.strftime(BOUND_FORMAT) for date in (start, end)]
+    )
+    return name
+
+
+def create_partitions(table, period, ahead, using, since=None):
+    """
+    Create missing partitions of table from period of since date,
+    current period by default, to ahead periods after current one.
+    Return names of created partitions.
+    """
+    existing = set(get_partitions(table, using))
+    now = datetime.utcnow().replace(tzinfo=utc)
+    start = get_period_start(since or now, period)
+    last_start = get_period_start(now, period)
+    for _ in range(ahead):
+        last_start = get_next_period_start(last_start, period)
+
+    created = []
+    while start <= last_start:
+        end = get_next_period_start(start, period)
+        if start not in existing:
+            created.append(create_partition(table, start, end, using))
+        start = end
+    return created
+
+
+def ensure_partitions(table, period, ahead, using):
+    """
+    Create partitions of table for current period and ahead periods
+    after it in one transaction. Return names of created partitions.
+    """
+    check_database(using)
+    if not is_partitioned(table, using):
+        raise PartitioningError('%s is not partitioned' % table)
+
+    with transaction.commit_on_success(using=using):
+        return create_partitions(table, period, ahead, using)
+
+
+def drop_expired_partitions(table, period, expiry_date, using):
+    """
+    Drop partitions of table which every date is before expiry_date.
+    Partition ends where next one starts or after period if it is last.
+    Return names of dropped partitions and number of rows they held
+    as estimated by planner statistics, so that they are not counted.
+    """
+    starts = get_partitions(table, using)
+    ends = starts[1:] + [
+        get_next_period_start(starts[-1], period)
+    ] if starts else []
+
+    dropped = []
+    rows = 0
+    cursor = connections[using].cursor()
+    with transaction.commit_on_success(using=using):
+        for start, end in zip(starts, ends):
+            if end > expiry_date:
+                break
+            name = get_partition_name(table, start)
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s', [name]
+            )
+            # Tables that were never analyzed have negative estimate.
+            rows += max(int(cursor.fetchone()[0]), 0)
+            cursor.execute('DROP TABLE %s' % name)
+            dropped.append(name)
+    return dropped, rows
+
+
+def delete_expired_default_rows(table, expiry_date, using, chunk_size):
+    """
+    Delete rows of default partition of table dated before expiry_date
+    in chunks of chunk_size rows, each in its own transaction.
+    Default partition keeps rows outside of created partitions, so it
+    is never dropped as a whole. Return number of deleted rows.
+    """
+    name = '%s_default' % table
+    cursor = connections[using].cursor()
+    cursor.execute('SELECT 1 FROM pg_class WHERE relname = %s', [name])
+    if cursor.fetchone() is None:
+        return 0
+
+    deleted = 0
+    while True:
+        with transaction.commit_on_success(using=using):
+            cursor.execute(
+                'DELETE FROM %(name)s WHERE id IN ('
+                'SELECT id FROM %(name)s WHERE date <= %%s LIMIT %%s)' % {
+                    'name': name
+                },
+                [expiry_date, chunk_size]
+            )
+            chunk_deleted = cursor.rowcount
+        deleted += chunk_deleted
+        if chunk_deleted < chunk_size:
+            return deleted
+
+
+def convert_to_partitioned(table, period, ahead, using, indexes=(),
+                           foreign_keys=()):
+    """
+    Replace table with table partitioned by date holding the same rows.
+    Primary key becomes (id, date), as partition key has to be part
+    of it, and unique constraints are not kept. indexes are
+    (name, definition) pairs and foreign_keys are (column, table) pairs
+    created on partitioned table.
+    Table is locked while it is copied.
+    """
+    check_database(using)
+    cursor = connections[using].cursor()
+    if is_partitioned(table, using):
+        raise PartitioningError('%s is partitioned already' % table)
+
+    old_table = table + '_unpartitioned'
+    with transaction.commit_on_success(using=using):
+        cursor.execute('LOCK TABLE %s IN ACCESS EXCLUSIVE MODE' % table)
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+        cursor.execute('SELECT MIN(date) FROM %s' % table)
+        first_date = cursor.fetchone()[0]
+
+        cursor.execute('ALTER TABLE %s RENAME TO %s' % (table, old_table))
+        cursor.execute(
+            'CREATE TABLE %(table)s (LIKE %(old_table)s INCLUDING DEFAULTS '
+            'INCLUDING CONSTRAINTS) PARTITION BY RANGE (date)' % {
+                'table': table, 'old_table': old_table
+            }
+        )
+        cursor.execute(
+            'ALTER TABLE %(table)s ADD CONSTRAINT %(table)s_id_date_pkey '
+            'PRIMARY KEY (id, date)' % {'table': table}
+        )
+        cursor.execute(
+            'CREATE TABLE %(table)s_default PARTITION OF %(table)s DEFAULT' % {
+                'table': table
+            }
+        )
+        create_partitions(table, period, ahead, using, since=first_date)
+
+        cursor.execute(
+            'INSERT INTO %s SELECT * FROM %s' % (table, old_table)
+        )
+        if sequence:
+            cursor.execute(
+                'ALTER SEQUENCE %s OWNED BY %s.id' % (sequence, table)
+            )
+        cursor.execute('DROP TABLE %s' % old_table)
+
+        for name, definition in indexes:
+            cursor.execute(
+                'CREATE INDEX %s ON %s %s' % (name, table, definition)
+            )
+        for column, referenced_table in foreign_keys:
+            cursor.execute(
+                'ALTER TABLE %(table)s ADD CONSTRAINT '
+                '%(table)s_%(column)s_fkey FOREIGN KEY (%(column)s) '
+                'REFERENCES %(referenced_table)s (id) '
+                'DEFERRABLE INITIALLY DEFERRED' % {
+                    'table': table,
+                    'column': column,
+                    'referenced_table': referenced_table
+                }
+            )
+
+
+@contextmanager
+def insert_lock(using, key=INSERT_LOCK_KEY):
+    """
+    Run block in transaction holding application-wide advisory lock
+    of database. Partitioned tables have no unique constraints that do
+    not include partition key, so inserts of unique rows are serialized
+    with it. Lock is released when transaction ends, so the next
+    holder sees rows inserted by the previous one.
+    """
+    with transaction.commit_on_success(using=using):
+        connections[using].cursor().execute(
+            'SELECT pg_advisory_xact_lock(%s)', [key]
+        )
+        yield
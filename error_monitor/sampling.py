@@ -0,0 +1,80 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from threading import Lock
+from time import time
+
+
+class OccurrenceSampler(object):
+    """
+    Count occurrences of each key within window seconds and decide
+    which of them have to be captured: first ones always, then only
+    occurrences which number past first is a power of two.
+    """
+
+    def __init__(self, first=10, window=60, max_keys=10000):
+        self.first = first
+        self.window = window
+        self.max_keys = max_keys
+        self.counts = {}
+        self.sampled_out = 0
+        self._lock = Lock()
+
+    def _prune(self, now):
+        for key, (started, _) in self.counts.items():
+            if now - started >= self.window:
+                del self.counts[key]
+
+    def sample(self, key):
+        """
+        Count occurrence of key and tell whether it has to be captured.
+        """
+        now = time()
+        with self._lock:
+            entry = self.counts.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                if entry is None and len(self.counts) >= self.max_keys:
+                    self._prune(now)
+                entry = self.counts[key] = [now, 0]
+            entry[1] += 1
+            number = entry[1] - self.first
+
+            if number <= 0 or number & (number - 1) == 0:
+                return True
+
+            self.sampled_out += 1
+            return False
+
+
+class TokenBucket(object):
+    """
+    Allow at most rate events per second on average
+    and bursts of at most capacity events.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.denied = 0
+        self._updated = time()
+        self._lock = Lock()
+
+    def consume(self, tokens=1):
+        """
+        Take tokens from bucket. Return False if there are not enough.
+        """
+        with self._lock:
+            now = time()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self.tokens < tokens:
+                self.denied += 1
+                return False
+            self.tokens -= tokens
+            return True
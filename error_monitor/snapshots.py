@@ -0,0 +1,146 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from ast import literal_eval
+from base64 import b64encode, b64decode
+from datetime import datetime
+from json import dumps, loads
+from pprint import pformat
+from zlib import compress, decompress
+
+# Django imports
+from django.utils.text import Truncator
+
+
+SNAPSHOT_PREFIX = 'snapshot:'
+SERVER_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+FRAME_KEYS = (
+    'filename', 'function', 'lineno', 'id', 'type', 'context_line',
+    'pre_context', 'post_context', 'pre_context_lineno'
+)
+SETTINGS_KEYS = ('INSTALLED_APPS', 'MIDDLEWARE_CLASSES')
+
+
+class Repr(object):  # IGNORE:too-few-public-methods
+    """
+    Value stored as text that has to be shown as is by pprint filter.
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return self.text.encode('utf-8')
+
+    def __unicode__(self):
+        try:
+            value = literal_eval(self.text)
+        except (ValueError, SyntaxError):
+            return self.text
+        return value if isinstance(value, basestring) else self.text
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
+
+
+def _pformat_dict(values):
+    return dict(
+        (unicode(key), pformat(value).decode('utf-8', 'replace'))
+        for key, value in values.items()
+    )
+
+
+def _repr_dict(values):
+    return dict((key, Repr(value)) for key, value in values.items())
+
+
+def is_snapshot(contents):
+    """
+    Check whether stored contents are snapshot and not rendered HTML.
+    """
+    return bool(contents) and contents.startswith(SNAPSHOT_PREFIX)
+
+
+def dump_snapshot(traceback_data, variable_length):
+    """
+    Pack data returned by ExceptionReporter.get_traceback_data()
+    into compressed JSON. Local variables are truncated to variable_length.
+    """
+    frames = []
+    for frame in traceback_data.get('frames', []):
+        snapshot_frame = dict((key, frame.get(key)) for key in FRAME_KEYS)
+        snapshot_frame['vars'] = [
+            (name, Truncator(value).chars(variable_length))
+            for name, value in frame.get('vars', [])
+        ]
+        frames.append(snapshot_frame)
+
+    request = traceback_data.get('request')
+    snapshot_request = None
+    if request is not None:
+        snapshot_request = {
+            'path_info': request.path_info,
+            'build_absolute_uri': request.build_absolute_uri(),
+            'GET': _pformat_dict(request.GET),
+            'FILES': _pformat_dict(request.FILES),
+            'COOKIES': _pformat_dict(request.COOKIES),
+            'META': _pformat_dict(request.META),
+        }
+
+    safe_settings = traceback_data.get('settings') or {}
+    snapshot = {
+        'exception_type': traceback_data.get('exception_type'),
+        'exception_value': traceback_data.get('exception_value'),
+        'unicode_hint': traceback_data.get('unicode_hint'),
+        'frames': frames,
+        'request': snapshot_request,
+        'filtered_POST': _pformat_dict(
+            traceback_data.get('filtered_POST') or {}
+        ),
+        'settings': _pformat_dict(
+            dict(
+                (key, safe_settings[key])
+                for key in SETTINGS_KEYS if key in safe_settings
+            )
+        ),
+        'sys_version_info': traceback_data.get('sys_version_info'),
+        'django_version_info': traceback_data.get('django_version_info'),
+        'server_time': traceback_data['server_time'].strftime(
+            SERVER_TIME_FORMAT
+        ),
+        'template_info': traceback_data.get('template_info'),
+        'template_does_not_exist': traceback_data.get(
+            'template_does_not_exist'
+        ),
+        'loader_debug_info': traceback_data.get('loader_debug_info'),
+    }
+
+    return SNAPSHOT_PREFIX + b64encode(
+        compress(dumps(snapshot, default=unicode))
+    )
+
+
+def load_snapshot(contents):
+    """
+    Unpack snapshot into context for simplified exception template.
+    """
+    snapshot = loads(decompress(b64decode(contents[len(SNAPSHOT_PREFIX):])))
+
+    if snapshot['frames']:
+        snapshot['lastframe'] = snapshot['frames'][-1]
+
+    request = snapshot['request']
+    if request is not None:
+        for key in ('GET', 'FILES', 'COOKIES', 'META'):
+            request[key] = _repr_dict(request[key])
+
+    snapshot['filtered_POST'] = _repr_dict(snapshot['filtered_POST'])
+    snapshot['settings'] = _repr_dict(snapshot['settings'])
+    snapshot['server_time'] = datetime.strptime(
+        snapshot['server_time'], SERVER_TIME_FORMAT
+    )
+
+    return snapshot
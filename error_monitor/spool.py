@@ -0,0 +1,114 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from fcntl import flock, LOCK_EX, LOCK_UN
+from glob import glob
+from json import dumps, loads
+from os import getpid, remove, rename
+from os.path import exists
+from time import time
+
+# Project imports
+from .views import format_sync_date, parse_sync_date
+
+
+class ExceptionSpool(object):
+    """
+    Append-only file of occurrences that could not be written to database.
+    Every line is one JSON encoded occurrence.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _append_lines(self, lines):
+        with open(self.path, 'a') as spool_file:
+            flock(spool_file, LOCK_EX)
+            try:
+                spool_file.writelines(lines)
+                spool_file.flush()
+            finally:
+                flock(spool_file, LOCK_UN)
+
+    def append(self, occurrences):
+        """
+        Spool occurrences in the same format write buffer keeps them.
+        """
+        self._append_lines(
+            dumps({
+                'hash': location_hash,
+                'title': title,
+                'path': path,
+                'count': count,
+                'contents': contents,
+                'date': format_sync_date(date)
+            }) + '\n'
+            for (location_hash, title, path), (count, contents, date) in
+            occurrences.items()
+        )
+
+    def _detach(self):
+        """
+        Move spool file aside so that new occurrences go to the new one.
+        Return paths of files waiting for replay.
+        """
+        if exists(self.path):
+            with open(self.path, 'a') as spool_file:
+                flock(spool_file, LOCK_EX)
+                try:
+                    rename(
+                        self.path,
+                        '%s.replay-%d-%d' % (self.path, time(), getpid())
+                    )
+                finally:
+                    flock(spool_file, LOCK_UN)
+        return sorted(glob(self.path + '.replay-*'))
+
+    def replay(self, writer, batch_size=500):
+        """
+        Hand spooled occurrences to writer in batches of at most
+        batch_size keys. Lines left unwritten on failure are spooled again.
+        Return number of replayed lines.
+        """
+        replayed = 0
+        for replay_path in self._detach():
+            with open(replay_path) as replay_file:
+                lines = replay_file.readlines()
+
+            position = 0
+            while position < len(lines):
+                batch_lines = lines[position:position + batch_size]
+                occurrences = {}
+                for line in batch_lines:
+                    occurrence = loads(line)
+                    key = (
+                        occurrence['hash'],
+                        occurrence['title'],
+                        occurrence['path']
+                    )
+                    date = parse_sync_date(occurrence['date'])
+                    entry = occurrences.get(key)
+                    if entry is None:
+                        occurrences[key] = (
+                            occurrence['count'], occurrence['contents'], date
+                        )
+                    else:
+                        occurrences[key] = (
+                            entry[0] + occurrence['count'],
+                            occurrence['contents'] or entry[1],
+                            max(entry[2], date)
+                        )
+                try:
+                    writer(occurrences)
+                except Exception:
+                    self._append_lines(lines[position:])
+                    remove(replay_path)
+                    raise
+                position += len(batch_lines)
+                replayed += len(batch_lines)
+
+            remove(replay_path)
+        return replayed
@@ -0,0 +1,16 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+
+Tests of error_monitor, run with runtests.py.
+"""
+
+# Project imports
+from .test_admin import *  # IGNORE:wildcard-import
+from .test_bodies import *  # IGNORE:wildcard-import
+from .test_collection import *  # IGNORE:wildcard-import
+from .test_counters import *  # IGNORE:wildcard-import
+from .test_notifications import *  # IGNORE:wildcard-import
+from .test_persistence import *  # IGNORE:wildcard-import
+from .test_recording import *  # IGNORE:wildcard-import
+from .test_resolve import *  # IGNORE:wildcard-import
@@ -0,0 +1,134 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from datetime import datetime
+
+# Django imports
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TransactionTestCase
+
+# Third-party app imports
+from pytz import utc
+
+# Project imports
+from error_monitor import admin as error_monitor_admin, changelist
+from error_monitor.changelist import EstimatedCountQuerySet
+from error_monitor.models import ProjectException
+from error_monitor.tests.utils import patched
+
+
+__all__ = ['ChangeListTests']
+
+
+class ChangeListTests(TransactionTestCase):
+    """
+    Admin changelists of big exception tables.
+    """
+
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        self.url = reverse('admin:error_monitor_projectexception_changelist')
+        self.date = datetime(2020, 1, 1, 12, tzinfo=utc)
+
+    def create_exceptions(self, count):
+        """
+        Save count exceptions that occurred at the same time.
+        """
+        for number in range(count):
+            ProjectException.objects.create(
+                hash='hash%d' % number, title='Error %d' % number,
+                path='/items/', count=1, date=self.date
+            )
+
+    def get_queries(self):
+        """
+        Return SQL of queries changelist is served with.
+        """
+        connection.use_debug_cursor = True
+        try:
+            self.client.get(self.url)
+            return [query['sql'] for query in connection.queries]
+        finally:
+            connection.use_debug_cursor = None
+
+    def test_sparklines_are_loaded_with_one_query(self):
+        with patched(error_monitor_admin, HISTOGRAM=True):
+            for count in (2, 6):
+                ProjectException.objects.all().delete()
+                self.create_exceptions(count)
+                self.assertEqual(
+                    len([
+                        sql for sql in self.get_queries()
+                        if 'occurrencebucket' in sql
+                    ]),
+                    1
+                )
+
+    def test_page_queries_do_not_depend_on_rows(self):
+        with patched(error_monitor_admin, HISTOGRAM=True):
+            self.create_exceptions(2)
+            self.get_queries()
+            queries = self.get_queries()
+            ProjectException.objects.all().delete()
+            self.create_exceptions(6)
+            self.assertEqual(len(self.get_queries()), len(queries))
+
+        self.assertEqual(
+            len([sql for sql in queries if 'exceptionvariant' in sql]), 1
+        )
+
+    def test_filtered_count_is_bounded(self):
+        self.create_exceptions(5)
+        query_set = ProjectException.objects.all()._clone(
+            klass=EstimatedCountQuerySet
+        )
+        self.assertEqual(query_set.count(), 5)
+
+        connection.use_debug_cursor = True
+        try:
+            with patched(changelist, COUNT_LIMIT=3):
+                self.assertEqual(query_set.filter(count=1).count(), 3)
+            sql = connection.queries[-1]['sql']
+        finally:
+            connection.use_debug_cursor = None
+        self.assertIn('COUNT(*)', sql)
+        self.assertIn('LIMIT 3', sql)
+
+    def test_older_pages_keep_exceptions_of_the_same_date(self):
+        self.create_exceptions(5)
+        model_admin = admin.site._registry[ProjectException]  # IGNORE:protected-access
+        seen = []
+        with patched(model_admin, list_per_page=2):
+            response = self.client.get(self.url)
+            for _ in range(3):
+                seen.extend(
+                    exception.id
+                    for exception in response.context['cl'].result_list
+                )
+                response = self.client.get(
+                    self.url + response.context['older_url']
+                )
+            self.assertFalse(response.context['cl'].result_list)
+
+        self.assertEqual(
+            seen,
+            list(
+                ProjectException.objects.order_by('-id').values_list(
+                    'id', flat=True
+                )
+            )
+        )
+
+    def test_older_link_needs_date_ordering(self):
+        self.create_exceptions(2)
+        self.assertContains(self.client.get(self.url), 'Older exceptions')
+        self.assertNotContains(
+            self.client.get(self.url, {'o': '1'}), 'Older exceptions'
+        )
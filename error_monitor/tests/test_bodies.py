@@ -0,0 +1,116 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from datetime import timedelta
+
+# Django imports
+from django.test import TransactionTestCase
+from django.test.client import RequestFactory
+
+# Project imports
+from error_monitor import functions
+from error_monitor.fingerprint import LRUCache
+from error_monitor.models import ProjectException, ExceptionBody
+from error_monitor.tests.utils import patched, silenced, capture_error
+
+
+__all__ = ['ExceptionBodyTests']
+
+
+class ExceptionBodyTests(TransactionTestCase):
+    """
+    Storage of exception contents shared by occurrences.
+    """
+
+    def setUp(self):
+        self.request = RequestFactory().get('/items/', {'page': 2})
+
+    def save(self):
+        """
+        Record occurrence of the same exception.
+        """
+        with silenced():
+            functions.save_exception(
+                capture_error('Body error'), 'Body error', self.request
+            )
+
+    def test_identical_occurrences_share_body(self):
+        with patched(functions, HISTOGRAM=False, BODIES_CACHE=LRUCache(10)):
+            self.save()
+            with self.assertNumQueries(1):
+                self.save()
+            for _ in range(3):
+                self.save()
+
+        self.assertEqual(ExceptionBody.objects.count(), 1)
+        exception = ProjectException.objects.get()
+        self.assertEqual(exception.count, 5)
+        self.assertEqual(exception.body_id, ExceptionBody.objects.get().id)
+        self.assertIn('Body error', exception.get_contents())
+
+    def test_fresh_contents_are_not_captured_again(self):
+        with patched(functions, HISTOGRAM=False, BODIES_CACHE=LRUCache(10)):
+            self.save()
+            with patched(functions, CustomExceptionReporter=None):
+                self.save()
+
+        self.assertEqual(ProjectException.objects.get().count, 2)
+
+    def test_later_occurrence_replaces_contents(self):
+        with patched(functions, HISTOGRAM=False, SNAPSHOT_REFRESH=0,
+                     BODIES_CACHE=LRUCache(10)):
+            for value in ('FIRSTVALUE', 'SECONDVALUE'):
+                self.request = RequestFactory().get('/items/', {'v': value})
+                self.save()
+
+        self.assertEqual(ExceptionBody.objects.count(), 1)
+        contents = ProjectException.objects.get().get_contents()
+        self.assertIn('SECONDVALUE', contents)
+        self.assertNotIn('FIRSTVALUE', contents)
+
+    def test_stale_contents_of_recurring_exception_are_recaptured(self):
+        with patched(functions, HISTOGRAM=False, BODIES_CACHE=LRUCache(10)):
+            for value in ('FIRSTVALUE', 'SECONDVALUE'):
+                self.request = RequestFactory().get('/items/', {'v': value})
+                self.save()
+                ExceptionBody.objects.update(
+                    date=ExceptionBody.objects.get().date - timedelta(
+                        seconds=functions.SNAPSHOT_REFRESH + 60
+                    )
+                )
+                # Contents were written by other process.
+                functions.BODIES_CACHE.clear()
+
+        exception = ProjectException.objects.get()
+        self.assertEqual(exception.count, 2)
+        self.assertIn('SECONDVALUE', exception.get_contents())
+
+    def test_resolved_exception_keeps_fresh_contents(self):
+        with patched(functions, HISTOGRAM=False, BODIES_CACHE=LRUCache(10)):
+            self.save()
+            ProjectException.objects.all().delete()
+            self.save()
+
+        exception = ProjectException.objects.get()
+        self.assertEqual(exception.body_id, ExceptionBody.objects.get().id)
+        self.assertIn('Body error', exception.get_contents())
+
+    def test_purged_body_is_not_reused(self):
+        with patched(functions, HISTOGRAM=False, BODIES_CACHE=LRUCache(10)):
+            self.save()
+            body = ExceptionBody.objects.get()
+            ProjectException.objects.all().delete()
+            ExceptionBody.objects.update(date=body.date - timedelta(
+                seconds=functions.BODY_ORPHAN_AGE + 60
+            ))
+            functions.purge_exceptions()
+            self.assertFalse(ExceptionBody.objects.exists())
+
+            self.save()
+
+        exception = ProjectException.objects.get()
+        self.assertEqual(exception.body_id, ExceptionBody.objects.get().id)
+        self.assertIn('Body error', exception.get_contents())
@@ -0,0 +1,257 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from datetime import datetime, timedelta
+from json import dumps
+
+# Django imports
+from django.test import TransactionTestCase
+
+# Third-party app imports
+from pytz import utc
+
+# Project imports
+from error_monitor import functions
+from error_monitor.fingerprint import LRUCache
+from error_monitor.models import CollectedProjectException, CollectedServer
+from error_monitor.transport import HTTPTransport
+from error_monitor.views import format_sync_date, parse_sync_date, \
+    stream_rows
+from error_monitor.tests.utils import patched, silenced, StubServer
+
+
+__all__ = ['CollectionTests']
+
+
+def reply_legacy(path, data):  # IGNORE:unused-argument
+    """
+    Reply like views of older versions do, ignoring paging.
+    """
+    if path.endswith('/collect_exceptions/'):
+        return dumps([
+            ['path', 'title', 'count', 'hash'],
+            ['/items/', 'Error a', 2, 'a'],
+            ['/items/', 'Error b', 3, 'b'],
+        ])
+    return dumps([['hash', 'contents']] + [
+        [location_hash, 'Contents of %s' % location_hash]
+        for location_hash in data['hashes'][0].split()
+    ])
+
+
+class StubNode(object):
+    """
+    Server of exceptions replying with pages of JSON lines
+    like collect_exceptions and get_exception_details views do.
+    exceptions map hashes to (count, modification date).
+    """
+
+    def __init__(self, exceptions):
+        self.exceptions = exceptions
+        self.denied = False
+
+    def reply(self, path, data):
+        """
+        Reply to request of collector.
+        """
+        if self.denied:
+            return 'Access denied'
+
+        if path.endswith('/get_exception_details/'):
+            keys = ['hash', 'contents']
+            rows = [
+                (location_hash, 'Contents of %s' % location_hash)
+                for location_hash in sorted(data['hashes'][0].split())
+                if location_hash in self.exceptions
+            ]
+        else:
+            keys = ['path', 'title', 'count', 'hash', 'date', 'modified']
+            since = parse_sync_date(data['since'][0]) if 'since' in data \
+                else None
+            rows = [
+                (
+                    '/items/', 'Error %s' % location_hash, count,
+                    location_hash, format_sync_date(modified),
+                    format_sync_date(modified)
+                )
+                for location_hash, (count, modified) in sorted(
+                    self.exceptions.items()
+                )
+                if since is None or modified > since
+            ]
+
+        after = int(data.get('after', ['0'])[0])
+        limit = int(data['limit'][0])
+        return ''.join(stream_rows(
+            ['id'] + keys,
+            [
+                (row_id,) + row for row_id, row in enumerate(rows, 1)
+                if row_id > after
+            ][:limit]
+        ))
+
+
+class CollectionTests(TransactionTestCase):
+    """
+    Collecting exceptions from servers.
+    """
+
+    def setUp(self):
+        self.transport = HTTPTransport(timeout=5)
+        self.now = datetime.utcnow().replace(tzinfo=utc, microsecond=0)
+
+    def tearDown(self):
+        self.transport.close()
+
+    def collect(self, servers, full=False):
+        """
+        Collect exceptions from servers.
+        """
+        with self.settings(ERROR_MONITOR_EXCEPTION_SERVERS_LIST=servers):
+            with patched(functions, TRANSPORT=self.transport,
+                         BODIES_CACHE=LRUCache(10)), silenced():
+                return functions.collect_exceptions_from_servers(full)
+
+    def get_collected(self):
+        """
+        Return collected hashes, counts and servers.
+        """
+        return list(
+            CollectedProjectException.objects.order_by('hash').values_list(
+                'hash', 'count', 'servers'
+            )
+        )
+
+    def test_older_servers_are_collected_in_full(self):
+        with StubServer(reply_legacy, 'application/json') as server:
+            self.assertEqual(self.collect([server.url]), {})
+
+        self.assertEqual(
+            self.get_collected(), [('a', 2, server.url), ('b', 3, server.url)]
+        )
+        self.assertEqual(
+            CollectedProjectException.objects.get(hash='a').get_contents(),
+            'Contents of a'
+        )
+        self.assertIsNone(CollectedServer.objects.get().cursor)
+
+    def test_changes_since_cursor_are_collected(self):
+        node = StubNode({
+            'a': (1, self.now - timedelta(hours=2)),
+            'b': (2, self.now - timedelta(hours=1)),
+        })
+        with StubServer(node.reply, 'application/x-ndjson') as server:
+            self.assertEqual(self.collect([server.url]), {})
+            self.assertEqual(
+                CollectedServer.objects.get().cursor,
+                self.now - timedelta(hours=1)
+            )
+
+            node.exceptions['a'] = (5, self.now)
+            self.assertEqual(self.collect([server.url]), {})
+
+        self.assertEqual(
+            [
+                data.get('since')
+                for _, path, data in server.requests
+                if path.endswith('/collect_exceptions/')
+            ],
+            [
+                None,
+                [
+                    format_sync_date(
+                        self.now - timedelta(
+                            hours=1, seconds=functions.SYNC_OVERLAP
+                        )
+                    )
+                ]
+            ]
+        )
+        self.assertEqual(
+            self.get_collected(), [('a', 5, server.url), ('b', 2, server.url)]
+        )
+        self.assertEqual(CollectedServer.objects.get().cursor, self.now)
+
+    def test_only_full_collection_deletes_unreported_counts(self):
+        node = StubNode({'a': (1, self.now), 'b': (2, self.now)})
+        with StubServer(node.reply, 'application/x-ndjson') as server:
+            self.collect([server.url])
+            del node.exceptions['b']
+
+            self.collect([server.url])
+            self.assertEqual(
+                self.get_collected(),
+                [('a', 1, server.url), ('b', 2, server.url)]
+            )
+
+            self.collect([server.url], full=True)
+        self.assertEqual(self.get_collected(), [('a', 1, server.url)])
+
+    def test_failed_server_keeps_counts(self):
+        first_node = StubNode({'a': (1, self.now)})
+        second_node = StubNode({'a': (2, self.now), 'b': (3, self.now)})
+        with StubServer(first_node.reply, 'application/x-ndjson') as first, \
+                StubServer(second_node.reply, 'application/x-ndjson') as second:
+            self.collect([first.url, second.url])
+            second_node.denied = True
+            first_node.exceptions['a'] = (4, self.now + timedelta(minutes=1))
+
+            failed_servers = self.collect([first.url, second.url], full=True)
+
+        self.assertEqual(failed_servers.keys(), [second.url])
+        self.assertEqual(
+            self.get_collected(),
+            [
+                ('a', 6, '%s, %s' % (first.url, second.url)),
+                ('b', 3, second.url),
+            ]
+        )
+
+    def test_exceptions_are_saved_and_detailed_in_batches(self):
+        node = StubNode(
+            dict((location_hash, (1, self.now)) for location_hash in 'abcde')
+        )
+        saved_batches = []
+        save_collected_exceptions = functions.save_collected_exceptions
+
+        def save_batch(collected_exceptions, *args):
+            saved_batches.append(sorted(
+                exception.hash for exception, _ in collected_exceptions.values()
+            ))
+            save_collected_exceptions(collected_exceptions, *args)
+
+        with StubServer(node.reply, 'application/x-ndjson') as server:
+            with patched(functions, COLLECT_PAGE_SIZE=2, COLLECT_MAX_PENDING=2,
+                         COLLECT_DETAILS_BATCH=2,
+                         save_collected_exceptions=save_batch):
+                self.assertEqual(self.collect([server.url]), {})
+
+        self.assertEqual(saved_batches, [['a', 'b'], ['c', 'd'], ['e']])
+        self.assertEqual(
+            [
+                data.get('after')
+                for _, path, data in server.requests
+                if path.endswith('/collect_exceptions/')
+            ],
+            [None, ['2'], ['4']]
+        )
+        self.assertEqual(
+            sorted(set(
+                tuple(sorted(data['hashes'][0].split()))
+                for _, path, data in server.requests
+                if path.endswith('/get_exception_details/')
+            )),
+            [('a', 'b'), ('c', 'd'), ('e',)]
+        )
+        self.assertEqual(
+            [
+                exception.get_contents()
+                for exception in CollectedProjectException.objects.order_by(
+                    'hash'
+                )
+            ],
+            ['Contents of %s' % location_hash for location_hash in 'abcde']
+        )
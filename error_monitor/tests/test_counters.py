@@ -0,0 +1,108 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from datetime import datetime
+
+# Django imports
+from django.core.cache import get_cache
+from django.test import TransactionTestCase
+
+# Third-party app imports
+from pytz import utc
+
+# Project imports
+from error_monitor import counters
+from error_monitor.counters import CacheCounters
+from error_monitor.tests.utils import patched
+
+
+__all__ = ['CacheCountersTests']
+
+
+KEY = ('location', 'Counted error', '/items/')
+INTERVAL = 10
+NOW = 1000.0
+EPOCH = int(NOW // INTERVAL)
+
+
+class CacheCountersTests(TransactionTestCase):
+    """
+    Occurrence counters shared through cache.
+    """
+
+    def setUp(self):
+        self.cache = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache',
+            LOCATION='error-monitor-counters-tests'
+        )
+        self.cache.clear()
+        self.written = []
+        self.counters = CacheCounters(
+            self.cache, self.written.append, interval=INTERVAL
+        )
+        self.date = datetime(2020, 1, 1, 12, tzinfo=utc)
+
+    def tearDown(self):
+        self.counters._wakeup.set()  # IGNORE:protected-access
+
+    def add(self, count, now=NOW):
+        """
+        Count occurrences of KEY at now and return which have to be written.
+        """
+        with patched(counters, time=lambda: now):
+            return [
+                self.counters.add(KEY, 'signature', self.date)
+                for _ in range(count)
+            ]
+
+    def test_first_occurrence_per_epoch_is_written(self):
+        self.assertEqual(self.add(3), [True, False, False])
+        self.assertEqual(self.add(2, NOW + INTERVAL), [True, False])
+
+    def test_epoch_is_flushed_once(self):
+        self.add(4)
+
+        self.assertEqual(self.counters.flush_epoch(EPOCH), 1)
+        self.assertEqual(self.written, [{KEY: (3, None, self.date)}])
+        self.assertEqual(
+            self.cache.get(self.counters._key(  # IGNORE:protected-access
+                EPOCH, 'count', 'signature'
+            )),
+            0
+        )
+
+        self.assertEqual(self.counters.flush_epoch(EPOCH), 0)
+        self.assertEqual(len(self.written), 1)
+
+    def test_occurrences_counted_during_flush_are_kept(self):
+        self.add(3)
+        self.counters.flush_epoch(EPOCH)
+        self.add(2)
+
+        self.assertEqual(self.counters.flush_epoch(EPOCH), 1)
+        self.assertEqual(self.written[1], {KEY: (2, None, self.date)})
+
+    def test_finished_epochs_are_flushed(self):
+        self.add(3)
+        with patched(counters, time=lambda: NOW + INTERVAL):
+            # Counters of previous epoch may still be incremented.
+            self.assertEqual(self.counters.flush(), 0)
+        with patched(counters, time=lambda: NOW + 2 * INTERVAL):
+            self.assertEqual(self.counters.flush(), 1)
+            self.assertEqual(self.counters.flush(final=True), 0)
+        self.assertEqual(self.written, [{KEY: (2, None, self.date)}])
+
+    def test_flush_is_skipped_while_other_process_holds_lock(self):
+        self.add(3)
+        self.cache.add('error_monitor:flush-lock', 0)
+
+        with patched(counters, time=lambda: NOW):
+            self.assertEqual(self.counters.flush(final=True), 0)
+            self.assertEqual(self.written, [])
+
+            self.cache.delete('error_monitor:flush-lock')
+            self.assertEqual(self.counters.flush(final=True), 1)
+        self.assertEqual(self.written, [{KEY: (2, None, self.date)}])
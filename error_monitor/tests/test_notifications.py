@@ -0,0 +1,96 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Django imports
+from django.core import mail
+from django.test import TransactionTestCase
+
+# Project imports
+from error_monitor import functions
+from error_monitor.notifications import KeywordMatcher, \
+    NotificationDispatcher, compile_matcher
+
+
+__all__ = ['KeywordMatcherTests', 'NotificationDispatcherTests']
+
+
+class KeywordMatcherTests(TransactionTestCase):
+    """
+    Matching exception titles against keywords to notify about.
+    """
+
+    def test_overlapping_keywords(self):
+        matcher = KeywordMatcher(['he', 'she', 'his', 'hers'])
+        self.assertTrue(matcher.search('USHERS'))
+        self.assertTrue(matcher.search('this'))
+        self.assertFalse(matcher.search('hi ha'))
+
+    def test_fallback_links(self):
+        matcher = KeywordMatcher(['abcd', 'bce', 'cf'])
+        # Each of them is found only by falling back from longer prefix.
+        self.assertTrue(matcher.search('abce'))
+        self.assertTrue(matcher.search('abcf'))
+        self.assertFalse(matcher.search('abcbd'))
+
+    def test_empty_keyword_matches_everything(self):
+        self.assertTrue(KeywordMatcher(['']).search('Any error'))
+
+    def test_automaton_is_used_for_long_lists_of_plain_keywords(self):
+        words = ['Critical', 'Fatal', 'Payment']
+        self.assertIsInstance(compile_matcher(words, 3), KeywordMatcher)
+        self.assertNotIsInstance(compile_matcher(words, 4), KeywordMatcher)
+        self.assertNotIsInstance(
+            compile_matcher(words + ['Pay(ment|out)'], 3), KeywordMatcher
+        )
+        for matcher in (compile_matcher(words, 3), compile_matcher(words, 4)):
+            self.assertTrue(matcher.search('Payment gateway timed out'))
+            self.assertFalse(matcher.search('Page not found'))
+
+
+class NotificationDispatcherTests(TransactionTestCase):
+    """
+    Sending notifications in digests.
+    """
+
+    def setUp(self):
+        self.digests = []
+        self.dispatcher = NotificationDispatcher(
+            self.digests.append, window=3600, interval=3600
+        )
+
+    def tearDown(self):
+        self.dispatcher.stop()
+
+    def test_digest_counts_occurrences(self):
+        for key, title in (('a', 'Error A'), ('b', 'Error B'), ('a', 'Error A')):
+            self.dispatcher.notify(key, title)
+
+        self.assertEqual(self.dispatcher.flush(), 2)
+        self.assertEqual(
+            sorted(self.digests[0]), [('Error A', 2), ('Error B', 1)]
+        )
+
+    def test_key_is_sent_once_per_window(self):
+        self.dispatcher.notify('a', 'Error A')
+        self.dispatcher.flush()
+        self.dispatcher.notify('a', 'Error A')
+        self.dispatcher.notify('a', 'Error A')
+        self.dispatcher.notify('b', 'Error B')
+
+        self.assertEqual(self.dispatcher.flush(), 1)
+        self.assertEqual(self.digests[1], [('Error B', 1)])
+        # Occurrences within window are sent with the next notification.
+        self.assertEqual(self.dispatcher.flush(force=True), 1)
+        self.assertEqual(self.digests[2], [('Error A', 2)])
+
+    def test_digest_is_sent_as_one_email(self):
+        functions.send_notifications([('Error A', 2), ('Error B', 1)])
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            mail.outbox[0].subject, 'Error Monitor notification: 2 exceptions'
+        )
+        self.assertIn('Error A (2 occurrences)', mail.outbox[0].body)
+        self.assertIn('<p>Error B</p>', mail.outbox[0].body)
@@ -0,0 +1,140 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from json import loads
+from os.path import exists, join
+from tempfile import mkdtemp
+from shutil import rmtree
+
+# Django imports
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.test import TransactionTestCase
+
+# Third-party app imports
+from psycopg2 import OperationalError
+from pytz import utc
+
+# Project imports
+from error_monitor import functions
+from error_monitor.models import ProjectException
+from error_monitor.spool import ExceptionSpool
+from error_monitor.views import format_sync_date
+from error_monitor.tests.utils import patched, silenced
+
+
+__all__ = ['PersistenceTests']
+
+
+KEY = ('location', 'Persisted error', '/items/')
+
+
+def refuse_connection():
+    """
+    Fail like psycopg2 does when database server is unreachable.
+    """
+    raise OperationalError('could not connect to server: Connection refused')
+
+
+class PersistenceTests(TransactionTestCase):
+    """
+    Writing occurrences to database.
+    """
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.now = datetime.utcnow().replace(tzinfo=utc, microsecond=0)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_occurrences_are_spooled_on_connect_error(self):
+        path = join(self.directory, 'spool')
+        spool = ExceptionSpool(path)
+        with patched(functions, SPOOL=spool, HISTOGRAM=False):
+            with patched(connections[functions.DATABASE],
+                         _cursor=refuse_connection), silenced():
+                functions.persist_exceptions({KEY: (2, None, self.now)})
+            self.assertTrue(exists(path))
+            with open(path) as spool_file:
+                self.assertEqual(len(spool_file.readlines()), 1)
+
+            self.assertEqual(functions.replay_exception_spool(), 1)
+
+        exception = ProjectException.objects.get()
+        self.assertEqual((exception.count, exception.date), (2, self.now))
+
+    def test_date_never_moves_back(self):
+        earlier = self.now - timedelta(minutes=5)
+        with patched(functions, HISTOGRAM=False):
+            functions.write_exceptions({KEY: (1, None, earlier)})
+            self.assertEqual(ProjectException.objects.get().date, earlier)
+
+            functions.write_exceptions({KEY: (1, None, self.now)})
+            functions.write_exceptions({KEY: (3, None, earlier)})
+
+        exception = ProjectException.objects.get()
+        self.assertEqual((exception.count, exception.date), (5, self.now))
+
+    def test_late_occurrences_are_synchronized(self):
+        with patched(functions, HISTOGRAM=False):
+            functions.write_exceptions({KEY: (1, None, self.now)})
+            since = format_sync_date(datetime.utcnow())
+            # Occurrences spooled during outage are replayed late.
+            functions.write_exceptions(
+                {KEY: (2, None, self.now - timedelta(hours=1))}
+            )
+
+        response = self.client.post(
+            reverse('collect_exceptions'),
+            {'secret_key': 'tests', 'since': since}
+        )
+        keys, row = loads(response.content)
+        exception = dict(zip(keys, row))
+        self.assertEqual(exception['count'], 3)
+        self.assertEqual(exception['date'], format_sync_date(self.now))
+        self.assertGreater(exception['modified'], since)
+
+    def test_partitioned_table_is_inserted_into_under_lock(self):
+        locks = []
+
+        @contextmanager
+        def insert_lock(using):
+            locks.append(using)
+            yield
+
+        # Table may be converted without ERROR_MONITOR_PARTITIONING set.
+        with patched(functions, HISTOGRAM=False, PARTITIONING=False,
+                     PARTITIONED_TABLES=set(), insert_lock=insert_lock,
+                     is_partitioned=lambda table, using: True):
+            functions.write_exceptions({KEY: (1, None, self.now)})
+            functions.write_exceptions({KEY: (2, None, self.now)})
+
+        self.assertEqual(locks, [functions.DATABASE])
+        self.assertEqual(ProjectException.objects.get().count, 3)
+
+    def test_purge_falls_back_to_chunked_delete_of_unpartitioned_table(self):
+        lifetime = timedelta(days=functions.ERROR_MONITOR_EXCEPTION_LIFETIME)
+        for number in range(3):
+            ProjectException.objects.create(
+                hash='hash%d' % number, title='Error %d' % number,
+                path='/items/', count=1,
+                date=self.now - lifetime - timedelta(days=1)
+            )
+        fresh = ProjectException.objects.create(
+            hash='fresh', title='Fresh error', path='/items/', count=1,
+            date=self.now
+        )
+
+        with patched(functions, PARTITIONING=True):
+            self.assertEqual(functions.purge_exceptions(chunk_size=2), 3)
+
+        self.assertEqual(
+            list(ProjectException.objects.values_list('id', flat=True)),
+            [fresh.id]
+        )
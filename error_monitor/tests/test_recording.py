@@ -0,0 +1,217 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from datetime import datetime
+from threading import current_thread, Event
+import atexit
+
+# Django imports
+from django.test import TransactionTestCase
+from django.test.client import RequestFactory
+
+# Project imports
+from error_monitor import functions
+from error_monitor.background import BackgroundRecorder
+from error_monitor.buffer import WriteBuffer
+from error_monitor.fingerprint import get_location_fingerprint
+from error_monitor.models import ProjectException
+from error_monitor.sampling import TokenBucket
+from error_monitor.snapshots import is_snapshot
+from error_monitor.tests.utils import patched, silenced, capture_error
+
+
+__all__ = [
+    'AsyncRecordingTests', 'WriteBufferTests', 'OverflowTests',
+    'FingerprintTests'
+]
+
+
+class AsyncRecordingTests(TransactionTestCase):
+    """
+    Recording of exceptions in background.
+    """
+
+    def test_queue_holds_plain_data(self):
+        queued = []
+        recorder = BackgroundRecorder(lambda *item: queued.append(item))
+        request = RequestFactory().get('/items/', {'page': 2})
+
+        with patched(functions, BACKGROUND_RECORDER=recorder), silenced():
+            try:
+                raise ValueError('Async error')
+            except ValueError, error:
+                self.assertTrue(
+                    functions.record_exception_async(error, request=request)
+                )
+            recorder.stop()
+
+        self.assertEqual(len(queued), 1)
+        key, title, path, date, snapshot = queued[0]
+        for value in key + (title, path):
+            self.assertIsInstance(value, basestring)
+        self.assertIsInstance(date, datetime)
+        self.assertTrue(is_snapshot(snapshot))
+
+        with silenced():
+            functions.save_captured_exception(*queued[0])
+        exception = ProjectException.objects.get()
+        self.assertEqual((exception.title, exception.path, exception.count),
+                         ('Async error', '/items/', 1))
+        contents = exception.get_contents()
+        self.assertFalse(is_snapshot(contents))
+        self.assertIn('Async error', contents)
+        self.assertIn('page', contents)
+
+    def test_sampled_out_occurrence_is_counted(self):
+        queued = []
+        recorder = BackgroundRecorder(lambda *item: queued.append(item))
+        sampler = functions.OccurrenceSampler(first=1)
+        overflow = WriteBuffer(
+            functions.persist_exceptions, flush_interval=3600, flush_size=None
+        )
+
+        with patched(functions, BACKGROUND_RECORDER=recorder, SAMPLING=True,
+                     SAMPLER=sampler, OVERFLOW_BUFFER=overflow), silenced():
+            for _ in range(4):
+                try:
+                    raise ValueError('Sampled error')
+                except ValueError, error:
+                    functions.record_exception_async(error)
+            recorder.stop()
+            for item in queued:
+                functions.save_captured_exception(*item)
+            overflow.stop()
+
+        self.assertEqual(
+            [item[-1] is None for item in queued], [False, False, False, True]
+        )
+        self.assertEqual(ProjectException.objects.get().count, 4)
+
+    def test_recorder_is_drained_first_at_exit(self):
+        handlers = [
+            handler for handler, _, _ in atexit._exithandlers  # IGNORE:protected-access
+        ]
+        recorder_index = handlers.index(functions.BACKGROUND_RECORDER.stop)
+        for stop in (functions.NOTIFICATION_DISPATCHER.stop,
+                     functions.WRITE_BUFFER.stop,
+                     functions.OVERFLOW_BUFFER.stop):
+            # Handlers are called in reverse order.
+            self.assertLess(handlers.index(stop), recorder_index)
+
+
+class WriteBufferTests(TransactionTestCase):
+    """
+    Batching of occurrences in memory.
+    """
+
+    def test_due_flush_is_left_to_background_thread(self):
+        written = []
+        flushed = Event()
+
+        def write(occurrences):
+            written.append((current_thread().name, occurrences))
+            flushed.set()
+            raise IOError('Database is unavailable')
+
+        write_buffer = WriteBuffer(write, flush_interval=3600, flush_size=2)
+        with silenced():
+            write_buffer.add('key', None, datetime.now())
+            write_buffer.add('key', 'Contents', datetime.now())
+            self.assertTrue(flushed.wait(5))
+            write_buffer.stop()
+
+        thread_name, occurrences = written[0]
+        self.assertEqual(thread_name, 'error-monitor-buffer')
+        self.assertEqual(occurrences['key'][:2], [2, 'Contents'])
+
+
+class OverflowTests(TransactionTestCase):
+    """
+    Occurrences that are only counted in memory.
+    """
+
+    def save(self, count):
+        """
+        Record count occurrences of the same exception.
+        """
+        with silenced():
+            for _ in range(count):
+                functions.save_exception(
+                    capture_error('Overflow error'), 'Overflow error'
+                )
+
+    def get_count(self):
+        return ProjectException.objects.get().count
+
+    def test_limited_occurrences_wait_for_tokens(self):
+        limiter = TokenBucket(0.001, 1)
+        overflow = WriteBuffer(
+            functions.persist_exceptions, flush_interval=3600,
+            flush_size=None, limiter=limiter
+        )
+        with patched(functions, HISTOGRAM=False, WRITE_LIMITER=limiter,
+                     OVERFLOW_BUFFER=overflow):
+            self.save(1)
+            with self.assertNumQueries(0):
+                self.save(200)
+            self.assertEqual(self.get_count(), 1)
+
+            overflow.stop()
+        self.assertEqual(self.get_count(), 201)
+
+    def test_buffered_writes_are_limited(self):
+        limiter = TokenBucket(0.001, 1)
+        write_buffer = WriteBuffer(
+            functions.persist_exceptions, flush_interval=3600,
+            flush_size=None, limiter=limiter
+        )
+        with patched(functions, HISTOGRAM=False, WRITE_BUFFERING=True,
+                     WRITE_LIMITER=limiter, WRITE_BUFFER=write_buffer):
+            for _ in range(5):
+                self.save(1)
+                write_buffer._flush_allowed()  # IGNORE:protected-access
+            self.assertEqual(self.get_count(), 1)
+
+            write_buffer.stop()
+        self.assertEqual(self.get_count(), 5)
+
+    def test_sampled_out_occurrences_are_not_written(self):
+        overflow = WriteBuffer(
+            functions.persist_exceptions, flush_interval=3600, flush_size=None
+        )
+        with patched(functions, HISTOGRAM=False, SAMPLING=True,
+                     SAMPLER=functions.OccurrenceSampler(first=1),
+                     OVERFLOW_BUFFER=overflow):
+            self.save(3)
+            with self.assertNumQueries(0):
+                self.save(1)
+            self.assertEqual(self.get_count(), 3)
+
+            overflow.stop()
+        self.assertEqual(self.get_count(), 4)
+
+
+class FingerprintTests(TransactionTestCase):
+    """
+    Hashes exceptions are grouped by.
+    """
+
+    def test_default_hash_is_location_hash(self):
+        current_exception = capture_error('Known error')
+        self.assertEqual(
+            functions.get_exception_fingerprint(current_exception),
+            get_location_fingerprint(current_exception[2])
+        )
+
+    def test_frames_hash_is_opt_in(self):
+        current_exception = capture_error('Known error')
+        with patched(functions, FINGERPRINT='frames'):
+            self.assertEqual(
+                functions.get_exception_fingerprint(current_exception),
+                functions.FINGERPRINTER.fingerprint(
+                    current_exception[0], current_exception[2]
+                )
+            )
@@ -0,0 +1,201 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from json import dumps, loads
+
+# Django imports
+from django.core.urlresolvers import reverse
+from django.test import TransactionTestCase
+
+# Project imports
+from error_monitor import functions
+from error_monitor.models import CollectedProjectException, \
+    CollectedExceptionSource, ProjectException
+from error_monitor.transport import HTTPTransport
+from error_monitor.tests.utils import patched, StubServer
+
+
+__all__ = ['ResolveTests', 'ResolveViewTests']
+
+
+def reply_counts(path, data):  # IGNORE:unused-argument
+    """
+    Reply like resolve_exception view does.
+    """
+    return dumps(dict((location_hash, 1) for location_hash in data['hash']))
+
+
+def reply_done(path, data):  # IGNORE:unused-argument
+    """
+    Reply like resolve_exception view of older versions does.
+    """
+    return 'Done'
+
+
+def deny_access(path, data):  # IGNORE:unused-argument
+    """
+    Reply like views do to requests with wrong secret key.
+    """
+    return 'Access denied'
+
+
+class ResolveTests(TransactionTestCase):
+    """
+    Resolving collected exceptions on servers they occurred on.
+    """
+
+    def setUp(self):
+        self.transport = HTTPTransport(timeout=5)
+
+    def tearDown(self):
+        self.transport.close()
+
+    def collect(self, server, hashes):
+        """
+        Save exceptions with hashes collected from server.
+        """
+        for location_hash in hashes:
+            CollectedExceptionSource.objects.create(
+                exception=CollectedProjectException.objects.create(
+                    hash=location_hash, title='Error %s' % location_hash,
+                    path='/items/', count=1, servers=server, server_count=1
+                ),
+                server=server,
+                count=1
+            )
+
+    def resolve(self, hashes):
+        """
+        Resolve collected exceptions with hashes.
+        """
+        with patched(functions, TRANSPORT=self.transport):
+            return functions.resolve_exceptions_from_servers(
+                list(CollectedProjectException.objects.filter(
+                    hash__in=hashes
+                ))
+            )
+
+    def test_one_request_per_server(self):
+        with StubServer(reply_counts) as server:
+            self.collect(server.url, ['a', 'b', 'c'])
+            resolved_servers, failed_servers = self.resolve(['a', 'b', 'c'])
+
+            self.collect(server.url, ['d'])
+            self.resolve(['d'])
+
+        self.assertEqual(failed_servers, {})
+        self.assertEqual(
+            resolved_servers, {server.url: {'a': 1, 'b': 1, 'c': 1}}
+        )
+        self.assertFalse(CollectedProjectException.objects.exists())
+        self.assertEqual(
+            [(path, data['hash']) for _, path, data in server.requests],
+            [
+                ('/error_monitor/resolve_exception/', ['a', 'b', 'c']),
+                ('/error_monitor/resolve_exception/', ['d']),
+            ]
+        )
+        # Second request is sent over pooled connection of the first one.
+        self.assertEqual(server.requests[0][0], server.requests[1][0])
+
+    def test_older_servers_get_hashes_one_by_one(self):
+        with StubServer(reply_done) as server:
+            self.collect(server.url, ['a', 'b', 'c'])
+            resolved_servers, failed_servers = self.resolve(['a', 'b', 'c'])
+
+        self.assertEqual(failed_servers, {})
+        self.assertEqual(resolved_servers, {server.url: {}})
+        self.assertFalse(CollectedProjectException.objects.exists())
+        self.assertEqual(
+            [data['hash'] for _, _, data in server.requests],
+            [['a', 'b', 'c'], ['a'], ['b']]
+        )
+
+    def test_denied_resolve_fails(self):
+        with StubServer(deny_access) as server:
+            self.collect(server.url, ['a', 'b'])
+            resolved_servers, failed_servers = self.resolve(['a', 'b'])
+
+        self.assertEqual(resolved_servers, {})
+        self.assertEqual(failed_servers.keys(), [server.url])
+        self.assertIsInstance(failed_servers[server.url], functions.ResolveError)
+        self.assertIn('Access denied', str(failed_servers[server.url]))
+        self.assertEqual(CollectedProjectException.objects.count(), 2)
+        self.assertEqual(CollectedExceptionSource.objects.count(), 2)
+
+
+class ResolveViewTests(TransactionTestCase):
+    """
+    Deleting exceptions resolved on collector.
+    """
+
+    def setUp(self):
+        for location_hash, title, path in (
+            ('a', 'Error', '/items/'),
+            ('a', 'Other error', '/items/'),
+            ('b', None, '/items/'),
+            ('b', 'Error', '/other/'),
+            ('c', 'Error', '/items/'),
+        ):
+            ProjectException.objects.create(
+                hash=location_hash, title=title, path=path, count=1
+            )
+
+    def resolve(self, **data):
+        """
+        Post data to resolve_exception view and return its reply.
+        """
+        response = self.client.post(
+            reverse('resolve_exception'), dict(data, secret_key='tests')
+        )
+        return loads(response.content)
+
+    def get_left(self):
+        """
+        Return hashes, titles and paths of exceptions left.
+        """
+        return sorted(
+            ProjectException.objects.values_list('hash', 'title', 'path')
+        )
+
+    def test_posted_hashes_are_deleted(self):
+        self.assertEqual(
+            self.resolve(hash=['a', 'b'], hashes='c d'),
+            {'a': 2, 'b': 2, 'c': 1, 'd': 0}
+        )
+        self.assertEqual(self.get_left(), [])
+
+    def test_path_and_title_narrow_deleted_exceptions(self):
+        self.assertEqual(self.resolve(hash='a', title='Error'), {'a': 1})
+        self.assertEqual(self.resolve(hashes='b c', path='/other/'),
+                         {'b': 1, 'c': 0})
+        self.assertEqual(
+            self.get_left(),
+            [
+                ('a', 'Other error', '/items/'),
+                ('b', None, '/items/'),
+                ('c', 'Error', '/items/'),
+            ]
+        )
+
+    def test_empty_title_matches_exceptions_without_title(self):
+        self.assertEqual(self.resolve(hash='b', title=''), {'b': 1})
+        self.assertEqual(
+            self.get_left(),
+            [
+                ('a', 'Error', '/items/'),
+                ('a', 'Other error', '/items/'),
+                ('b', 'Error', '/other/'),
+                ('c', 'Error', '/items/'),
+            ]
+        )
+
+    def test_denied_resolve_deletes_nothing(self):
+        response = self.client.post(
+            reverse('resolve_exception'), {'secret_key': 'wrong', 'hash': 'a'}
+        )
+        self.assertEqual(response.content, 'Access denied')
+        self.assertEqual(ProjectException.objects.count(), 5)
@@ -0,0 +1,17 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Django imports
+from django.conf.urls import patterns, include, url
+from django.contrib import admin
+
+
+admin.autodiscover()
+
+urlpatterns = patterns(  # IGNORE:invalid-name
+    '',
+    url(r'^admin/', include(admin.site.urls)),
+    url(r'^error_monitor/', include('error_monitor.urls')),
+)
@@ -0,0 +1,105 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from contextlib import contextmanager
+from os import devnull
+from threading import Thread
+from urlparse import parse_qs
+import sys
+
+
+@contextmanager
+def patched(target, **values):
+    """
+    Replace attributes of target with values within block.
+    """
+    old_values = dict((name, getattr(target, name)) for name in values)
+    for name, value in values.items():
+        setattr(target, name, value)
+    try:
+        yield
+    finally:
+        for name, value in old_values.items():
+            setattr(target, name, value)
+
+
+@contextmanager
+def silenced():
+    """
+    Discard what is printed to stdout and stderr within block.
+    """
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = open(devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+
+def capture_error(title, error_class=ValueError):
+    """
+    Raise error with title a couple of frames deep and return exc_info().
+    """
+    def load(items):
+        return process(items)
+
+    def process(items):
+        raise error_class(title)
+
+    try:
+        load(range(10))
+    except error_class:
+        return sys.exc_info()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Handler of keep-alive requests to StubServer.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):  # IGNORE:invalid-name
+        data = parse_qs(
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        )
+        self.server.requests.append((self.client_address[1], self.path, data))
+        body = self.server.reply(self.path, data)
+        self.send_response(200)
+        self.send_header('Content-Type', self.server.content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # IGNORE:arguments-differ
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """
+    Local HTTP server answering posted form data with reply(path, data)
+    of content_type while it is used as context manager. Requests are
+    recorded as (client port, path, data).
+    """
+    daemon_threads = True
+
+    def __init__(self, reply, content_type='text/plain'):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.reply = reply
+        self.content_type = content_type
+        self.requests = []
+        self.url = 'http://127.0.0.1:%d' % self.server_port
+
+    def __enter__(self):
+        thread = Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,248 @@
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+"""
+
+# Standard imports
+from httplib import HTTPConnection, HTTPSConnection, HTTPException
+from urlparse import urlsplit
+from urllib import urlencode
+from socket import error as socket_error
+from threading import Lock
+from time import time
+from zlib import compressobj, DEFLATED, MAX_WBITS
+
+# Third-party app imports
+try:
+    import msgpack
+except ImportError:
+    msgpack = None  # IGNORE:invalid-name
+
+
+MSGPACK_CONTENT_TYPE = 'application/x-msgpack'
+FORM_CONTENT_TYPE = 'application/x-www-form-urlencoded'
+
+
+def gzip_compress(data):
+    """
+    Compress data to gzip format.
+    """
+    compressor = compressobj(6, DEFLATED, 16 + MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def pack_payload(data):
+    """
+    Pack dictionary with msgpack.
+    """
+    return msgpack.packb(data)
+
+
+def unpack_payload(data):
+    """
+    Unpack msgpack data decoding strings to unicode.
+    """
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except TypeError:
+        # Versions before 0.5.2 have no raw argument.
+        return msgpack.unpackb(data, encoding='utf-8')
+
+
+def make_unpacker():
+    """
+    Return msgpack stream unpacker decoding strings to unicode.
+    """
+    try:
+        return msgpack.Unpacker(raw=False)
+    except TypeError:
+        return msgpack.Unpacker(encoding='utf-8')
+
+
+class TransportError(HTTPException):
+    """
+    Error status returned by server.
+    """
+
+    def __init__(self, url, status, reason):
+        HTTPException.__init__(self, url, status, reason)
+        self.url = url
+        self.status = status
+        self.reason = reason
+
+    def __str__(self):
+        return 'HTTP %d %s: %s' % (self.status, self.reason, self.url)
+
+
+class PooledResponse(object):
+    """
+    Response which connection is returned to pool once it is read.
+    """
+
+    def __init__(self, transport, key, connection, response):
+        self.transport = transport
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.status = response.status
+        self.reason = response.reason
+
+    def info(self):
+        """
+        Return response headers.
+        """
+        return self.response.msg
+
+    def read(self, size=None):
+        """
+        Read at most size bytes of response body or all of it.
+        """
+        if self.connection is None:
+            return ''
+
+        data = self.response.read() if size is None else \
+            self.response.read(size)
+        self.transport.count(self.key, bytes_received=len(data))
+        if not data or self.response.isclosed():
+            self.transport.release(self.key, self.connection)
+            self.connection = None
+        return data
+
+    def close(self):
+        """
+        Close connection unless response was read completely.
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class HTTPTransport(object):
+    """
+    HTTP client keeping up to pool_size idle keep-alive connections
+    per host and counting requests, errors, bytes and time per host.
+    Request bodies are encoded as form or msgpack payload and
+    gzipped if compress is set.
+    """
+
+    def __init__(self, timeout=20, pool_size=2, payload_format='form',
+                 compress=False):
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.payload_format = payload_format
+        self.compress = compress
+        self.pools = {}
+        self.counters = {}
+        self._lock = Lock()
+
+    def count(self, key, **values):
+        """
+        Add values to counters of host.
+        """
+        with self._lock:
+            counters = self.counters.setdefault(
+                '%s://%s' % key,
+                dict(
+                    requests=0, errors=0, bytes_sent=0, bytes_received=0,
+                    seconds=0.0
+                )
+            )
+            for name, value in values.items():
+                counters[name] += value
+
+    def get_stats(self):
+        """
+        Return copy of counters of every host.
+        """
+        with self._lock:
+            return dict(
+                (host, dict(counters))
+                for host, counters in self.counters.items()
+            )
+
+    def _acquire(self, key):
+        """
+        Return idle connection to host and whether it was used before.
+        """
+        with self._lock:
+            idle_connections = self.pools.get(key)
+            if idle_connections:
+                return idle_connections.pop(), True
+
+        scheme, netloc = key
+        connection_class = HTTPSConnection if scheme == 'https' else \
+            HTTPConnection
+        return connection_class(netloc, timeout=self.timeout), False
+
+    def release(self, key, connection):
+        """
+        Return connection to pool or close it if pool is full.
+        """
+        with self._lock:
+            idle_connections = self.pools.setdefault(key, [])
+            if len(idle_connections) < self.pool_size:
+                idle_connections.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+        with self._lock:
+            pools, self.pools = self.pools, {}
+        for idle_connections in pools.values():
+            for connection in idle_connections:
+                connection.close()
+
+    def encode(self, data):
+        """
+        Return body and headers of request with data.
+        """
+        if self.payload_format == 'msgpack' and msgpack is not None:
+            body = pack_payload(data)
+            headers = {'Content-Type': MSGPACK_CONTENT_TYPE}
+        else:
+            body = urlencode(data, doseq=True)
+            headers = {'Content-Type': FORM_CONTENT_TYPE}
+
+        if self.compress:
+            body = gzip_compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        return body, headers
+
+    def post(self, url, data, headers=None):
+        """
+        Post data to url and return response. Reused connection
+        closed by server meanwhile is replaced with new one once.
+        Error statuses are raised as TransportError.
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        body, request_headers = self.encode(data)
+        request_headers.update(headers or {})
+
+        while True:
+            connection, reused = self._acquire(key)
+            started = time()
+            try:
+                connection.request('POST', path, body, request_headers)
+                response = connection.getresponse()
+            except (HTTPException, socket_error):
+                connection.close()
+                if reused:
+                    continue
+                self.count(key, errors=1)
+                raise
+            break
+
+        self.count(
+            key, requests=1, bytes_sent=len(body), seconds=time() - started
+        )
+        pooled_response = PooledResponse(self, key, connection, response)
+        if response.status >= 400:
+            pooled_response.read()
+            self.count(key, errors=1)
+            raise TransportError(url, response.status, response.reason)
+        return pooled_response
@@ -5,7 +5,7 @@ License: BSD
 
 # Project imports
 from .views import view_handled_exception, collect_exceptions, \
-    get_exception_details, resolve_exception
+    get_exception_details, resolve_exception, view_metrics
 
 # Django imports
 from django.conf.urls import patterns, url
@@ -32,5 +32,10 @@ urlpatterns = patterns(  # IGNORE:invalid-name
         r'^resolve_exception/$',
         resolve_exception,
         name='resolve_exception'
+    ),
+    url(
+        r'^metrics/$',
+        view_metrics,
+        name='view_metrics'
     )
 )
@@ -4,7 +4,12 @@ License: BSD
 """
 
 # Project imports
-from .models import ProjectException
+from .models import ProjectException, unpack_contents
+from .snapshots import is_snapshot, dump_snapshot, load_snapshot
+from .capture import LocalsCapture
+from .transport import MSGPACK_CONTENT_TYPE, msgpack, pack_payload, \
+    unpack_payload
+from .instrumentation import METRICS, RegistrySink
 
 # Django imports
 from django.shortcuts import render_to_response
@@ -12,15 +17,58 @@ from django.template import RequestContext, Context, loader
 from django.contrib.admin.views.decorators import staff_member_required
 from django.views.debug import ExceptionReporter
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, QueryDict
 from django.views.decorators.csrf import csrf_exempt
+from django.db import connections, transaction
 
 # Standard imports
 from json import dumps
+from datetime import datetime
+from functools import wraps
+from zlib import compressobj, decompress, DEFLATED, MAX_WBITS
+# First datetime.strptime call imports it lazily, which is not thread-safe.
+import _strptime  # IGNORE:unused-import
+
+# Third-party app imports
+from pytz import utc
 
 
 SIMPLIFIED_TEMPLATE = loader.get_template('simplified_exception.html')
 VARIABLE_LENGTH = getattr(settings, 'ERROR_MONITOR_EXCEPTION_VARIABLE_LENGTH', 2000)
+SYNC_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+PAGE_SIZE = getattr(settings, 'ERROR_MONITOR_COLLECT_PAGE_SIZE', 1000)
+DATABASE = getattr(settings, 'ERROR_MONITOR_DATABASE', 'default')
+CAPTURE = LocalsCapture(
+    variable_length=VARIABLE_LENGTH,
+    frame_budget=getattr(settings, 'ERROR_MONITOR_CAPTURE_FRAME_BUDGET', 20000),
+    event_budget=getattr(
+        settings, 'ERROR_MONITOR_CAPTURE_EVENT_BUDGET', 100000
+    ),
+    in_app_only=getattr(settings, 'ERROR_MONITOR_CAPTURE_IN_APP_ONLY', False),
+    app_modules=getattr(
+        settings,
+        'ERROR_MONITOR_FINGERPRINT_APPS',
+        [app for app in settings.INSTALLED_APPS if not app.startswith('django.')]
+    ),
+    max_items=getattr(settings, 'ERROR_MONITOR_CAPTURE_MAX_ITEMS', 10),
+    max_depth=getattr(settings, 'ERROR_MONITOR_CAPTURE_MAX_DEPTH', 3)
+)
+
+
+def format_sync_date(date):
+    """
+    Format date for exchange between collector and servers.
+    """
+    if date.tzinfo is not None:
+        date = date.astimezone(utc)
+    return date.strftime(SYNC_DATE_FORMAT)
+
+
+def parse_sync_date(value):
+    """
+    Parse date formatted by format_sync_date.
+    """
+    return datetime.strptime(value, SYNC_DATE_FORMAT).replace(tzinfo=utc)
 
 
 @staff_member_required
@@ -32,18 +80,134 @@ def view_handled_exception(request, exception_id):
     return render_to_response(
         'view_handled_exception.html',
         {
-            "content": ProjectException.objects.filter(
-                id=exception_id
-            ).values_list('contents', flat=True)[0]
+            "contents": render_exception_contents(
+                ProjectException.objects.using(DATABASE).select_related(
+                    'body'
+                ).filter(
+                    id=exception_id
+                )[0].get_contents()
+            )
         },
         context_instance=RequestContext(request)
     )
 
 
+def decode_post_data(view):
+    """
+    Decorate view to accept gzipped and msgpack request bodies
+    sent by collector transport as regular POST data.
+    """
+    @wraps(view)
+    def decoding_view(request, *args, **kwargs):
+        encoding = request.META.get('HTTP_CONTENT_ENCODING')
+        msgpack_body = request.META.get('CONTENT_TYPE', '').startswith(
+            MSGPACK_CONTENT_TYPE
+        )
+        if request.method == 'POST' and (encoding == 'gzip' or msgpack_body):
+            body = request.body
+            if encoding == 'gzip':
+                body = decompress(body, 16 + MAX_WBITS)
+
+            if msgpack_body:
+                if msgpack is None:
+                    return HttpResponse('msgpack is not installed', status=415)
+                post_data = QueryDict('', mutable=True)
+                for key, value in unpack_payload(body).items():
+                    values = value if isinstance(value, (list, tuple)) \
+                        else [value]
+                    post_data.setlist(key, [
+                        value if isinstance(value, basestring)
+                        else unicode(value)
+                        for value in values
+                    ])
+            else:
+                post_data = QueryDict(body)
+            request.POST = post_data
+
+        return view(request, *args, **kwargs)
+
+    return decoding_view
+
+
+def encode_json_line(record):
+    """
+    Encode record as JSON line.
+    """
+    return dumps(record) + '\n'
+
+
+def stream_rows(keys, rows, encode=encode_json_line):
+    """
+    Yield keys and then every row as separately encoded records,
+    JSON lines by default.
+    """
+    yield encode(keys)
+    for row in rows:
+        yield encode(row)
+
+
+def gzip_stream(chunks):
+    """
+    Compress stream of chunks with gzip.
+    """
+    compressor = compressobj(6, DEFLATED, 16 + MAX_WBITS)
+    for chunk in chunks:
+        compressed_chunk = compressor.compress(chunk)
+        if compressed_chunk:
+            yield compressed_chunk
+    yield compressor.flush()
+
+
+def rows_response(request, keys, query_set, fields=None, convert=None):
+    """
+    Send fields of query_set rows, converted with convert function to keys,
+    as one JSON list or, if "ndjson" or "msgpack" format is requested,
+    as page of at most "limit" rows with id greater than "after" streamed
+    as JSON lines or msgpack records. Stream is gzipped if client accepts it.
+    """
+    fields = fields or keys
+    response_format = request.POST.get('format')
+    if response_format not in ('ndjson', 'msgpack') or (
+        response_format == 'msgpack' and msgpack is None
+    ):
+        rows = query_set.values_list(*fields)
+        if convert is not None:
+            rows = [convert(row) for row in rows]
+        return HttpResponse(
+            content=dumps([keys] + list(rows)), mimetype='application/json'
+        )
+
+    query_set = query_set.order_by('id')
+    if request.POST.get('after'):
+        query_set = query_set.filter(id__gt=int(request.POST['after']))
+    limit = int(request.POST.get('limit') or PAGE_SIZE)
+
+    rows = query_set.values_list('id', *fields)[:limit].iterator()
+    if convert is not None:
+        rows = ((row[0],) + tuple(convert(row[1:])) for row in rows)
+
+    if response_format == 'msgpack':
+        content = stream_rows(['id'] + keys, rows, pack_payload)
+        mimetype = MSGPACK_CONTENT_TYPE
+    else:
+        content = stream_rows(['id'] + keys, rows)
+        mimetype = 'application/x-ndjson'
+    gzipped = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if gzipped:
+        content = gzip_stream(content)
+
+    response = HttpResponse(content, mimetype=mimetype)
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+    return response
+
+
 @csrf_exempt
+@decode_post_data
 def collect_exceptions(request):
     """
     Collect and send exceptions collected via error_monitor package.
+    If "since" date is posted only exceptions modified after it are sent.
     """
     if (
         'secret_key' not in request.POST
@@ -52,13 +216,26 @@ def collect_exceptions(request):
     ):
         return HttpResponse('Access denied')
 
-    keys = ['path', 'title', 'count', 'hash']
+    keys = ['path', 'title', 'count', 'hash', 'date', 'modified']
 
-    all_exceptions = ProjectException.objects.all().values_list(*keys)
-    return HttpResponse(content=dumps([keys] + list(all_exceptions)), mimetype='application/json')
+    all_exceptions = ProjectException.objects.using(DATABASE)
+    if request.POST.get('since'):
+        all_exceptions = all_exceptions.filter(
+            modified__gt=parse_sync_date(request.POST['since'])
+        )
+
+    return rows_response(
+        request,
+        keys,
+        all_exceptions,
+        convert=lambda exception: exception[:-2] + tuple(
+            format_sync_date(date) for date in exception[-2:]
+        )
+    )
 
 
 @csrf_exempt
+@decode_post_data
 def get_exception_details(request):
     """
     Send exception details based on received exception hashes.
@@ -72,18 +249,31 @@ def get_exception_details(request):
 
     keys = ['hash', 'contents']
 
-    exception_details = ProjectException.objects.filter(
+    exception_details = ProjectException.objects.using(DATABASE).filter(
         hash__in=request.POST['hashes'].split(' ')
-    ).values_list(*keys)
-    return HttpResponse(
-        content=dumps([keys] + list(exception_details)), mimetype='application/json'
+    )
+    return rows_response(
+        request,
+        keys,
+        exception_details,
+        fields=['hash', 'contents', 'body__data'],
+        convert=lambda (location_hash, contents, body_data): (
+            location_hash,
+            unpack_contents(body_data) if body_data is not None else contents
+        )
     )
 
 
 @csrf_exempt
+@decode_post_data
 def resolve_exception(request):
     """
     Delete exception occurences from error_monitor to check whether it will appear again.
+    Hashes are posted as "hash" values or space separated "hashes",
+    optional "path" and "title" narrow deleted exceptions. Empty title
+    matches exceptions saved without title too, as signatures do.
+    All of them are deleted with one query and number of deleted
+    exceptions of each hash is sent back.
     """
     if (
         'secret_key' not in request.POST
@@ -92,15 +282,72 @@ def resolve_exception(request):
     ):
         return HttpResponse('Access denied')
 
-    ProjectException.objects.filter(hash=request.POST['hash']).delete()
-    return HttpResponse('Done')
+    hashes = set(request.POST.getlist('hash'))
+    hashes.update(request.POST.get('hashes', '').split())
+    deleted_counts = dict((location_hash, 0) for location_hash in hashes)
+
+    if hashes:
+        conditions = ['hash IN (%s)' % ', '.join(['%s'] * len(hashes))]
+        parameters = list(hashes)
+        for field in ('path', 'title'):
+            if field in request.POST:
+                if field == 'title' and not request.POST[field]:
+                    conditions.append("(title = '' OR title IS NULL)")
+                    continue
+                conditions.append('%s = %%s' % field)
+                parameters.append(request.POST[field])
+
+        connection = connections[DATABASE]
+        cursor = connection.cursor()
+        cursor.execute(
+            'DELETE FROM %s WHERE %s RETURNING hash' % (
+                connection.ops.quote_name(ProjectException._meta.db_table),
+                ' AND '.join(conditions)
+            ),
+            parameters
+        )
+        for (location_hash,) in cursor.fetchall():
+            deleted_counts[location_hash] += 1
+        transaction.commit_unless_managed(using=DATABASE)
+
+    return HttpResponse(
+        content=dumps(deleted_counts), mimetype='application/json'
+    )
+
+
+@staff_member_required
+def view_metrics(request):
+    """
+    Return counters and timings registered by
+    ERROR_MONITOR_METRICS = 'registry' sink as JSON.
+    """
+    if not isinstance(METRICS.sink, RegistrySink):
+        return HttpResponse(
+            'ERROR_MONITOR_METRICS is not registry', status=404
+        )
+
+    if request.method == 'POST' and request.POST.get('reset'):
+        METRICS.sink.reset()
+
+    return HttpResponse(
+        content=dumps(METRICS.sink.snapshot(), indent=2, sort_keys=True),
+        mimetype='application/json'
+    )
 
 
 class CustomExceptionReporter(ExceptionReporter):
     """
     Customized ExceptionReporter class to use SIMPLIFIED_500_TEMPLATE.
+    Local variables are captured within size budgets.
     """
 
+    def get_traceback_frames(self):
+        """Return frames with bounded representations of variables."""
+
+        frames = super(CustomExceptionReporter, self).get_traceback_frames()
+        with METRICS.timer('record.capture'):
+            return CAPTURE.capture(frames)
+
     def get_traceback_html(self):
         """Return HTML version of debug 500 HTTP error page."""
 
@@ -109,3 +356,20 @@ class CustomExceptionReporter(ExceptionReporter):
                 dict({"VAR_LENGTH": VARIABLE_LENGTH}, **self.get_traceback_data())
             )
         )
+
+    def get_traceback_snapshot(self):
+        """Return compressed snapshot that is rendered to HTML on view."""
+
+        return dump_snapshot(self.get_traceback_data(), VARIABLE_LENGTH)
+
+
+def render_exception_contents(contents):
+    """
+    Return HTML of stored exception contents, rendering snapshots on demand.
+    """
+    if not is_snapshot(contents):
+        return contents
+
+    return SIMPLIFIED_TEMPLATE.render(
+        Context(dict({"VAR_LENGTH": VARIABLE_LENGTH}, **load_snapshot(contents)))
+    )
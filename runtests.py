@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Copyright: Vadim Yusanenko, Konstantin Volkov, Denis Motsak
+License: BSD
+
+Run tests of error_monitor against SQLite test database:
+
+    python runtests.py [error_monitor.TestCase[.test_method] ...]
+"""
+
+# Standard imports
+from os.path import abspath, dirname, join
+from tempfile import gettempdir
+import sys
+
+sys.path.insert(0, dirname(abspath(__file__)))
+
+# Django imports
+from django.conf import settings
+
+
+DATABASE_PATH = join(gettempdir(), 'error_monitor_tests.sqlite3')
+
+# Test database is kept in file, as connections are reset by error_monitor
+# and threads of tests need their own connections to it.
+settings.configure(
+    DEBUG=False,
+    DATABASES={
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': DATABASE_PATH,
+            'TEST_NAME': DATABASE_PATH,
+            'OPTIONS': {'timeout': 30},
+        }
+    },
+    INSTALLED_APPS=(
+        'django.contrib.auth',
+        'django.contrib.contenttypes',
+        'django.contrib.sessions',
+        'django.contrib.messages',
+        'django.contrib.admin',
+        'error_monitor',
+    ),
+    ROOT_URLCONF='error_monitor.tests.urls',
+    SECRET_KEY='error-monitor-tests',
+    USE_TZ=True,
+    TIME_ZONE='UTC',
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_HOST_USER='error-monitor@example.com',
+    SERVER_PROTOCOL='http',
+    CURRENT_SERVER_DOMAIN='localhost',
+    ERROR_MONITOR_SECRET_KEY='tests',
+    ERROR_MONITOR_EXCEPTION_TITLE_WORDS_TO_NOTIFY=('Critical',),
+    ERROR_MONITOR_EXCEPTION_RECIPIENTS=('developers@example.com',),
+    ERROR_MONITOR_EXCEPTION_SERVERS_LIST=[],
+    ERROR_MONITOR_COLLECT_RETRIES=0,
+)
+
+
+def main():
+    """
+    Run tests and exit with non-zero status if some of them failed.
+    """
+    from django.test.utils import get_runner
+
+    runner = get_runner(settings)(verbosity=1, interactive=False)
+    failures = runner.run_tests(sys.argv[1:] or ['error_monitor'])
+    sys.exit(bool(failures))
+
+
+if __name__ == '__main__':
+    main()